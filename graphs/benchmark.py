@@ -0,0 +1,303 @@
+"""
+Banco de pruebas por etapas sobre datos sintéticos a escala de producción.
+
+  python graphs/benchmark.py --rows 1e4 1e5 1e6 [--repeat 3] [--stages read merge ...]
+  python graphs/benchmark.py --compare
+
+Para cada tamaño genera (o reutiliza) un par env/micro sintético
+(utils/synthetic.py) y mide por separado cada etapa del pipeline, en el orden
+en que las encadenan las figuras: lectura de CSV, unión, preparación de los
+Gráficos 1 y 2, cuantiles por intervalo, Spearman, KDE, PCA, construcción de
+una figura y savefig. De cada etapa se guarda el mejor tiempo de pared y de
+CPU de ``--repeat`` ejecuciones y, en una ejecución aparte con tracemalloc, el
+pico de memoria asignada y el máximo de memoria residente del proceso.
+
+Los resultados se añaden (una línea JSON por tamaño y etapa, con el commit y
+las versiones de las librerías) a outputs/benchmarks.jsonl; al terminar se
+comparan con la ejecución anterior del mismo tamaño y se marcan las etapas
+que empeoraron más allá de ``--threshold``.
+"""
+import argparse
+from pathlib import Path
+from typing import Optional
+import io
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource  # solo en sistemas POSIX
+except ImportError:
+    resource = None
+
+# Aseguramos acceso al directorio raíz del proyecto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.synthetic import ensure, rows_tag  # noqa: E402
+
+logger = logging.getLogger("benchmark")
+
+RESULTS = PROJECT_ROOT / "outputs/benchmarks.jsonl"
+
+
+# Etapas: nombre -> función que recibe el estado (resultados de las etapas
+# anteriores) y devuelve su propio resultado. Las importaciones van dentro para
+# que cada etapa pague solo lo suyo la primera vez.
+
+def _read(st):
+    from utils.load_data import _read_csv_smart
+    return _read_csv_smart(st["paths"]["env"]), _read_csv_smart(st["paths"]["micro"])
+
+
+def _merge(st):
+    from utils.load_data import join_env_micro
+    return join_env_micro(*st["read"])
+
+
+def _prep_graph1(st):
+    from utils.load_data import prep_graph1
+    return prep_graph1(st["merge"], min_n=5)
+
+
+def _preparar_long(st):
+    from graphs.grafico_facetgrid import preparar_long
+    return preparar_long(st["merge"])
+
+
+def _resumen_bins(st):
+    from graphs.grafico_facetgrid import resumen_por_cobertura
+    return resumen_por_cobertura(st["preparar_long"], n_bins=20)
+
+
+def _spearman(st):
+    from utils import correlation
+    from graphs.grafico_heatmap import correlaciones
+    correlation._MEMO.clear()
+    return correlaciones(st["merge"])
+
+
+def _kde(st):
+    from utils.kde import kde_grid
+    from graphs.grafico_joint_density_combined import preparar_long
+    long = preparar_long(st["merge"])
+    d = long[long["type"] == "Bacterial"]
+    # Mismos ejes que el Gráfico 5: x = respiración, y = log10 del crecimiento
+    return kde_grid(d["respiration_rate"], d["growth_log10"], cache=False)
+
+
+def _pca(st):
+    from utils import correlation
+    from graphs.grafico_pca_biplot import calcular_pca
+    correlation._MEMO.clear()
+    return calcular_pca(st["merge"])
+
+
+def _figure(st):
+    import matplotlib.pyplot as plt
+    from utils import kde
+    from graphs.grafico_joint_density_combined import build
+    plt.close("all")
+    kde._GRID_MEMO.clear()
+    fig, _ = build(df=st["merge"], max_points=st["max_points"])
+    return fig
+
+
+def _savefig(st):
+    buf = io.BytesIO()
+    st["figure"].savefig(buf, format="png", dpi=300)
+    return buf.getbuffer().nbytes
+
+
+STAGES = {
+    "read": _read,
+    "merge": _merge,
+    "prep_graph1": _prep_graph1,
+    "preparar_long": _preparar_long,
+    "resumen_bins": _resumen_bins,
+    "spearman": _spearman,
+    "kde": _kde,
+    "pca": _pca,
+    "figure": _figure,
+    "savefig": _savefig,
+}
+# De qué etapas depende cada una (se ejecutan aunque no se pidan, sin medirlas)
+DEPENDS = {
+    "read": [], "merge": ["read"], "prep_graph1": ["merge"], "preparar_long": ["merge"],
+    "resumen_bins": ["preparar_long"], "spearman": ["merge"], "kde": ["merge"], "pca": ["merge"],
+    "figure": ["merge"], "savefig": ["figure"],
+}
+
+
+def _rss_mb() -> Optional[float]:
+    """Máximo de memoria residente del proceso hasta ahora (MB); None sin el módulo resource (Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {"commit": commit, "dirty": dirty}
+
+
+def measure(fn, st, repeat: int = 3, memory: bool = True):
+    """
+    Ejecuta ``fn(st)`` ``repeat`` veces y devuelve (resultado, métricas): mejor
+    tiempo de pared y de CPU y, si ``memory``, una ejecución más con
+    tracemalloc (pico asignado durante la etapa) y el máximo de RSS del
+    proceso tras ella (solo en POSIX).
+    """
+    wall, cpu, out = [], [], None
+    for _ in range(max(1, repeat)):
+        out = None
+        c0, t0 = time.process_time(), time.perf_counter()
+        out = fn(st)
+        wall.append(time.perf_counter() - t0)
+        cpu.append(time.process_time() - c0)
+    stats = {"wall_s": min(wall), "cpu_s": min(cpu), "repeat": len(wall)}
+    if memory:
+        out = None
+        tracemalloc.start()
+        try:
+            out = fn(st)
+            stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+        stats["rss_mb"] = _rss_mb()
+    return out, stats
+
+
+def run(n_rows: int, stages=None, repeat: int = 3, memory: bool = True, seed: int = 0,
+        max_points: int = 50_000) -> list:
+    """Mide las etapas pedidas (todas por defecto) con ``n_rows`` filas; devuelve los registros."""
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+
+    stages = list(stages or STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Etapas desconocidas: {sorted(unknown)}")
+
+    t0 = time.perf_counter()
+    paths = ensure(n_rows, seed=seed)
+    logger.info("%s filas: datos listos en %.1f s (%s)", rows_tag(n_rows), time.perf_counter() - t0,
+                paths["micro"].parent)
+
+    meta = {
+        "run": time.strftime("%Y-%m-%dT%H:%M:%S"), **_git_commit(), "rows": int(n_rows),
+        "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+        "host": platform.node(),
+    }
+    st = {"paths": paths, "max_points": max_points}
+    records = []
+
+    def ensure_stage(name):
+        if name in st:
+            return
+        for dep in DEPENDS[name]:
+            ensure_stage(dep)
+        if name in stages:
+            st[name], stats = measure(STAGES[name], st, repeat=repeat, memory=memory)
+            records.append({**meta, "stage": name, **stats})
+            logger.info("  %-14s %8.3f s  cpu %8.3f s%s", name, stats["wall_s"], stats["cpu_s"],
+                        f"  pico {stats['peak_mb']:.0f} MB" if memory else "")
+        else:
+            st[name] = STAGES[name](st)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        for name in stages:
+            ensure_stage(name)
+    return records
+
+
+def save_records(records: list, path: Path = RESULTS) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as fh:
+        for rec in records:
+            fh.write(json.dumps(rec) + "\n")
+
+
+def load_records(path: Path = RESULTS) -> pd.DataFrame:
+    if not path.exists():
+        return pd.DataFrame()
+    with open(path, encoding="utf-8") as fh:
+        return pd.DataFrame([json.loads(line) for line in fh if line.strip()])
+
+
+def compare(df: pd.DataFrame, threshold: float = 1.25, min_delta: float = 0.01) -> pd.DataFrame:
+    """
+    Para cada tamaño y etapa, la última ejecución frente a la anterior: tiempos,
+    cociente y si empeoró más de ``threshold`` veces ("regresion"); las etapas
+    que tardan menos de ``min_delta`` segundos más no cuentan (ruido del reloj).
+    """
+    if df.empty:
+        return df
+    rows = []
+    for (n, stage), d in df.groupby(["rows", "stage"], sort=True):
+        d = d.sort_values("run")
+        if len(d) < 2:
+            continue
+        prev, last = d.iloc[-2], d.iloc[-1]
+        ratio = last["wall_s"] / prev["wall_s"] if prev["wall_s"] > 0 else np.nan
+        rows.append({
+            "rows": n, "stage": stage, "antes": prev.get("commit"), "ahora": last.get("commit"),
+            "wall_antes": prev["wall_s"], "wall_ahora": last["wall_s"], "ratio": ratio,
+            "pico_antes": prev.get("peak_mb"), "pico_ahora": last.get("peak_mb"),
+            "regresion": bool(ratio > threshold and last["wall_s"] - prev["wall_s"] > min_delta),
+        })
+    return pd.DataFrame(rows)
+
+
+def main(args):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.compare:
+        for n in args.rows:
+            records = run(int(n), stages=args.stages, repeat=args.repeat, memory=not args.no_memory,
+                          seed=args.seed, max_points=args.max_points)
+            save_records(records, args.results)
+    cmp = compare(load_records(args.results), threshold=args.threshold)
+    if cmp.empty:
+        logger.info("Sin ejecuciones anteriores con las que comparar (%s)", args.results)
+        return
+    with pd.option_context("display.width", 160, "display.max_rows", None):
+        logger.info("\n%s", cmp.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    worse = cmp[cmp["regresion"]]
+    if len(worse):
+        logger.warning("Regresiones (> %.2fx): %s", args.threshold,
+                       ", ".join(f"{s}@{rows_tag(int(n))}" for n, s in zip(worse["rows"], worse["stage"])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide cada etapa del pipeline con datos sintéticos")
+    parser.add_argument("--rows", type=float, nargs="+", default=[1e4, 1e5, 1e6],
+                        help="tamaños (filas microbianas), p.ej. 1e4 1e6 1e8")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=None,
+                        help="etapas a medir (por defecto todas)")
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones por etapa (se guarda la mejor)")
+    parser.add_argument("--no-memory", action="store_true", help="no medir memoria (evita la pasada con tracemalloc)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla de los datos sintéticos")
+    parser.add_argument("--max-points", type=int, default=50_000,
+                        help="puntos dibujados uno a uno en la figura medida (más: hexbin)")
+    parser.add_argument("--threshold", type=float, default=1.25, help="cociente de tiempo que cuenta como regresión")
+    parser.add_argument("--results", type=Path, default=RESULTS, help="archivo JSON lines de resultados")
+    parser.add_argument("--compare", action="store_true", help="solo comparar las dos últimas ejecuciones")
+    args = parser.parse_args()
+    main(args)
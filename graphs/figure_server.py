@@ -0,0 +1,320 @@
+"""
+Servidor local de figuras con los datos en memoria y caché de resultados.
+
+  python graphs/figure_server.py [--port 8765] [--jobs N] [--cache-mb 256] [--warm]
+
+  curl -o v.png "http://127.0.0.1:8765/figure/grafico1_violin?min_n=10&log=1"
+  curl -o h.svg "http://127.0.0.1:8765/figure/grafico3_heatmap_correlaciones_v2?missing=pairwise&fmt=svg"
+  curl "http://127.0.0.1:8765/figures"     # figuras y parámetros admitidos
+  curl "http://127.0.0.1:8765/stats"       # aciertos, fallos y bytes en caché
+
+- Escucha solo en localhost (ThreadingHTTPServer: un hilo por petición).
+- Las figuras se dibujan en un pool de procesos que abre la tabla unida una
+  vez (como render_all) y conserva sus memos (correlaciones, KDE, uniones):
+  cada proceso queda "caliente" para las peticiones siguientes.
+- Los PNG/SVG generados se guardan en una caché LRU acotada en bytes, con
+  clave = figura + parámetros + formato + hash de los CSV de entrada. Una
+  petición repetida se sirve desde memoria en milisegundos; peticiones
+  iguales simultáneas comparten un único render.
+- Si cambian los CSV, la clave cambia sola y el pool se reinicia para que los
+  procesos abran los datos nuevos.
+
+Los parámetros de cada figura son los de su función build (salvo los que
+reciben objetos, como ``df``) y se convierten al tipo de su valor por
+defecto; las listas van separadas por comas. ``fmt`` (png/svg) y ``dpi``
+eligen la salida.
+"""
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+import hashlib
+import importlib
+import io
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+# Aseguramos acceso al directorio raíz del proyecto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs import render_all  # noqa: E402
+from graphs.render_all import DATA_FILES, FIGURES, SEED, convert_param, figure_params  # noqa: E402
+from utils.spatial import parse_region  # noqa: E402
+
+logger = logging.getLogger("figure_server")
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+# Límites (mínimo, máximo) de los parámetros que escalan el coste de un render.
+# jobs: el pool ya usa un proceso por CPU; más procesos dentro de un render solo compiten
+_LIMITES = {
+    "jobs": (1, 1),
+    "n_boot": (0, 20_000),
+    "n_perm": (0, 20_000),
+    "n_bins": (1, 200),
+    "k": (8, 5_000),
+    "chunksize": (1_000, 10_000_000),
+    "max_points": (100, 5_000_000),
+    "min_n": (0, 100_000),
+    "alpha": (1e-6, 0.5),
+}
+
+
+# 1) Parámetros: los de build() (render_all.figure_params), con el tipo de su valor por defecto
+
+def parse_request(name: str, query: dict) -> tuple:
+    """
+    Valida la petición de una figura. Devuelve (parámetros de build, formato,
+    dpi): los parámetros combinan los de render_all (FIGURES) con los de la URL,
+    recortados a los límites de _LIMITES.
+    """
+    if name not in FIGURES:
+        raise KeyError(f"Figura desconocida: {name!r}")
+    query = dict(query)
+    fmt = query.pop("fmt", "png").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt!r} (png o svg)")
+    dpi = int(query.pop("dpi", 300))
+    if not 10 <= dpi <= 600:
+        raise ValueError("dpi fuera de rango (10-600)")
+
+    defaults = figure_params(name)
+    unknown = set(query) - set(defaults)
+    if unknown:
+        raise ValueError(f"Parámetros desconocidos para {name}: {sorted(unknown)}")
+    params = dict(FIGURES[name][1])
+    for key, raw in query.items():
+        value = convert_param(raw, defaults[key])
+        if key in _LIMITES and isinstance(value, (int, float)) and not isinstance(value, bool):
+            lo, hi = _LIMITES[key]
+            value = type(value)(min(max(value, lo), hi))
+        params[key] = value
+    if params.get("region"):
+        parse_region(params["region"])  # sintaxis de la región: error del cliente, no del render
+    return params, fmt, dpi
+
+
+# 2) Render en los procesos del pool
+
+def render_bytes(name: str, params: dict, fmt: str = "png", dpi: int = 300) -> tuple:
+    """Dibuja una figura con la tabla unida del proceso; devuelve (bytes, segundos)."""
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from utils.trace import stage
+
+    module, _ = FIGURES[name]
+    build = importlib.import_module(f"graphs.{module}").build
+    t0 = time.perf_counter()
+    np.random.seed(SEED)
+    buf = io.BytesIO()
+    try:
+        with mpl.rc_context():
+            fig, _ = build(df=render_all._WORKER_DF, **params)
+            with stage(f"{module}.savefig", dpi=dpi, fmt=fmt):
+                fig.savefig(buf, format=fmt, dpi=dpi)
+    finally:
+        plt.close("all")
+    return buf.getvalue(), time.perf_counter() - t0
+
+
+# 3) Caché LRU acotada en bytes
+
+class ByteLRU:
+    """Diccionario LRU cuyo límite es la suma de bytes de los valores (no el número de entradas)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return  # no cabe ni sola: no desalojamos todo por ella
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            self._data[key] = value
+            self.nbytes += len(value)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self.nbytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+# 4) Estado del servidor: datos, pool, caché y renders en curso
+
+class FigureService:
+    """Datos calientes + pool de procesos + caché LRU; ``get`` devuelve (bytes, origen, segundos)."""
+
+    def __init__(self, jobs=None, cache_bytes: int = 256 << 20):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache = ByteLRU(cache_bytes)
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self._stat = None
+        self._data_hash = None
+        self._pool = None
+        self.data_hash()
+        self._start_pool()
+
+    def data_hash(self) -> str:
+        """Hash de contenido de los CSV; solo se recalcula si cambian tamaño o mtime."""
+        from utils.cache import file_fingerprint
+
+        stat = tuple((p.stat().st_size, p.stat().st_mtime_ns) for p in DATA_FILES)
+        if stat != self._stat:
+            h = hashlib.blake2b(digest_size=8)
+            for p in DATA_FILES:
+                h.update(file_fingerprint(p)["sha"].encode())
+            self._stat, self._data_hash = stat, h.hexdigest()
+        return self._data_hash
+
+    def _start_pool(self):
+        from utils.load_data import load_joined
+
+        # Deja la unión en la caché binaria: cada proceso la abre después con mmap
+        load_joined()
+        old, self._pool = self._pool, ProcessPoolExecutor(max_workers=self.jobs,
+                                                          initializer=render_all._init_worker)
+        self._pool_hash = self._data_hash
+        if old is not None:
+            old.shutdown(wait=False)
+        logger.info("pool de %d procesos listo (datos %s)", self.jobs, self._pool_hash)
+
+    def get(self, name: str, params: dict, fmt: str, dpi: int) -> tuple:
+        t0 = time.perf_counter()
+        with self._lock:
+            data = self.data_hash()
+            if data != self._pool_hash:
+                logger.info("cambiaron los datos de entrada: se reinicia el pool")
+                self._start_pool()
+        request = json.dumps([name, params, fmt, dpi], sort_keys=True, default=str)
+        key = hashlib.blake2b(f"{request}|{data}".encode(), digest_size=16).hexdigest()
+
+        body = self.cache.get(key)
+        if body is not None:
+            return body, "hit", time.perf_counter() - t0
+        with self._lock:
+            fut = self._inflight.get(key)
+            origin = "shared" if fut is not None else "miss"
+            if fut is None:
+                fut = self._pool.submit(render_bytes, name, params, fmt, dpi)
+                self._inflight[key] = fut
+        try:
+            body, _ = fut.result()
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        self.cache.put(key, body)
+        return body, origin, time.perf_counter() - t0
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    service: FigureService = None
+
+    def _send(self, code: int, body: bytes, ctype: str, extra=None):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code: int, obj):
+        self._send(code, json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"),
+                   "application/json; charset=utf-8")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["figures"]:
+            return self._json(200, {n: figure_params(n) for n in FIGURES})
+        if parts == ["stats"]:
+            return self._json(200, {**self.service.cache.info(), "data": self.service.data_hash(),
+                                    "jobs": self.service.jobs})
+        if len(parts) != 2 or parts[0] != "figure":
+            return self._json(404, {"error": f"Ruta desconocida: {url.path}"})
+
+        # Solo los errores de la petición son del cliente (404/400) ...
+        try:
+            params, fmt, dpi = parse_request(parts[1], dict(parse_qsl(url.query, keep_blank_values=True)))
+        except KeyError as exc:
+            return self._json(404, {"error": str(exc.args[0] if exc.args else exc)})
+        except (TypeError, ValueError) as exc:
+            return self._json(400, {"error": str(exc)})
+        # ... cualquier fallo al dibujar es del servidor (500), con la traza en el log
+        try:
+            body, origin, secs = self.service.get(parts[1], params, fmt, dpi)
+        except Exception as exc:  # noqa: BLE001 - el servidor sigue atendiendo
+            logger.exception("error al generar %s", self.path)
+            return self._json(500, {"error": f"{type(exc).__name__}: {exc}"})
+        return self._send(200, body, FORMATS[fmt], {"X-Cache": origin, "X-Seconds": f"{secs:.4f}"})
+
+    def log_message(self, fmt, *args):
+        logger.info("%s %s", self.address_string(), fmt % args)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, jobs=None, cache_bytes: int = 256 << 20,
+          warm: bool = False):
+    """Arranca el servicio y atiende peticiones hasta Ctrl+C; con ``warm``, pre-genera las figuras por defecto."""
+    service = FigureService(jobs=jobs, cache_bytes=cache_bytes)
+    if warm:
+        for name in FIGURES:
+            _, _, secs = service.get(name, dict(FIGURES[name][1]), "png", 300)
+            logger.info("%s: precalentada en %.2f s", name, secs)
+    handler = type("FigureHandler", (Handler,), {"service": service})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    # SIGTERM (kill, systemd) cierra igual que Ctrl+C: serve_forever termina y se apaga el pool
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+    logger.info("sirviendo figuras en http://%s:%d/", host, port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local de figuras con datos en memoria y caché LRU")
+    parser.add_argument("--host", default="127.0.0.1", help="interfaz (por defecto solo localhost)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--jobs", type=int, default=None, help="procesos de render (por defecto: nº de CPUs)")
+    parser.add_argument("--cache-mb", type=float, default=256, help="tamaño máximo de la caché de figuras (MB)")
+    parser.add_argument("--warm", action="store_true", help="generar al arrancar las figuras con sus parámetros por defecto")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    serve(args.host, args.port, args.jobs, int(args.cache_mb * 2**20), warm=args.warm)
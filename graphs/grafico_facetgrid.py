@@ -1,26 +1,30 @@
+import argparse
 from pathlib import Path
 import sys
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 # Aseguramos acceso al directorio raíz del proyecto
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-# Cargamos la función que importa los archivos CSV
-from utils.load_data import load_env_micro
+# Cargamos la función que importa los archivos CSV y el cálculo de cuantiles por intervalos
+from utils.load_data import iter_joined, load_joined
+from utils.quantiles import (binned_quantiles, bootstrap_quantile_ci, edges_from_range, presort_bins,
+                             rebin_quantiles)
+from utils.sketches import BinnedSketches
+from utils.spatial import REGION_HELP, region_filters, restrict
+from utils.trace import stage, traced
 
 
 # 1. Función para preparar los datos en formato largo
 
-def preparar_long(df_env, df_micro) -> pd.DataFrame:
-    # Unimos los datos ambientales y microbianos según el número de suelo
-    df = pd.merge(
-        df_micro[["soil_number", "time", "bacterial_growth_rate", "fungal_growth_rate"]],
-        df_env[["soil_number", "land_cover"]],
-        on="soil_number", how="inner",
-    ).dropna(subset=["time", "bacterial_growth_rate", "fungal_growth_rate", "land_cover"])
+@traced()
+def preparar_long(df: pd.DataFrame) -> pd.DataFrame:
+    # Partimos de la tabla ya unida (micro + env por número de suelo)
+    df = df[["soil_number", "time", "bacterial_growth_rate", "fungal_growth_rate", "land_cover"]].dropna(
+        subset=["time", "bacterial_growth_rate", "fungal_growth_rate", "land_cover"])
 
     # Filtramos tiempos válidos y definimos el tipo de cobertura como variable categórica
     df = df[df["time"] >= 0].copy()
@@ -43,73 +47,206 @@ def preparar_long(df_env, df_micro) -> pd.DataFrame:
 # 2. Función para resumir los datos por intervalos de tiempo
 
 def resumen_bins(df_cover: pd.DataFrame, n_bins: int = 20) -> pd.DataFrame:
-    # Agrupamos el tiempo en 20 intervalos y calculamos los cuantiles (25%, 50%, 75%)
-    tb = pd.cut(df_cover["time"], bins=n_bins)
-    q = (df_cover.groupby(["type", tb], observed=True)["growth_rate"]
-         .quantile([0.25, 0.5, 0.75]).unstack().reset_index()
-         .rename(columns={0.25: "q25", 0.5: "q50", 0.75: "q75"}))
-    # Calculamos el punto medio de cada intervalo para graficar
-    q["t"] = q["time"].apply(lambda iv: (iv.left + iv.right) / 2)
+    # Agrupamos el tiempo en n_bins intervalos y calculamos los cuantiles (25%, 50%, 75%)
+    # por tipo; "t" es el punto medio de cada intervalo (para graficar)
+    q = binned_quantiles(df_cover, by=["type"], n_bins=n_bins, edges_by=None)
     return q.dropna(subset=["q50"])
 
 
+@traced()
+def resumen_por_cobertura(long: pd.DataFrame, n_bins: int = 20) -> dict:
+    # Lo mismo que resumen_bins para todas las coberturas en una sola pasada
+    # (cada cobertura conserva sus propios intervalos de tiempo)
+    q = binned_quantiles(long, by=["land_cover", "type"], n_bins=n_bins, edges_by=["land_cover"])
+    q = q.dropna(subset=["q50"])
+    return {c: d.drop(columns="land_cover") for c, d in q.groupby("land_cover", observed=False)}
 
-# 3. Función para ajustar los límites del eje Y (escala logarítmica)
 
-def set_limites_log(ax, q: pd.DataFrame):
-    ax.set_yscale("log")  # Usamos escala logarítmica para cubrir varios órdenes de magnitud
-    if q.empty:
-        ax.set_ylim(1e-4, 2e-1); return
-    y_lo, y_hi = q["q25"].min(), q["q75"].max()
-    lower = max(1e-5, y_lo / 1.6); upper = min(1.0, y_hi * 1.6)
-    if not (upper > lower): lower, upper = 1e-4, 2e-1
-    ax.set_ylim(lower, upper); ax.margins(x=0.02)
+def ordenar_para_bins(long: pd.DataFrame) -> dict:
+    # Tiempos ordenados por (cobertura, tipo): base común para re-agrupar con distintos n_bins
+    return presort_bins(long, by=["land_cover", "type"], edges_by=["land_cover"])
+
 
+@traced()
+def resumen_desde_orden(pre: dict, n_bins: int = 20, n_boot: int = 0, seed: int = 0, jobs=None,
+                        cache: bool = False) -> dict:
+    # Igual que resumen_por_cobertura, partiendo de ordenar_para_bins (solo búsquedas binarias)
+    q = rebin_quantiles(pre, n_bins=n_bins)
+    if n_boot:
+        # Intervalo de confianza bootstrap (95 %) de la mediana de cada intervalo: columnas ci_lo / ci_hi
+        ci = bootstrap_quantile_ci(pre, n_bins=n_bins, n_boot=n_boot, seed=seed, jobs=jobs, cache=cache)
+        q = q.merge(ci, on=["land_cover", "type", "bin"], how="left")
+    q = q.dropna(subset=["q50"])
+    return {c: d.drop(columns="land_cover") for c, d in q.groupby("land_cover", observed=False)}
 
-# 4. Cargamos y preparamos los datos
 
-df_env, df_micro = load_env_micro()
-long = preparar_long(df_env, df_micro)
+# 2b. Resumen aproximado por bloques (memoria acotada, con sketches KLL)
 
-# Obtenemos las coberturas del suelo presentes
-covers = list(long["land_cover"].cat.categories) if hasattr(long["land_cover"], "cat") else sorted(long["land_cover"].unique())
+COLUMNAS = ["time", "bacterial_growth_rate", "fungal_growth_rate", "land_cover"]
 
-# Calculamos los resúmenes estadísticos por cobertura
-resumen = {c: resumen_bins(long[long["land_cover"] == c]) for c in covers}
 
+def _bloques_long(df=None, chunksize: int = 1_000_000, region=None):
+    # Bloques en formato largo: del CSV por partes, o la tabla dada como un único bloque
+    if df is not None:
+        yield preparar_long(restrict(df, region))
+        return
+    filters = [("time", ">=", 0), *region_filters(region)]
+    for chunk in iter_joined(columns=COLUMNAS, filters=filters, chunksize=chunksize):
+        yield preparar_long(chunk)
 
-# 5. Graficamos subplots por tipo de cobertura
 
-fig, axes = plt.subplots(2, 2, figsize=(12, 8), sharex=True, sharey=True)
-axes = axes.ravel()
+@traced()
+def resumen_aproximado(df=None, n_bins: int = 20, k: int = 200, seed: int = 0,
+                       chunksize: int = 1_000_000, region=None):
+    # Primera pasada: mínimo y máximo de tiempo por cobertura (mismos intervalos que el modo exacto)
+    rangos = {}
+    for long in _bloques_long(df, chunksize, region):
+        for cover, t in long.groupby("land_cover", observed=True)["time"]:
+            lo, hi = rangos.get(cover, (np.inf, -np.inf))
+            rangos[cover] = (min(lo, t.min()), max(hi, t.max()))
+    edges = {c: edges_from_range(lo, hi, n_bins) for c, (lo, hi) in rangos.items()}
 
-for ax, cover in zip(axes, covers):
-    q = resumen[cover]
-    # Graficamos la mediana (línea) y el rango intercuartílico (sombreado)
-    for typ in ("Bacterial", "Fungal"):
-        d = q[q["type"] == typ].sort_values("t")
-        if d.empty: continue
-        ax.fill_between(d["t"], d["q25"], d["q75"], alpha=0.25)  # Sombra (variabilidad)
-        ax.plot(d["t"], d["q50"], lw=2, label=typ)              # Línea (mediana)
-    ax.set_title(str(cover))
-    ax.grid(True, which="major", alpha=0.6)
-    set_limites_log(ax, q)  # Ajustamos límites logarítmicos
+    # Segunda pasada: un sketch KLL por (cobertura, tipo, intervalo), bloque a bloque
+    sketches = BinnedSketches(edges, k=k, seed=seed)
+    for long in _bloques_long(df, chunksize, region):
+        sketches.update(long)
+    return sketches
 
 
-# Etiquetas y leyenda general
-axes[2].set_xlabel("Tiempo")
-axes[3].set_xlabel("Tiempo")
-axes[0].set_ylabel("Tasa de crecimiento (log)")
-axes[2].set_ylabel("Tasa de crecimiento (log)")
-handles, labels = axes[0].get_legend_handles_labels()
-fig.legend(handles, labels, loc="upper right", title="Tipo microbiano")
+# 3. Función para ajustar los límites del eje Y (escala logarítmica)
+
+def set_limites_log(ax, q: pd.DataFrame):
+    ax.set_yscale("log")  # Usamos escala logarítmica para cubrir varios órdenes de magnitud
+    if q.empty:
+        ax.set_ylim(1e-4, 2e-1); return
+    y_lo, y_hi = q["q25"].min(), q["q75"].max()
+    lower = max(1e-5, y_lo / 1.6); upper = min(1.0, y_hi * 1.6)
+    if not (upper > lower): lower, upper = 1e-4, 2e-1
+    ax.set_ylim(lower, upper); ax.margins(x=0.02)
 
-# Título general y formato final
-fig.suptitle("Crecimiento bacteriano vs fúngico en el tiempo ", y=0.98)
-fig.tight_layout(rect=[0, 0, 0.98, 0.96])
 
-# Guardamos el gráfico en la carpeta outputs
-out = PROJECT_ROOT / "outputs" / "grafico2_lineas_subplots.png"
-out.parent.mkdir(parents=True, exist_ok=True)
-plt.savefig(out, dpi=300)
-plt.show()
+# 4. Construcción de la figura
+
+@traced()
+def build(df=None, n_bins: int = 20, approx: bool = False, k: int = 200, chunksize: int = 1_000_000,
+          resumen=None, region=None, ci: bool = False, n_boot: int = 2000, seed: int = 0, jobs=None,
+          ci_cache: bool = False):
+    """
+    Construye la figura del Gráfico 2 y devuelve (fig, datos), con datos =
+    {"long": tabla larga, "resumen": {cobertura: cuantiles por intervalo}}.
+    ``df`` es la tabla unida (por defecto load_joined()).
+    Con ``approx`` los cuantiles salen de sketches KLL alimentados por bloques
+    (memoria acotada; ver utils.sketches para el error): "long" es None y
+    datos incluye "sketches".
+    ``resumen`` son cuantiles ya calculados con ese n_bins (p.ej. por
+    graphs/sweep.py); si se da, solo se dibuja ("long" es None).
+    Con ``ci`` se sombrea además el intervalo de confianza bootstrap (95 %) de
+    la mediana, con ``n_boot`` réplicas, semilla ``seed`` y ``jobs`` procesos
+    (ver utils.quantiles.bootstrap_quantile_ci); ``ci_cache`` lo guarda en la
+    caché en disco. No disponible con ``approx``.
+    ``region`` (p.ej. "radius:12.5:55.7:300", ver utils.spatial) limita la
+    figura a los suelos de esa región.
+    """
+    import matplotlib.pyplot as plt
+
+    if ci and approx:
+        raise ValueError("Los intervalos bootstrap necesitan los datos completos (sin approx)")
+    if resumen is not None:
+        long = None
+        covers = list(resumen)
+    elif approx:
+        sketches = resumen_aproximado(df, n_bins=n_bins, k=k, chunksize=chunksize, region=region)
+        q = sketches.summary()
+        long = None
+        covers = sorted(q["land_cover"].unique())
+        resumen = {c: d.drop(columns="land_cover") for c, d in q.groupby("land_cover", observed=True)}
+    else:
+        # Cargamos y preparamos los datos
+        if df is None:
+            # Solo leemos las columnas necesarias y descartamos tiempos negativos durante la lectura
+            df = load_joined(columns=COLUMNAS, filters=[("time", ">=", 0), *region_filters(region)])
+        else:
+            df = restrict(df, region)
+        long = preparar_long(df)
+
+        # Obtenemos las coberturas del suelo presentes
+        covers = list(long["land_cover"].cat.categories) if hasattr(long["land_cover"], "cat") else sorted(long["land_cover"].unique())
+
+        # Calculamos los resúmenes estadísticos por cobertura
+        if ci:
+            resumen = resumen_desde_orden(ordenar_para_bins(long), n_bins=n_bins, n_boot=n_boot, seed=seed,
+                                          jobs=jobs, cache=ci_cache)
+        else:
+            resumen = resumen_por_cobertura(long, n_bins=n_bins)
+
+    # Graficamos subplots por tipo de cobertura
+    fig, axes = plt.subplots(2, 2, figsize=(12, 8), sharex=True, sharey=True)
+    axes = axes.ravel()
+
+    for ax, cover in zip(axes, covers):
+        q = resumen[cover]
+        # Graficamos la mediana (línea) y el rango intercuartílico (sombreado)
+        for typ in ("Bacterial", "Fungal"):
+            d = q[q["type"] == typ].sort_values("t")
+            if d.empty: continue
+            ax.fill_between(d["t"], d["q25"], d["q75"], alpha=0.25)  # Sombra (variabilidad)
+            line, = ax.plot(d["t"], d["q50"], lw=2, label=typ)      # Línea (mediana)
+            if ci and "ci_lo" in d:
+                # Intervalo de confianza de la mediana (más oscuro que el IQR)
+                ax.fill_between(d["t"], d["ci_lo"], d["ci_hi"], color=line.get_color(), alpha=0.45, lw=0)
+        ax.set_title(str(cover))
+        ax.grid(True, which="major", alpha=0.6)
+        set_limites_log(ax, q)  # Ajustamos límites logarítmicos
+
+    # Etiquetas y leyenda general
+    axes[2].set_xlabel("Tiempo")
+    axes[3].set_xlabel("Tiempo")
+    axes[0].set_ylabel("Tasa de crecimiento (log)")
+    axes[2].set_ylabel("Tasa de crecimiento (log)")
+    handles, labels = axes[0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc="upper right", title="Tipo microbiano")
+
+    # Título general y formato final
+    fig.suptitle("Crecimiento bacteriano vs fúngico en el tiempo ", y=0.98)
+    fig.tight_layout(rect=[0, 0, 0.98, 0.96])
+    datos = {"long": long, "resumen": resumen}
+    if approx:
+        datos["sketches"] = sketches
+    return fig, datos
+
+
+def main(args):
+    import matplotlib.pyplot as plt
+
+    fig, datos = build(n_bins=args.n_bins, approx=args.approx, k=args.k, region=args.region,
+                       ci=args.ci, n_boot=args.n_boot, seed=args.seed, jobs=args.jobs, ci_cache=args.ci_cache)
+    if args.sketches:
+        # Sketches serializados: se pueden fusionar con los de otros archivos o procesos
+        datos["sketches"].save(args.sketches)
+
+    # Guardamos el gráfico en la carpeta outputs
+    out = PROJECT_ROOT / "outputs" / "grafico2_lineas_subplots.png"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with stage("grafico_facetgrid.savefig", dpi=300):
+        fig.savefig(out, dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gráfico 2: crecimiento bacteriano vs fúngico por cobertura")
+    parser.add_argument("--n-bins", type=int, default=20, help="número de intervalos de tiempo")
+    parser.add_argument("--approx", action="store_true", help="cuantiles aproximados por bloques (sketches KLL)")
+    parser.add_argument("--k", type=int, default=200, help="tamaño de los sketches KLL (más grande = más preciso)")
+    parser.add_argument("--sketches", type=Path, default=None, help="guardar los sketches (JSON) en esta ruta (requiere --approx)")
+    parser.add_argument("--region", default=None, help=REGION_HELP)
+    parser.add_argument("--ci", action="store_true", help="sombrear el IC bootstrap (95 %%) de la mediana")
+    parser.add_argument("--n-boot", type=int, default=2000, help="réplicas bootstrap (con --ci)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla de remuestreo (con --ci)")
+    parser.add_argument("--jobs", type=int, default=None, help="procesos del bootstrap (por defecto, uno por núcleo)")
+    parser.add_argument("--ci-cache", action="store_true", help="guardar/reutilizar los IC en la caché en disco")
+    args = parser.parse_args()
+    if args.sketches and not args.approx:
+        parser.error("--sketches requiere --approx")
+    if args.ci and args.approx:
+        parser.error("--ci no es compatible con --approx")
+    main(args)
@@ -1,8 +1,8 @@
+import argparse
 from pathlib import Path
 import sys
+import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 # Aseguramos el acceso al directorio raíz del proyecto
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -10,15 +10,14 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 # Importamos la función que carga los datos ambientales y microbianos
-from utils.load_data import load_env_micro
+from utils.load_data import load_joined
+from utils.correlation import corr_significance, correlaciones as _correlaciones
+from utils.spatial import REGION_HELP, region_filters, restrict
+from utils.trace import stage, traced
 
-# 1. Carga y combinación de los conjuntos de datos
-df_env, df_micro = load_env_micro()
-# Unimos ambas tablas a través del número de suelo (soil_number)
-df = pd.merge(df_micro, df_env, on="soil_number", how="inner")
 
-# 2. Selección de variables relevantes
-vars_candidatas = [
+# 1. Selección de variables relevantes
+VARS_CANDIDATAS = [
     "bacterial_growth_rate", "fungal_growth_rate", "respiration_rate",
     "pH", "aridity_index", "carbon_availability", "incubation_temperature",
     "soil_moisture_at_the_end_of_drying",
@@ -29,13 +28,8 @@ vars_candidatas = [
     "fungal_to_bacterial_dominance_in_the_moist_control",
 ]
 
-# Nos aseguramos de incluir solo las columnas que existen en el DataFrame
-cols = [c for c in vars_candidatas if c in df.columns]
-df_sel = df[cols].apply(pd.to_numeric, errors="coerce").dropna(how="any")
-
-# 3. Renombramos las columnas para etiquetas más legibles en el gráfico
-
-ren = {
+# 2. Nombres de columnas más legibles para las etiquetas del gráfico
+REN = {
     "bacterial_growth_rate": "Crec. bacteriano",
     "fungal_growth_rate": "Crec. fúngico",
     "respiration_rate": "Respiración",
@@ -50,41 +44,129 @@ ren = {
     "carbon_use_efficiency_in_the_moist_control": "CUE (control)",
     "fungal_to_bacterial_dominance_in_the_moist_control": "F:B (control)",
 }
-df_plot = df_sel.rename(columns=ren)
-
-
-# 4. Cálculo de correlaciones
-
-# Usamos el método de Spearman (adecuado para relaciones no lineales)
-corr = df_plot.corr(method="spearman")
-
-
-# 5. Creación del mapa de calor (heatmap)
-
-sns.set_theme(style="white", context="notebook")
-fig, ax = plt.subplots(figsize=(10, 8))
-
-# Dibujamos el mapa de correlación con anotaciones y escala de color
-sns.heatmap(
-    corr,
-    cmap="RdBu_r", vmin=-1, vmax=1, center=0,  # paleta centrada en 0
-    annot=True, fmt=".2f",                    # mostramos valores numéricos
-    annot_kws={"size": 8},                   # tamaño del texto
-    cbar_kws={"shrink": 0.8, "label": "Coef. de correlación"},
-    linewidths=0.6, linecolor="gray", square=True, ax=ax
-)
 
-# Ajustes de formato de ejes y título
-ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha="right", fontsize=8)
-ax.set_yticklabels(ax.get_yticklabels(), rotation=0, fontsize=8)
-ax.set_title(
-    "Mapa de calor de correlaciones\nVariables ambientales vs tasas microbianas",
-    fontsize=12, pad=12
-)
 
-# Guardamos el gráfico en la carpeta outputs
-plt.tight_layout()
-out = PROJECT_ROOT / "outputs" / "grafico3_heatmap_correlaciones_v2.png"
-out.parent.mkdir(parents=True, exist_ok=True)
-plt.savefig(out, dpi=300)
-plt.show()
+# 3. Cálculo de correlaciones
+
+@traced()
+def correlaciones(df: pd.DataFrame, variables=VARS_CANDIDATAS, missing: str = "complete") -> pd.DataFrame:
+    """
+    Matriz de Spearman de las variables que existan en df (motor de
+    utils.correlation: rangos una vez + producto de matrices).
+      - missing="complete": solo filas sin ningún faltante (como antes).
+      - missing="pairwise": cada par usa todas las filas donde ambas existen.
+    """
+    return _correlaciones(df, variables, method="spearman", missing=missing, labels=REN)
+
+
+@traced()
+def significancia(df: pd.DataFrame, variables=VARS_CANDIDATAS, n_boot=10_000, n_perm=10_000,
+                   alpha=0.05, seed=0, jobs=None) -> dict:
+    """
+    Intervalos bootstrap y p-valores por permutación de cada celda (filas
+    completas), con las etiquetas legibles. Ver utils.correlation.corr_significance.
+    """
+    cols = [c for c in variables if c in df.columns]
+    return corr_significance(df[cols].rename(columns=REN), method="spearman", n_boot=n_boot,
+                             n_perm=n_perm, alpha=alpha, seed=seed, jobs=jobs)
+
+
+# 4. Creación del mapa de calor (heatmap)
+
+@traced()
+def build(df=None, variables=VARS_CANDIDATAS, missing="complete", signif=None,
+          n_boot=10_000, n_perm=10_000, alpha=0.05, seed=0, jobs=None, region=None):
+    """
+    Construye la figura del Gráfico 3 y devuelve (fig, datos), con datos =
+    {"corr": matriz de correlaciones[, "signif": resultado de significancia]}.
+    ``df`` es la tabla unida (por defecto load_joined()); ``missing`` como en
+    correlaciones().
+      - signif: None, "mask" (oculta las celdas no significativas) o "annot"
+        (las muestra entre paréntesis), según el p-valor de permutación y alpha.
+      - region: p.ej. "radius:12.5:55.7:300" (ver utils.spatial); solo los
+        suelos de esa región.
+    """
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    if signif not in (None, "mask", "annot"):
+        raise ValueError(f"Modo de significancia no soportado: {signif!r}")
+    if signif and missing != "complete":
+        raise ValueError("La significancia se calcula sobre filas completas (missing='complete')")
+
+    if df is None:
+        df = load_joined(columns=list(variables), filters=region_filters(region))
+    else:
+        df = restrict(df, region)
+    corr = correlaciones(df, variables, missing)
+    datos = {"corr": corr}
+
+    annot, fmt, mask = True, ".2f", None
+    if signif:
+        res = significancia(df, variables, n_boot, n_perm, alpha, seed, jobs)
+        datos["signif"] = res
+        no_sig = (res["p"] >= alpha).to_numpy()
+        if signif == "mask":
+            mask = no_sig
+        else:
+            annot = np.where(no_sig, corr.map(lambda v: f"({v:.2f})"), corr.map(lambda v: f"{v:.2f}"))
+            fmt = ""
+
+    sns.set_theme(style="white", context="notebook")
+    fig, ax = plt.subplots(figsize=(10, 8))
+
+    # Dibujamos el mapa de correlación con anotaciones y escala de color
+    sns.heatmap(
+        corr,
+        cmap="RdBu_r", vmin=-1, vmax=1, center=0,  # paleta centrada en 0
+        annot=annot, fmt=fmt, mask=mask,          # mostramos valores numéricos
+        annot_kws={"size": 8},                   # tamaño del texto
+        cbar_kws={"shrink": 0.8, "label": "Coef. de correlación"},
+        linewidths=0.6, linecolor="gray", square=True, ax=ax
+    )
+
+    # Ajustes de formato de ejes y título
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha="right", fontsize=8)
+    ax.set_yticklabels(ax.get_yticklabels(), rotation=0, fontsize=8)
+    ax.set_title(
+        "Mapa de calor de correlaciones\nVariables ambientales vs tasas microbianas",
+        fontsize=12, pad=12
+    )
+    if signif:
+        nota = "ocultas" if signif == "mask" else "entre paréntesis"
+        fig.text(0.01, 0.01, f"Celdas no significativas (p ≥ {alpha:g}, {n_perm} permutaciones) {nota}",
+                 fontsize=7, color="#555555")
+    fig.tight_layout()
+    return fig, datos
+
+
+def main(args):
+    import matplotlib.pyplot as plt
+
+    fig, _ = build(missing=args.missing, signif=args.signif, n_boot=args.n_boot,
+                   n_perm=args.n_perm, alpha=args.alpha, seed=args.seed, jobs=args.jobs,
+                   region=args.region)
+
+    # Guardamos el gráfico en la carpeta outputs
+    sufijo = "_pairwise" if args.missing == "pairwise" else ""
+    sufijo += f"_signif_{args.signif}" if args.signif else ""
+    out = PROJECT_ROOT / "outputs" / f"grafico3_heatmap_correlaciones_v2{sufijo}.png"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with stage("grafico_heatmap.savefig", dpi=300):
+        fig.savefig(out, dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gráfico 3: mapa de calor de correlaciones de Spearman")
+    parser.add_argument("--missing", choices=["complete", "pairwise"], default="complete",
+                        help="faltantes: filas completas (por defecto) o pares completos")
+    parser.add_argument("--signif", choices=["mask", "annot"], default=None,
+                        help="oculta o marca las celdas no significativas (permutación)")
+    parser.add_argument("--n-boot", type=int, default=10_000, help="réplicas bootstrap")
+    parser.add_argument("--n-perm", type=int, default=10_000, help="permutaciones")
+    parser.add_argument("--alpha", type=float, default=0.05, help="nivel de significancia")
+    parser.add_argument("--seed", type=int, default=0, help="semilla de remuestreo")
+    parser.add_argument("--jobs", type=int, default=None, help="procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--region", default=None, help=REGION_HELP)
+    main(parser.parse_args())
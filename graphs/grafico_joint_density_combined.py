@@ -1,109 +1,180 @@
+import argparse
 from pathlib import Path
 import sys
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from scipy.stats import spearmanr
 from numpy.polynomial import Polynomial
 
 #  Cargamos el loader
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
-from utils.load_data import load_env_micro  # CSV
+from utils.load_data import load_joined  # CSV
+from utils.kde import iso_levels, kde_grid
+from utils.spatial import REGION_HELP, region_filters, restrict
+from utils.trace import stage, traced
 
 
-# Traemos tablas ambiental y microbiana
-df_env, df_micro = load_env_micro()
-
-# Unimos por suelo y nos quedamos con respiración + crecimientos
-df = pd.merge(
-    df_micro[["soil_number", "respiration_rate", "bacterial_growth_rate", "fungal_growth_rate"]],
-    df_env[["soil_number", "land_cover"]],
-    on="soil_number", how="inner"
-).dropna(subset=["respiration_rate", "bacterial_growth_rate", "fungal_growth_rate"])
-
-# Pasamos a formato largo (comparar bacteria/hongo en la misma figura)
-long = df.melt(
-    id_vars=["soil_number", "land_cover", "respiration_rate"],
-    value_vars=["bacterial_growth_rate", "fungal_growth_rate"],
-    var_name="type", value_name="growth"
-)
-# Nombres limpios y solo tasas positivas
-long["type"] = long["type"].str.replace("_growth_rate", "", regex=False).str.capitalize()
-long = long[long["growth"] > 0].copy()
-
-# Usamos log10 del crecimiento para comprimir escala (evita outliers gigantes)
-long["growth_log10"] = np.log10(long["growth"])
-
-# 2) Estilo y paletas
-sns.set_theme(style="whitegrid", context="notebook")
-
 # Definimos colores consistentes para cada panel
 PALETAS = {
     "Bacterial": {"base": "#3366CC", "contorno": "#003366", "relleno": "#66A3FF"},
     "Fungal": {"base": "#CC3311", "contorno": "#660000", "relleno": "#FF7043"},
 }
 
-# 3) Figura 1x2: bacterias vs hongos
-fig, axes = plt.subplots(1, 2, figsize=(12, 5), sharex=True, sharey=True)
-pairs = [("Bacterial", "Bacteriano"), ("Fungal", "Fúngico")]
 
-for ax, (key, label) in zip(axes, pairs):
-    d = long[long["type"] == key]
-    if d.empty:
-        ax.text(0.5, 0.5, "Sin datos", ha="center", va="center", fontsize=10)
-        continue
+# 1) Datos en formato largo
 
-    pal = PALETAS[key]
+@traced()
+def preparar_long(df: pd.DataFrame) -> pd.DataFrame:
+    # Nos quedamos con respiración + crecimientos completos
+    df = df.dropna(subset=["respiration_rate", "bacterial_growth_rate", "fungal_growth_rate"])
 
-    # 3.1) Ponemos la nube de puntos (dispersión)
-    sns.scatterplot(
-        data=d, x="respiration_rate", y="growth_log10",
-        s=20, alpha=0.4, color=pal["base"], ax=ax
+    # Pasamos a formato largo (comparar bacteria/hongo en la misma figura)
+    long = df.melt(
+        id_vars=["soil_number", "land_cover", "respiration_rate"],
+        value_vars=["bacterial_growth_rate", "fungal_growth_rate"],
+        var_name="type", value_name="growth"
     )
-
-    # 3.2) Añadimos densidades KDE: relleno + contornos (morfología de la nube)
-    sns.kdeplot(
-        data=d, x="respiration_rate", y="growth_log10",
-        fill=True, levels=25, thresh=0.02, alpha=0.45,
-        cmap=sns.light_palette(pal["relleno"], as_cmap=True), ax=ax
-    )
-    sns.kdeplot(
-        data=d, x="respiration_rate", y="growth_log10",
-        levels=7, color=pal["contorno"], linewidths=0.8, ax=ax
-    )
-
-    # 3.3) Trazamos una tendencia polinómica suave (grado 3)
-    x = d["respiration_rate"].to_numpy()
-    y = d["growth_log10"].to_numpy()
-    if len(x) > 5:
-        x_fit = np.linspace(x.min(), x.max(), 200)
-        p = Polynomial.fit(x, y, deg=3)  # suaviza sin imponer linealidad
-        ax.plot(x_fit, p(x_fit), color=pal["contorno"], lw=2.5, label="Tendencia")
-
-    # 3.4) Mostramos la correlación de Spearman (ρ) en el título del panel
-    rho, _ = spearmanr(x, y)
-    ax.set_title(f"Respiración vs Crecimiento {label}\nρ = {rho:.2f}",
-                 fontsize=11, pad=8, color=pal["contorno"])
-
-# Ejes y formato generales
-axes[0].set_xlabel("Tasa de respiración")
-axes[1].set_xlabel("Tasa de respiración")
-axes[0].set_ylabel("Crecimiento (log10)")
-for ax in axes:
-    ax.grid(True, alpha=0.4, lw=0.6)
-    ax.set_facecolor("#FAFAFA")
-    ax.tick_params(colors="#333333", labelsize=9)
-
-# Título general y ajuste final
-fig.suptitle("Densidad conjunta: Respiración ↔ Crecimiento microbiano", y=0.98,
-             fontsize=13, color="#222222")
-fig.tight_layout(rect=[0, 0, 1, 0.95])
-
-# Guardamos la figura
-out = PROJECT_ROOT / "outputs" / "grafico5_joint_density.png"
-out.parent.mkdir(parents=True, exist_ok=True)
-plt.savefig(out, dpi=300)
-plt.show()
+    # Nombres limpios y solo tasas positivas
+    long["type"] = long["type"].str.replace("_growth_rate", "", regex=False).str.capitalize()
+    long = long[long["growth"] > 0].copy()
+
+    # Usamos log10 del crecimiento para comprimir escala (evita outliers gigantes)
+    long["growth_log10"] = np.log10(long["growth"])
+    return long
+
+
+# 2) Figura 1x2: bacterias vs hongos
+
+@traced()
+def build(df=None, kde_engine="auto", bw="scott", max_points=None, aggregate="hexbin", region=None):
+    """
+    Construye la figura del Gráfico 5 y devuelve (fig, datos), con datos =
+    {"long": tabla larga, "rho": {tipo: ρ de Spearman}, "p": {tipo: p-valor},
+    "kde": {tipo: (xx, yy, densidad)}}. ``df`` es la tabla unida (por defecto
+    load_joined()).
+      - kde_engine: "exact", "fft" o "auto" (ver utils.kde).
+      - bw: ancho de banda, "scott", "silverman" o un factor numérico.
+      - max_points: si un panel supera este número de puntos, la nube se dibuja
+        agregada ("hexbin" o "hist2d", rasterizada) en vez de punto a punto;
+        KDE, tendencia y ρ se calculan siempre con todos los datos.
+      - region: p.ej. "radius:12.5:55.7:300" (ver utils.spatial); solo los
+        suelos de esa región.
+    """
+    if aggregate not in ("hexbin", "hist2d"):
+        raise ValueError(f"Modo de agregación no soportado: {aggregate!r}")
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    from scipy.stats import spearmanr
+
+    # Traemos la tabla unida por suelo, solo con respiración, crecimientos y cobertura
+    if df is None:
+        df = load_joined(
+            columns=["respiration_rate", "bacterial_growth_rate", "fungal_growth_rate", "land_cover"],
+            filters=region_filters(region),
+        )
+    else:
+        df = restrict(df, region)
+    long = preparar_long(df)
+
+    # Estilo
+    sns.set_theme(style="whitegrid", context="notebook")
+
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5), sharex=True, sharey=True)
+    pairs = [("Bacterial", "Bacteriano"), ("Fungal", "Fúngico")]
+    rhos, pvals, grids = {}, {}, {}
+
+    for ax, (key, label) in zip(axes, pairs):
+        d = long[long["type"] == key]
+        if d.empty:
+            ax.text(0.5, 0.5, "Sin datos", ha="center", va="center", fontsize=10)
+            continue
+
+        pal = PALETAS[key]
+
+        # 2.1) Ponemos la nube de puntos (dispersión), agregada si son demasiados
+        if max_points is not None and len(d) > max_points:
+            cmap = sns.light_palette(pal["base"], as_cmap=True)
+            if aggregate == "hexbin":
+                ax.hexbin(d["respiration_rate"], d["growth_log10"], gridsize=80, bins="log",
+                          mincnt=1, cmap=cmap, alpha=0.6, linewidths=0, rasterized=True)
+            else:
+                from matplotlib.colors import LogNorm
+                ax.hist2d(d["respiration_rate"], d["growth_log10"], bins=120, cmin=1,
+                          norm=LogNorm(), cmap=cmap, alpha=0.6, rasterized=True)
+        else:
+            sns.scatterplot(
+                data=d, x="respiration_rate", y="growth_log10",
+                s=20, alpha=0.4, color=pal["base"], ax=ax
+            )
+
+        # 2.2) Añadimos densidades KDE: relleno + contornos (morfología de la nube)
+        #      La rejilla de densidad se calcula una vez y la usan ambas capas
+        xx, yy, dens = kde_grid(d["respiration_rate"], d["growth_log10"], bw_method=bw, engine=kde_engine)
+        grids[key] = (xx, yy, dens)
+        ax.contourf(xx, yy, dens, levels=iso_levels(dens, 25, thresh=0.02), alpha=0.45,
+                    cmap=sns.light_palette(pal["relleno"], as_cmap=True))
+        ax.contour(xx, yy, dens, levels=iso_levels(dens, 7, thresh=0.05),
+                   colors=[pal["contorno"]], linewidths=0.8)
+
+        # 2.3) Trazamos una tendencia polinómica suave (grado 3)
+        x = d["respiration_rate"].to_numpy()
+        y = d["growth_log10"].to_numpy()
+        if len(x) > 5:
+            x_fit = np.linspace(x.min(), x.max(), 200)
+            p = Polynomial.fit(x, y, deg=3)  # suaviza sin imponer linealidad
+            ax.plot(x_fit, p(x_fit), color=pal["contorno"], lw=2.5, label="Tendencia")
+
+        # 2.4) Mostramos la correlación de Spearman (ρ) en el título del panel
+        rho, pval = spearmanr(x, y)
+        rhos[key], pvals[key] = rho, pval
+        ax.set_title(f"Respiración vs Crecimiento {label}\nρ = {rho:.2f}",
+                     fontsize=11, pad=8, color=pal["contorno"])
+
+    # Ejes y formato generales
+    axes[0].set_xlabel("Tasa de respiración")
+    axes[1].set_xlabel("Tasa de respiración")
+    axes[0].set_ylabel("Crecimiento (log10)")
+    for ax in axes:
+        ax.grid(True, alpha=0.4, lw=0.6)
+        ax.set_facecolor("#FAFAFA")
+        ax.tick_params(colors="#333333", labelsize=9)
+
+    # Título general y ajuste final
+    fig.suptitle("Densidad conjunta: Respiración ↔ Crecimiento microbiano", y=0.98,
+                 fontsize=13, color="#222222")
+    fig.tight_layout(rect=[0, 0, 1, 0.95])
+    return fig, {"long": long, "rho": rhos, "p": pvals, "kde": grids}
+
+
+def main(args):
+    import matplotlib.pyplot as plt
+
+    fig, _ = build(kde_engine=args.kde_engine, bw=args.bw,
+                   max_points=args.max_points, aggregate=args.aggregate, region=args.region)
+
+    # Guardamos la figura
+    out = PROJECT_ROOT / "outputs" / "grafico5_joint_density.png"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with stage("grafico_joint_density_combined.savefig", dpi=300):
+        fig.savefig(out, dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gráfico 5: densidad conjunta respiración vs crecimiento")
+    parser.add_argument("--kde-engine", choices=["auto", "exact", "fft"], default="auto",
+                        help="motor de densidad: exacto, FFT o auto (FFT con muchos puntos)")
+    parser.add_argument("--bw", default="scott",
+                        help="ancho de banda: scott, silverman o un factor numérico")
+    parser.add_argument("--max-points", type=int, default=None,
+                        help="por encima de estos puntos por panel, la nube se agrega")
+    parser.add_argument("--aggregate", choices=["hexbin", "hist2d"], default="hexbin",
+                        help="agregación de la nube con --max-points")
+    parser.add_argument("--region", default=None, help=REGION_HELP)
+    args = parser.parse_args()
+    try:
+        args.bw = float(args.bw)
+    except ValueError:
+        pass
+    main(args)
@@ -1,11 +1,9 @@
+import argparse
 from pathlib import Path
+from typing import Optional
 import sys
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 
 # Aseguramos acceso al directorio raíz del proyecto
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -13,18 +11,16 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 # Cargamos los datos ambientales y microbianos
-from utils.load_data import load_env_micro
-df_env, df_micro = load_env_micro()
+from utils.load_data import iter_joined, load_joined
+from utils.correlation import correlaciones, pca_from_corr
+from utils.pca import StreamingPCA, chunks_of
+from utils.spatial import REGION_HELP, region_filters, restrict
+from utils.trace import stage, traced
 
 
-# 1. Fusión de los datos (por número de suelo)
+# 1. Selección de variables numéricas para el PCA
 
-df = pd.merge(df_micro, df_env, on="soil_number", how="inner")
-
-
-# 2. Selección de variables numéricas para el PCA
-
-vars_num = [
+VARS_NUM = [
     "bacterial_growth_rate", "fungal_growth_rate", "respiration_rate",
     "pH", "aridity_index", "carbon_availability", "incubation_temperature",
     "soil_moisture_at_the_end_of_drying",
@@ -34,18 +30,11 @@ vars_num = [
     "carbon_use_efficiency_in_the_moist_control",
     "fungal_to_bacterial_dominance_in_the_moist_control",
 ]
-vars_num = [c for c in vars_num if c in df.columns]
-
-# Creamos una matriz limpia solo con valores numéricos
-X = df[vars_num].apply(pd.to_numeric, errors="coerce").dropna(how="any").copy()
-# Guardamos las etiquetas de cobertura del suelo para colorear los puntos
-meta = df.loc[X.index, ["land_cover"]].copy()
-meta["land_cover"] = meta["land_cover"].astype("category")
 
 
-# 3. Renombramos variables para mostrar nombres legibles en el gráfico
+# 2. Nombres legibles de las variables para el gráfico
 
-ren = {
+REN = {
     "bacterial_growth_rate": "Crec. bacteriano",
     "fungal_growth_rate": "Crec. fúngico",
     "respiration_rate": "Respiración",
@@ -60,57 +49,175 @@ ren = {
     "carbon_use_efficiency_in_the_moist_control": "CUE (ctrl)",
     "fungal_to_bacterial_dominance_in_the_moist_control": "F:B (ctrl)",
 }
-var_labels = [ren.get(c, c) for c in X.columns]
-
-
-# 4. Estandarización y cálculo del PCA
-
-scaler = StandardScaler()
-Xz = scaler.fit_transform(X)  # Estandarizamos para que todas las variables tengan igual peso
-
-# Ejecutamos el PCA con dos componentes principales
-pca = PCA(n_components=2, random_state=42)
-scores = pca.fit_transform(Xz)        # Coordenadas de las muestras
-loadings = pca.components_.T * np.sqrt(pca.explained_variance_)  # Cargas (vectores de las variables)
-
-# Obtenemos la varianza explicada por cada componente
-exp1, exp2 = pca.explained_variance_ratio_[:2] * 100
-
-# Ajustamos la escala de las flechas para que quepan dentro del gráfico
-sx = scores[:, 0]; sy = scores[:, 1]
-rx = (sx.max() - sx.min()); ry = (sy.max() - sy.min())
-scale = 0.9 * min(rx, ry) / np.max(np.sqrt((loadings**2).sum(axis=1)))
-
-
-# 5. Visualización: biplot con puntos (muestras) y flechas (variables)
-
-sns.set_theme(style="whitegrid", context="notebook")
-fig, ax = plt.subplots(figsize=(10, 7))
-
-# Dibujamos los puntos de las muestras, coloreados por tipo de cobertura
-sns.scatterplot(x=scores[:, 0], y=scores[:, 1],
-                hue=meta["land_cover"], s=35, alpha=0.8, ax=ax)
-
-# Dibujamos flechas que representan las variables y su dirección de influencia
-idx_vars = np.argsort(np.linalg.norm(loadings, axis=1))[::-1][:10]  # seleccionamos las más influyentes
-for i in idx_vars:
-    vx, vy = loadings[i, 0] * scale, loadings[i, 1] * scale
-    ax.arrow(0, 0, vx, vy, width=0.01, head_width=0.15, head_length=0.2,
-             length_includes_head=True, color="black", alpha=0.7)
-    ax.text(vx * 1.05, vy * 1.05, var_labels[i],
-            fontsize=8, ha="center", va="center")
 
-# Añadimos líneas de referencia y etiquetas
-ax.axhline(0, color="gray", lw=0.6)
-ax.axvline(0, color="gray", lw=0.6)
-ax.set_xlabel(f"PC1 ({exp1:.1f}%)", fontsize=11)
-ax.set_ylabel(f"PC2 ({exp2:.1f}%)", fontsize=11)
-ax.set_title("PCA Biplot: estructura multivariante", fontsize=13, pad=10)
-ax.legend(title="Cobertura", bbox_to_anchor=(1.02, 1), loc="upper left", fontsize=9, title_fontsize=9)
 
-# Guardamos el gráfico final
-plt.tight_layout()
-out = PROJECT_ROOT / "outputs" / "grafico4_pca_biplot.png"
-out.parent.mkdir(parents=True, exist_ok=True)
-plt.savefig(out, dpi=300)
-plt.show()
+# 3. Estandarización y cálculo del PCA
+
+@traced()
+def calcular_pca(df: pd.DataFrame, variables=VARS_NUM) -> dict:
+    """
+    Estandariza las variables y calcula un PCA de dos componentes a partir de
+    la matriz de correlación de Pearson (motor compartido con el heatmap;
+    equivale a StandardScaler + PCA de sklearn, con su misma convención de signos).
+    Devuelve scores, loadings, varianza explicada (%), etiquetas y coberturas.
+    """
+    variables = [c for c in variables if c in df.columns]
+
+    # Creamos una matriz limpia solo con valores numéricos
+    X = df[variables].apply(pd.to_numeric, errors="coerce").dropna(how="any").copy()
+    # Las variables constantes (p.ej. dentro de una región pequeña) no se pueden estandarizar
+    X = X.loc[:, X.nunique() > 1]
+    variables = list(X.columns)
+    # Guardamos las etiquetas de cobertura del suelo para colorear los puntos
+    meta = df.loc[X.index, ["land_cover"]].copy()
+    meta["land_cover"] = meta["land_cover"].astype("category")
+
+    # Estandarizamos para que todas las variables tengan igual peso
+    A = X.to_numpy(dtype=np.float64)
+    Xz = (A - A.mean(axis=0)) / A.std(axis=0)
+
+    # Componentes principales = autovectores de la matriz de correlación
+    C = correlaciones(X, variables, method="pearson").to_numpy()
+    components, eigvals, ratio = pca_from_corr(C, n_components=2)
+    n = len(A)
+    scores = Xz @ components                                      # Coordenadas de las muestras
+    loadings = components * np.sqrt(eigvals * n / (n - 1))      # Cargas (vectores de las variables)
+
+    return {
+        "scores": scores,
+        "loadings": loadings,
+        "explained": ratio * 100,  # Varianza explicada por componente
+        "var_labels": [REN.get(c, c) for c in X.columns],
+        "meta": meta,
+    }
+
+
+@traced()
+def calcular_pca_streaming(df=None, variables=VARS_NUM, chunksize: int = 1_000_000,
+                           model: Optional[StreamingPCA] = None, region=None) -> dict:
+    """
+    Igual que calcular_pca pero por bloques (utils.pca.StreamingPCA): una
+    pasada acumula medias y co-momentos, otra proyecta cada bloque. Sin ``df``
+    los bloques salen de iter_joined. Con ``model`` (ya ajustado) no se
+    reajusta: solo se proyectan las muestras. Devuelve además "model".
+    Con ``region`` solo entran los suelos de esa región (ver utils.spatial).
+    """
+    filters = region_filters(region) if df is None else []
+    if df is not None:
+        df = restrict(df, region)
+
+    def bloques():
+        if df is not None:
+            return chunks_of(df, chunksize)
+        cols = [*variables, "land_cover"]
+        return iter_joined(columns=cols, filters=filters, chunksize=chunksize)
+
+    if model is None:
+        presentes = [c for c in variables if df is None or c in df.columns]
+        model = StreamingPCA(presentes, n_components=2).fit(bloques())
+
+    scores, covers = [], []
+    for chunk in bloques():
+        s, idx = model.transform(chunk)
+        scores.append(s)
+        covers.append(chunk.loc[idx, "land_cover"])
+    meta = pd.DataFrame({"land_cover": pd.concat(covers, ignore_index=True).astype("category")})
+
+    return {
+        "scores": np.concatenate(scores) if scores else np.empty((0, 2)),
+        "loadings": model.loadings_,
+        "explained": model.explained_variance_ratio_[:2] * 100,
+        "var_labels": [REN.get(c, c) for c in model.variables],
+        "meta": meta,
+        "model": model,
+    }
+
+
+# 4. Visualización: biplot con puntos (muestras) y flechas (variables)
+
+@traced()
+def build(df=None, variables=VARS_NUM, streaming: bool = False, chunksize: int = 1_000_000,
+          model: Optional[StreamingPCA] = None, region=None):
+    """
+    Construye la figura del Gráfico 4 y devuelve (fig, datos), con datos = el
+    resultado de calcular_pca. ``df`` es la tabla unida (por defecto load_joined()).
+    Con ``streaming`` (o un ``model`` ya ajustado) usa calcular_pca_streaming y
+    la tabla se procesa por bloques de ``chunksize`` filas.
+    ``region`` (p.ej. "radius:12.5:55.7:300", ver utils.spatial) limita la
+    figura a los suelos de esa región.
+    """
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    if streaming or model is not None:
+        res = calcular_pca_streaming(df, variables, chunksize, model, region)
+    else:
+        if df is None:
+            df = load_joined(columns=[*variables, "land_cover"], filters=region_filters(region))
+        else:
+            df = restrict(df, region)
+        res = calcular_pca(df, variables)
+    scores, loadings, meta, var_labels = res["scores"], res["loadings"], res["meta"], res["var_labels"]
+    exp1, exp2 = res["explained"]
+
+    # Ajustamos la escala de las flechas para que quepan dentro del gráfico
+    sx = scores[:, 0]; sy = scores[:, 1]
+    rx = (sx.max() - sx.min()); ry = (sy.max() - sy.min())
+    scale = 0.9 * min(rx, ry) / np.max(np.sqrt((loadings**2).sum(axis=1)))
+
+    sns.set_theme(style="whitegrid", context="notebook")
+    fig, ax = plt.subplots(figsize=(10, 7))
+
+    # Dibujamos los puntos de las muestras, coloreados por tipo de cobertura
+    sns.scatterplot(x=scores[:, 0], y=scores[:, 1],
+                    hue=meta["land_cover"], s=35, alpha=0.8, ax=ax)
+
+    # Dibujamos flechas que representan las variables y su dirección de influencia
+    idx_vars = np.argsort(np.linalg.norm(loadings, axis=1))[::-1][:10]  # seleccionamos las más influyentes
+    for i in idx_vars:
+        vx, vy = loadings[i, 0] * scale, loadings[i, 1] * scale
+        ax.arrow(0, 0, vx, vy, width=0.01, head_width=0.15, head_length=0.2,
+                 length_includes_head=True, color="black", alpha=0.7)
+        ax.text(vx * 1.05, vy * 1.05, var_labels[i],
+                fontsize=8, ha="center", va="center")
+
+    # Añadimos líneas de referencia y etiquetas
+    ax.axhline(0, color="gray", lw=0.6)
+    ax.axvline(0, color="gray", lw=0.6)
+    ax.set_xlabel(f"PC1 ({exp1:.1f}%)", fontsize=11)
+    ax.set_ylabel(f"PC2 ({exp2:.1f}%)", fontsize=11)
+    ax.set_title("PCA Biplot: estructura multivariante", fontsize=13, pad=10)
+    ax.legend(title="Cobertura", bbox_to_anchor=(1.02, 1), loc="upper left", fontsize=9, title_fontsize=9)
+
+    fig.tight_layout()
+    return fig, res
+
+
+def main(args):
+    import matplotlib.pyplot as plt
+
+    model = StreamingPCA.load(args.model) if args.model and not args.refit and Path(args.model).exists() else None
+    fig, res = build(streaming=args.streaming, chunksize=args.chunksize, model=model, region=args.region)
+    if args.model and "model" in res and model is None:
+        res["model"].save(Path(args.model))
+
+    # Guardamos el gráfico final
+    out = PROJECT_ROOT / "outputs" / "grafico4_pca_biplot.png"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with stage("grafico_pca_biplot.savefig", dpi=300):
+        fig.savefig(out, dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gráfico 4: biplot del PCA")
+    parser.add_argument("--streaming", action="store_true",
+                        help="PCA por bloques (medias y co-momentos acumulados), sin cargar la tabla entera")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="filas por bloque en modo streaming")
+    parser.add_argument("--model", default=None,
+                        help="JSON del modelo: se carga si existe (sin reajustar) o se guarda tras ajustar")
+    parser.add_argument("--refit", action="store_true", help="reajustar aunque exista --model")
+    parser.add_argument("--region", default=None, help=REGION_HELP)
+    args = parser.parse_args()
+    args.streaming = args.streaming or bool(args.model)
+    main(args)
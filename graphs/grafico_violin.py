@@ -1,8 +1,6 @@
 import argparse
 from pathlib import Path
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 import sys
 
 # Aseguramos que el script pueda importar los módulos del proyecto
@@ -11,21 +9,46 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 # Importamos funciones para cargar y preparar los datos
-from utils.load_data import load_env_micro, prep_graph1  # noqa: E402
-
-
-def main(args):
-    # Cargamos los datos ambientales y microbianos
-    df_env, df_micro = load_env_micro()
+from utils.load_data import load_joined, prep_graph1  # noqa: E402
+from utils.sampling import stratified_sample  # noqa: E402
+from utils.spatial import REGION_HELP, region_filters, restrict  # noqa: E402
+from utils.trace import stage, traced  # noqa: E402
+
+
+@traced()
+def build(df=None, min_n: int = 5, log: bool = False, max_points=None, prepared=None, region=None):
+    """
+    Construye la figura del Gráfico 1 y devuelve (fig, datos), donde datos es
+    un dict con la tabla limpia ("df"), el orden de categorías ("order") y la
+    columna graficada ("y"). ``df`` es la tabla unida (por defecto load_joined()).
+    Con ``max_points`` la capa de puntos usa un submuestreo estratificado por
+    land_cover; violines, cuartiles y líneas globales usan todos los datos.
+    ``prepared`` es un par (tabla limpia, orden) ya calculado con ese min_n
+    (p.ej. por graphs/sweep.py); si se da, no se carga ni se prepara nada.
+    ``region`` (p.ej. "radius:12.5:55.7:300", ver utils.spatial) limita la
+    figura a los suelos de esa región.
+    """
+    # Librerías de dibujo: se importan al construir, no al importar el módulo
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    if prepared is not None:
+        df, order = prepared
+    else:
+        # Cargamos la tabla unida, solo con las columnas que usa el gráfico
+        if df is None:
+            df = load_joined(columns=["land_cover", "respiration_rate"], filters=region_filters(region))
+        else:
+            df = restrict(df, region)
 
-    # Combinamos los dataframes y filtramos categorías con pocas observaciones
-    df, order = prep_graph1(df_env, df_micro, min_n=args.min_n)
+        # Limpiamos y filtramos categorías con pocas observaciones
+        df, order = prep_graph1(df, min_n=min_n)
 
     # Definimos la variable dependiente: tasa de respiración microbiana
     y = "respiration_rate"
 
     # Si se activa la opción log, transformamos los valores a log10
-    if args.log:
+    if log:
         df = df[df[y] > 0].copy()
         df["resp_log10"] = np.log10(df[y])
         yplot = "resp_log10"
@@ -45,8 +68,9 @@ def main(args):
     )
 
     # Añadimos los puntos individuales sobre el violín (distribución de los datos reales)
+    puntos = df if max_points is None else stratified_sample(df, "land_cover", max_points)
     sns.stripplot(
-        data=df, x="land_cover", y=yplot, order=order,
+        data=puntos, x="land_cover", y=yplot, order=order,
         jitter=0.15, size=3.5, alpha=0.7,
         color="Orange",
         zorder=3,
@@ -55,7 +79,7 @@ def main(args):
 
     # Colocamos los títulos, etiquetas y rotamos los nombres del eje X
     ax.set_xlabel("Cobertura del suelo (land_cover)")
-    ax.set_ylabel("Tasa de respiración (log10)" if args.log else "Tasa de respiración")
+    ax.set_ylabel("Tasa de respiración (log10)" if log else "Tasa de respiración")
     ax.set_title("Distribución de tasas de respiración por tipo de cobertura")
     ax.tick_params(axis="x", rotation=35)
 
@@ -65,17 +89,30 @@ def main(args):
     ax.axhline(vals.median(), ls=":", lw=1.2, label="Mediana global")
     ax.legend(loc="upper right")
 
-    # Creamos la carpeta de salida y guardamos la figura generada
+    # Ajustamos el diseño final
+    fig.tight_layout()
+    return fig, {"df": df, "order": order, "y": yplot}
+
+
+def output_name(log: bool = False, boxen: bool = False, strip: bool = False) -> str:
+    """Nombre del PNG según las opciones (grafico1_violin[_log][_boxen][_strip])."""
+    suffix = "_log" if log else ""
+    if boxen: suffix += "_boxen"
+    if strip: suffix += "_strip"
+    return f"grafico1_violin{suffix}"
+
+
+def main(args):
+    import matplotlib.pyplot as plt
+
+    fig, _ = build(min_n=args.min_n, log=args.log, max_points=args.max_points, region=args.region)
+
+    # Creamos la carpeta de salida y guardamos la figura generada en formato PNG
     outdir = PROJECT_ROOT / "outputs"
     outdir.mkdir(parents=True, exist_ok=True)
-    suffix = "_log" if args.log else ""
-    if args.boxen: suffix += "_boxen"
-    if args.strip: suffix += "_strip"
-    outfile = outdir / f"grafico1_violin{suffix}.png"
-
-    # Ajustamos el diseño final y guardamos el gráfico en formato PNG
-    plt.tight_layout()
-    plt.savefig(outfile, dpi=300)
+    outfile = outdir / f"{output_name(args.log, args.boxen, args.strip)}.png"
+    with stage("grafico_violin.savefig", dpi=300):
+        fig.savefig(outfile, dpi=300)
     plt.show()
 
 
@@ -86,5 +123,8 @@ if __name__ == "__main__":
     parser.add_argument("--log", action="store_true", help="usar escala log10 de la tasa")
     parser.add_argument("--boxen", action="store_true", help="añadir capa boxen")
     parser.add_argument("--strip", action="store_true", help="añadir capa strip (puntos)")
+    parser.add_argument("--max-points", type=int, default=None,
+                        help="máximo de puntos dibujados (submuestreo estratificado por cobertura)")
+    parser.add_argument("--region", default=None, help=REGION_HELP)
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,311 @@
+"""
+Genera todas las figuras de outputs/ en una sola ejecución.
+
+  python graphs/render_all.py [--jobs N] [--only grafico1_violin ...] [--force]
+                              [--param grafico1_violin:min_n=10 ...]
+
+- Carga (y deja en la caché binaria) la tabla unida una sola vez en el proceso
+  principal; cada proceso del pool la abre después desde la caché (memoria
+  mapeada, milisegundos) y se la pasa a la función build de cada figura.
+- Reparte las figuras en un pool de procesos con backend Agg (sin ventanas).
+- Informa el tiempo de cada figura.
+- Estilo make: solo regenera una figura si cambiaron los CSV de entrada, sus
+  parámetros o el código que la genera (ver outputs/.manifest.json).
+- ``--param figura:clave=valor`` dibuja una variante con ese parámetro de su
+  build; se guarda aparte, en outputs/<figura>__<clave>=<valor>.png.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+import ast
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import os
+import sys
+import time
+
+# Aseguramos acceso al directorio raíz del proyecto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+GRAPHS_DIR = Path(__file__).resolve().parent
+OUTPUT_DIR = PROJECT_ROOT / "outputs"
+MANIFEST = OUTPUT_DIR / ".manifest.json"
+DATA_FILES = [PROJECT_ROOT / "data/environmental-data.csv", PROJECT_ROOT / "data/microbial-responses.csv"]
+
+logger = logging.getLogger("render_all")
+
+# Figura de salida (outputs/<nombre>.png) -> (módulo de graphs/, parámetros de su build)
+FIGURES = {
+    "grafico1_violin": ("grafico_violin", {"min_n": 5}),
+    "grafico2_lineas_subplots": ("grafico_facetgrid", {"n_bins": 20}),
+    "grafico3_heatmap_correlaciones_v2": ("grafico_heatmap", {}),
+    "grafico4_pca_biplot": ("grafico_pca_biplot", {}),
+    "grafico5_joint_density": ("grafico_joint_density_combined", {}),
+}
+
+# Semilla fija para las capas con azar (jitter del stripplot): salidas reproducibles
+SEED = 0
+
+_TRUE = {"1", "true", "yes", "si", "sí", "on"}
+_FALSE = {"0", "false", "no", "off", ""}
+# Argumentos de build que reciben objetos (tablas, modelos), no valores de texto
+_INTERNOS = {"df", "prepared", "resumen", "model"}
+
+
+# Parámetros: los de build(), con el tipo de su valor por defecto
+
+def figure_params(name: str) -> dict:
+    """{parámetro: valor por defecto} de la función build de la figura (sin los internos, como ``df``)."""
+    module, _ = FIGURES[name]
+    build = importlib.import_module(f"graphs.{module}").build
+    sig = inspect.signature(inspect.unwrap(build))
+    return {p.name: p.default for p in sig.parameters.values()
+            if p.name not in _INTERNOS and p.default is not inspect.Parameter.empty}
+
+
+def convert_param(raw: str, default):
+    """Convierte el texto ``raw`` (URL, línea de comandos) al tipo de ``default``; las listas van separadas por comas."""
+    if isinstance(default, bool):
+        low = raw.strip().lower()
+        if low in _TRUE:
+            return True
+        if low in _FALSE:
+            return False
+        raise ValueError(f"valor booleano no válido: {raw!r}")
+    if isinstance(default, int):
+        return int(raw)
+    if isinstance(default, float):
+        return float(raw)
+    if isinstance(default, (list, tuple)):
+        return [v.strip() for v in raw.split(",") if v.strip()]
+    if default is None:
+        # Sin tipo declarado: número si lo parece, texto si no
+        if raw.lower() in ("", "none", "null"):
+            return None
+        for cast in (int, float):
+            try:
+                return cast(raw)
+            except ValueError:
+                pass
+    return raw
+
+
+def parse_param(spec: str) -> tuple:
+    """"figura:clave=valor" -> (figura, clave, valor convertido al tipo de su defecto)."""
+    name, sep, pair = spec.partition(":")
+    key, eq, raw = pair.partition("=")
+    if not sep or not eq:
+        raise ValueError(f"Parámetro mal formado: {spec!r} (se espera figura:clave=valor)")
+    if name not in FIGURES:
+        raise ValueError(f"Figura desconocida: {name!r} (opciones: {', '.join(sorted(FIGURES))})")
+    defaults = figure_params(name)
+    if key not in defaults:
+        raise ValueError(f"{name}: parámetro no válido {key!r} (opciones: {', '.join(defaults)})")
+    return name, key, convert_param(raw, defaults[key])
+
+
+def variant_name(name: str, overrides: dict) -> str:
+    """Nombre de salida de una variante: la figura y los parámetros cambiados respecto de FIGURES."""
+    tag = "_".join(f"{k}={v}" for k, v in sorted(overrides.items()))
+    return f"{name}__{tag}" if tag else name
+
+
+# Tabla unida de cada proceso del pool (se abre una vez en _init_worker)
+_WORKER_DF = None
+
+
+def _init_worker():
+    """Cada proceso del pool dibuja sin ventanas y abre la tabla unida desde la caché."""
+    global _WORKER_DF
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    if str(PROJECT_ROOT) not in sys.path:
+        sys.path.insert(0, str(PROJECT_ROOT))
+    from utils.load_data import load_joined
+    _WORKER_DF = load_joined(mmap=True)
+
+
+def _hash_files(paths) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for p in sorted(paths):
+        h.update(p.name.encode())
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+def _local_imports(path: Path) -> set:
+    """Archivos de graphs/ y utils/ que importa ``path`` (también dentro de funciones)."""
+    found = set()
+    for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+        if isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names = [node.module, *(f"{node.module}.{a.name}" for a in node.names)]
+        elif isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        else:
+            continue
+        for mod in names:
+            parts = mod.split(".")
+            if parts[0] in ("graphs", "utils") and len(parts) == 2:
+                f = PROJECT_ROOT / parts[0] / f"{parts[1]}.py"
+                if f.exists():
+                    found.add(f)
+    return found
+
+
+def source_files(module: str) -> list:
+    """El módulo de una figura y, transitivamente, los de graphs/ y utils/ que importa."""
+    todo, seen = [GRAPHS_DIR / f"{module}.py"], set()
+    while todo:
+        path = todo.pop()
+        if path not in seen:
+            seen.add(path)
+            todo.extend(_local_imports(path) - seen)
+    return sorted(seen)
+
+
+def figure_fingerprint(name: str, params: Optional[dict] = None) -> dict:
+    """
+    Lo que determina una figura: hash de los CSV de entrada, sus parámetros y el
+    código fuente (el módulo de la figura, con sus listas de variables, más los
+    módulos de graphs/ y utils/ que importa).
+    """
+    from utils.cache import file_fingerprint
+
+    module, defaults = FIGURES[name]
+    return {
+        "inputs": {p.name: file_fingerprint(p)["sha"] for p in DATA_FILES},
+        "params": {**defaults, **(params or {})},
+        "source": _hash_files(source_files(module)),
+    }
+
+
+def _read_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def stale_reason(name: str, fingerprint: dict, manifest: dict):
+    """Motivo para regenerar la figura (o variante) ``name``, o None si está al día."""
+    if not (OUTPUT_DIR / f"{name}.png").exists():
+        return "no existe la salida"
+    old = manifest.get(name)
+    if old is None:
+        return "sin registro previo"
+    changed = [k for k in ("inputs", "params", "source") if old.get(k) != fingerprint[k]]
+    return f"cambió: {', '.join(changed)}" if changed else None
+
+
+def render_one(name: str, overrides: Optional[dict] = None) -> tuple:
+    """Construye y guarda una figura (o su variante con ``overrides``); devuelve (nombre de salida, segundos)."""
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from utils.trace import stage
+
+    module, params = FIGURES[name]
+    build = importlib.import_module(f"graphs.{module}").build
+    out_name = variant_name(name, overrides or {})
+    out = OUTPUT_DIR / f"{out_name}.png"
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    np.random.seed(SEED)
+    try:
+        # rc_context: el estilo que fija cada figura (sns.set_theme) no se filtra a la siguiente
+        with mpl.rc_context():
+            fig, _ = build(df=_WORKER_DF, **{**params, **(overrides or {})})
+            with stage(f"{module}.savefig", dpi=300):
+                fig.savefig(out, dpi=300)
+    finally:
+        plt.close("all")
+    return out_name, time.perf_counter() - t0
+
+
+def render_all(names=None, jobs=None, force: bool = False, params: Optional[dict] = None) -> dict:
+    """
+    Genera las figuras pedidas (todas por defecto) que no estén al día, o todas
+    con ``force``. Devuelve {nombre de salida: segundos} de las que se generaron.
+    ``params`` ({figura: {parámetro: valor}}) cambia parámetros de build: esas
+    figuras se guardan como variantes (ver variant_name), sin tocar la original.
+    Con ``names``, ``params`` solo puede referirse a figuras de ``names``.
+    """
+    from utils.load_data import load_joined
+
+    params = params or {}
+    names = list(names or (params if params else FIGURES))
+    unknown = (set(names) | set(params)) - set(FIGURES)
+    if unknown:
+        raise KeyError(f"Figuras desconocidas: {sorted(unknown)}")
+    ignored = set(params) - set(names)
+    if ignored:
+        raise ValueError(f"Parámetros para figuras no pedidas: {sorted(ignored)}")
+
+    # Decidimos qué figuras hay que rehacer (y lo dejamos en el log)
+    manifest = _read_manifest()
+    outs = {n: variant_name(n, params.get(n, {})) for n in names}
+    prints = {outs[n]: figure_fingerprint(n, params.get(n)) for n in names}
+    todo = []
+    for n in names:
+        reason = "forzado" if force else stale_reason(outs[n], prints[outs[n]], manifest)
+        if reason is None:
+            logger.info("%s: al día, se omite", outs[n])
+        else:
+            logger.info("%s: se regenera (%s)", outs[n], reason)
+            todo.append(n)
+    if not todo:
+        return {}
+
+    # Carga única: deja los CSV y la unión en la caché antes de repartir el trabajo
+    t0 = time.perf_counter()
+    load_joined()
+    timings = {"(carga de datos)": time.perf_counter() - t0}
+
+    jobs = jobs or min(len(todo), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        futures = [pool.submit(render_one, n, params.get(n)) for n in todo]
+        for fut in as_completed(futures):
+            name, secs = fut.result()
+            timings[name] = secs
+            # Registramos cada figura en cuanto termina (un fallo posterior no la invalida)
+            manifest[name] = prints[name]
+            MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+            MANIFEST.write_text(json.dumps(manifest, indent=1, ensure_ascii=False), encoding="utf-8")
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera todas las figuras en un solo proceso")
+    parser.add_argument("--jobs", type=int, default=None, help="procesos en paralelo (por defecto: nº de CPUs)")
+    parser.add_argument("--only", nargs="+", choices=sorted(FIGURES), help="generar solo estas figuras")
+    parser.add_argument("--force", action="store_true", help="regenerar aunque estén al día")
+    parser.add_argument("--param", action="append", default=[], metavar="FIGURA:CLAVE=VALOR",
+                        help="parámetro de build para una variante (se puede repetir)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    overrides = {}
+    for spec in args.param:
+        try:
+            name, key, value = parse_param(spec)
+        except ValueError as exc:
+            parser.error(str(exc))
+        overrides.setdefault(name, {})[key] = value
+    if args.only:
+        ignored = sorted(set(overrides) - set(args.only))
+        if ignored:
+            parser.error(f"--param para figuras que no están en --only: {', '.join(ignored)}")
+    t_total = time.perf_counter()
+    timings = render_all(args.only, args.jobs, force=args.force, params=overrides)
+    width = max((len(n) for n in timings), default=5)
+    for name, secs in timings.items():
+        print(f"{name:<{width}}  {secs:7.2f} s")
+    print(f"{'total':<{width}}  {time.perf_counter() - t_total:7.2f} s")
@@ -0,0 +1,347 @@
+"""
+Almacén persistente de estadísticas fusionables, actualizado solo con lo nuevo.
+
+  python graphs/stats_store.py [update|info] [--full]
+
+Guarda agregados que se pueden combinar (conteos, sumas, co-momentos y sketches
+KLL), por cobertura del suelo y por suelo, y la posición en bytes hasta la que
+leyó data/microbial-responses.csv. En cada ``update`` se leen solo las filas
+añadidas desde esa posición, así que el coste es proporcional a las filas
+nuevas y no a toda la historia. De los agregados salen las entradas de las
+figuras sin volver a leer los datos:
+  - orden y conteos por cobertura del Gráfico 1 (medianas desde sketches KLL);
+  - cuantiles por intervalo de tiempo del Gráfico 2: un sketch por celda de
+    una rejilla fina de tiempo (``decimales``), que se reagrupa al consultar
+    en los ``n_bins`` intervalos del rango actual de cada cobertura. Un tiempo
+    fuera del rango solo añade celdas y amplía el rango;
+  - correlaciones de Pearson y PCA del Gráfico 4 (StreamingPCA por cobertura).
+
+Se reconstruye desde cero cuando el archivo no es una extensión del anterior
+(más corto o con bytes ya leídos modificados), cuando cambia la tabla
+ambiental o los parámetros. Lo ya leído se guarda como hashes por bloques:
+si tamaño y mtime no cambiaron no se lee nada (como file_fingerprint en
+utils.cache); si cambiaron, se comprueba primero el bloque que acaba en la
+posición guardada y después el resto, parando en el primero distinto; tras
+un delta solo se recalculan los bloques desde esa posición. La correlación de Spearman del heatmap
+depende de los rangos globales y no se puede mantener por incrementos; el
+almacén ofrece la de Pearson.
+"""
+import argparse
+from pathlib import Path
+from typing import Optional
+import hashlib
+import json
+import logging
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Aseguramos acceso al directorio raíz del proyecto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.cache import _HASH_BLOCK, CACHE_DIR, _write_json_atomic, cache_key
+from utils.load_data import csv_complete_end, csv_data_start, iter_csv_range, join_env_micro, load_env
+from utils.pca import StreamingPCA
+from utils.quantiles import assign_bins, edges_from_range
+from utils.sketches import BinnedSketches, KLLSketch
+from graphs.grafico_facetgrid import preparar_long
+from graphs.grafico_pca_biplot import VARS_NUM
+
+logger = logging.getLogger("stats_store")
+
+ENV_PATH = PROJECT_ROOT / "data/environmental-data.csv"
+MICRO_PATH = PROJECT_ROOT / "data/microbial-responses.csv"
+
+# Versión del formato del JSON: un almacén de otra versión se reconstruye
+_FORMAT = 3
+# Tamaño de los bloques con hash propio de lo ya leído
+_PREFIX_BLOCK = 16 * _HASH_BLOCK
+# Tasas acumuladas por suelo: (columna, clave corta)
+_TASAS = [("respiration_rate", "resp"), ("bacterial_growth_rate", "bact"), ("fungal_growth_rate", "fung")]
+
+
+def _range_hash(fh, start: int, stop: int) -> str:
+    """Hash de los bytes [start, stop) de un archivo abierto en binario."""
+    h = hashlib.blake2b(digest_size=16)
+    fh.seek(start)
+    left = stop - start
+    while left > 0:
+        block = fh.read(min(_HASH_BLOCK, left))
+        if not block:
+            break
+        h.update(block)
+        left -= len(block)
+    return h.hexdigest()
+
+
+def _block_hashes(path: Path, offset: int, first: int = 0) -> list:
+    """Hashes de los bloques de ``_PREFIX_BLOCK`` bytes de [0, offset), desde el bloque ``first``."""
+    with open(path, "rb") as fh:
+        return [_range_hash(fh, a, min(a + _PREFIX_BLOCK, offset))
+                for a in range(first * _PREFIX_BLOCK, offset, _PREFIX_BLOCK)]
+
+
+class StatsStore:
+    """
+    Agregados de la tabla unida (micro + env) guardados en JSON.
+      - path: archivo del almacén (por defecto, en la caché: stats/<csv>.json).
+      - n_bins: intervalos del Gráfico 2 por defecto (se aplican al consultar).
+      - decimales: resolución de la rejilla fina de tiempo (10^-decimales). Con
+        tiempos registrados con esos decimales, el reagrupado es exacto; con
+        más, cada valor se asigna al intervalo del centro de su celda.
+      - k, seed: parámetros de los sketches.
+    """
+
+    def __init__(self, path: Optional[Path] = None, micro_path: Path = MICRO_PATH, env_path: Path = ENV_PATH,
+                 n_bins: int = 20, k: int = 200, seed: int = 0, decimales: int = 2):
+        self.micro_path = Path(micro_path)
+        self.env_path = Path(env_path)
+        self.path = Path(path) if path is not None else CACHE_DIR / "stats" / f"{self.micro_path.stem}.json"
+        self.n_bins = n_bins
+        self.params = {"decimales": decimales, "k": k, "seed": seed, "variables": list(VARS_NUM)}
+        self._reset()
+        self._loaded = self._load()
+
+    # --- estado -------------------------------------------------------------
+
+    def _reset(self) -> None:
+        self.offset = None
+        self.blocks = []      # hashes por bloque de los bytes [0, offset) ya leídos
+        self.stat = None      # [tamaño, mtime_ns] del CSV en la última actualización
+        self.env_key = None
+        self.n_rows = 0
+        self.resp = {}        # cobertura -> KLLSketch de respiration_rate
+        self.soils = {}       # soil_number -> {"land_cover", "n_resp", "sum_resp", ...}
+        self.pca_parts = {}   # cobertura -> StreamingPCA (acumulados sin finalizar)
+        self.ranges = {}      # cobertura -> [t_min, t_max] del formato largo
+        self.cells = {}       # (cobertura, tipo, celda de tiempo) -> KLLSketch de growth_rate
+
+    def _load(self) -> bool:
+        try:
+            d = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if d.get("format") != _FORMAT or d.get("params") != self.params:
+            return False
+        seed = self.params["seed"]
+        self.offset, self.blocks, self.stat = d["offset"], d["blocks"], d["stat"]
+        self.env_key, self.n_rows = d["env_key"], d["n_rows"]
+        self.resp = {c: KLLSketch.from_dict(s, seed=seed) for c, s in d["resp"].items()}
+        self.soils = {int(s): v for s, v in d["soils"].items()}
+        self.pca_parts = {c: StreamingPCA.from_dict(p) for c, p in d["pca"].items()}
+        self.ranges = d["ranges"]
+        self.cells = {(c, t, int(i)): KLLSketch.from_dict(sk, seed=seed) for c, t, i, sk in d["cells"]}
+        return True
+
+    def save(self) -> None:
+        _write_json_atomic(self.path, {
+            "format": _FORMAT,
+            "params": self.params,
+            "offset": self.offset,
+            "blocks": self.blocks,
+            "stat": self.stat,
+            "env_key": self.env_key,
+            "n_rows": self.n_rows,
+            "resp": {c: s.to_dict() for c, s in self.resp.items()},
+            "soils": {str(s): v for s, v in self.soils.items()},
+            "pca": {c: p.to_dict() for c, p in self.pca_parts.items()},
+            "ranges": self.ranges,
+            "cells": [[c, t, i, sk.to_dict()] for (c, t, i), sk in self.cells.items()],
+        })
+
+    # --- actualización ------------------------------------------------------
+
+    def _stale_reason(self, env_key: str, end: int, stat: list) -> Optional[str]:
+        if not self._loaded or self.offset is None:
+            return "sin almacén previo"
+        if env_key != self.env_key:
+            return "tabla ambiental modificada"
+        if end < self.offset:
+            return "el CSV es más corto que lo ya leído"
+        if stat == self.stat:
+            return None
+        # El bloque que acaba en la posición guardada primero: detecta reescrituras sin leer todo
+        last = len(self.blocks) - 1
+        with open(self.micro_path, "rb") as fh:
+            for i in ([last, *range(last)] if last >= 0 else []):
+                a = i * _PREFIX_BLOCK
+                if _range_hash(fh, a, min(a + _PREFIX_BLOCK, self.offset)) != self.blocks[i]:
+                    return "bytes ya leídos modificados"
+        return None
+
+    def _joined_chunks(self, df_env: pd.DataFrame, start: int, end: int):
+        for chunk in iter_csv_range(self.micro_path, start, end):
+            yield len(chunk), join_env_micro(df_env, chunk)
+
+    def _ingest_facet(self, long: pd.DataFrame) -> None:
+        """Gráfico 2: rango de tiempo por cobertura y un sketch por (cobertura, tipo, celda)."""
+        k, seed = self.params["k"], self.params["seed"]
+        scale = 10 ** self.params["decimales"]
+        for cover, t in long.groupby("land_cover", observed=True)["time"]:
+            lo, hi = self.ranges.get(str(cover), (np.inf, -np.inf))
+            self.ranges[str(cover)] = [float(min(lo, t.min())), float(max(hi, t.max()))]
+        for (cover, typ), d in long.groupby(["land_cover", "type"], observed=True, sort=False):
+            cells = np.rint(d["time"].to_numpy(dtype=np.float64) * scale).astype(np.int64)
+            vals = d["growth_rate"].to_numpy(dtype=np.float64)
+            order = np.argsort(cells, kind="stable")
+            cells, vals = cells[order], vals[order]
+            starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+            for s0, s1 in zip(starts, np.r_[starts[1:], len(cells)]):
+                key = (str(cover), str(typ), int(cells[s0]))
+                if key not in self.cells:
+                    self.cells[key] = KLLSketch(k, seed=seed)
+                self.cells[key].update(vals[s0:s1])
+
+    def _ingest(self, joined: pd.DataFrame) -> None:
+        k, seed = self.params["k"], self.params["seed"]
+        # Gráfico 1: conteo y sketch de respiración por cobertura
+        d = joined[["land_cover", "respiration_rate"]].dropna()
+        for cover, vals in d.groupby("land_cover", sort=False)["respiration_rate"]:
+            self.resp.setdefault(str(cover), KLLSketch(k, seed=seed)).update(vals.to_numpy())
+
+        # Conteos y sumas por suelo
+        cols = [c for c, _ in _TASAS]
+        g = joined.groupby("soil_number")[cols].agg(["count", "sum"])
+        covers = joined.drop_duplicates("soil_number").set_index("soil_number")["land_cover"]
+        for soil, row in zip(g.index, g.to_numpy()):
+            cover = covers.get(soil)
+            rec = self.soils.setdefault(int(soil), {"land_cover": cover if isinstance(cover, str) else None})
+            for j, (_, short) in enumerate(_TASAS):
+                rec[f"n_{short}"] = rec.get(f"n_{short}", 0) + int(row[2 * j])
+                rec[f"sum_{short}"] = rec.get(f"sum_{short}", 0.0) + float(row[2 * j + 1])
+
+        # Co-momentos (correlación y PCA) por cobertura
+        variables = [c for c in self.params["variables"] if c in joined.columns]
+        for cover, part in joined.groupby("land_cover", sort=False):
+            self.pca_parts.setdefault(str(cover), StreamingPCA(variables)).partial_fit(part)
+
+        # Gráfico 2: sketches por celda fina de tiempo
+        self._ingest_facet(preparar_long(joined))
+
+    def update(self, full: bool = False) -> dict:
+        """
+        Incorpora las filas añadidas al CSV desde la última actualización (o todo,
+        si hace falta reconstruir). Devuelve {"mode": "none"|"delta"|"full",
+        "rows": filas leídas, "reason": motivo de la reconstrucción}.
+        """
+        st = self.micro_path.stat()
+        stat = [st.st_size, st.st_mtime_ns]
+        start = csv_data_start(self.micro_path)
+        end = csv_complete_end(self.micro_path)
+        env_key = cache_key(self.env_path)
+
+        reason = "reconstrucción pedida" if full else self._stale_reason(env_key, end, stat)
+        if reason is None and end == self.offset:
+            if stat != self.stat:  # comprobado: se guarda para no volver a leerlo
+                self.stat = stat
+                self.save()
+            return {"mode": "none", "rows": 0, "reason": None}
+
+        if reason is None:
+            read_from, mode = self.offset, "delta"
+        else:
+            logger.info("Reconstruyendo el almacén de estadísticas: %s", reason)
+            self._reset()
+            read_from, mode = start, "full"
+
+        df_env = load_env(self.env_path)
+        rows = 0
+        for n, joined in self._joined_chunks(df_env, read_from, end):
+            self._ingest(joined)
+            rows += n
+        self.n_rows += rows
+        # Los bloques completos antes de lo ya leído no cambian
+        keep = read_from // _PREFIX_BLOCK if mode == "delta" else 0
+        self.blocks = self.blocks[:keep] + _block_hashes(self.micro_path, end, keep)
+        self.offset, self.env_key, self.stat = end, env_key, stat
+        self._loaded = True
+        self.save()
+        return {"mode": mode, "rows": rows, "reason": reason}
+
+    # --- entradas de las figuras -------------------------------------------
+
+    def orden_grafico1(self, min_n: int = 5):
+        """
+        (orden de coberturas por mediana de respiración descendente, conteos),
+        como prep_graph1, a partir de los sketches.
+        """
+        counts = pd.Series({c: s.n for c, s in self.resp.items()}, dtype="int64")
+        valid = [c for c in counts.index if not min_n or counts[c] >= min_n]
+        medians = pd.Series({c: float(self.resp[c].quantile(0.5)[0]) for c in valid}, dtype="float64")
+        return medians.sort_values(ascending=False).index.tolist(), counts
+
+    def facet_sketches(self, n_bins: Optional[int] = None) -> BinnedSketches:
+        """
+        BinnedSketches del Gráfico 2 con ``n_bins`` intervalos (por defecto los
+        del almacén) sobre el rango actual de cada cobertura, fusionando los
+        sketches de las celdas finas de cada intervalo.
+        """
+        n_bins = n_bins or self.n_bins
+        scale = 10 ** self.params["decimales"]
+        edges = {c: edges_from_range(lo, hi, n_bins) for c, (lo, hi) in self.ranges.items()}
+        out = BinnedSketches(edges, k=self.params["k"], seed=self.params["seed"])
+        por_cobertura = {}
+        for key in sorted(self.cells):
+            por_cobertura.setdefault(key[0], []).append(key)
+        for cover, keys in por_cobertura.items():
+            t = np.array([cell for _, _, cell in keys], dtype=np.float64) / scale
+            for (_, typ, cell), b in zip(keys, assign_bins(t, edges[cover][None, :])):
+                if b < 0:
+                    continue
+                key, sk = (cover, typ, int(b)), self.cells[(cover, typ, cell)]
+                if key in out.sketches:
+                    out.sketches[key].merge(sk)
+                else:
+                    out.sketches[key] = KLLSketch.from_dict(sk.to_dict(), seed=self.params["seed"])
+        return out
+
+    def resumen_facet(self, n_bins: Optional[int] = None) -> dict:
+        """{cobertura: cuantiles por intervalo}, como resumen_por_cobertura del Gráfico 2."""
+        if not self.cells:
+            return {}
+        q = self.facet_sketches(n_bins).summary().dropna(subset=["q50"])
+        return {c: d.drop(columns="land_cover").reset_index(drop=True)
+                for c, d in q.groupby("land_cover", observed=True)}
+
+    def pca(self, land_cover=None) -> StreamingPCA:
+        """StreamingPCA ajustado con los co-momentos de todas (o algunas) coberturas."""
+        covers = sorted(self.pca_parts) if land_cover is None else list(np.atleast_1d(land_cover))
+        if not covers:
+            raise ValueError("El almacén no tiene co-momentos (ejecuta update primero)")
+        out = StreamingPCA(self.pca_parts[covers[0]].variables)
+        for c in covers:
+            out.merge(self.pca_parts[c])
+        return out.finalize()
+
+    def correlacion(self, land_cover=None) -> pd.DataFrame:
+        """Matriz de Pearson (filas completas) desde los co-momentos acumulados."""
+        model = self.pca(land_cover)
+        m2 = model._m2
+        d = np.sqrt(np.diag(m2))
+        return pd.DataFrame(m2 / np.outer(d, d), index=model.variables, columns=model.variables)
+
+    def medias_por_suelo(self) -> pd.DataFrame:
+        """Conteo y media de cada tasa por suelo."""
+        df = pd.DataFrame.from_dict(self.soils, orient="index").rename_axis("soil_number").sort_index()
+        for _, short in _TASAS:
+            df[f"mean_{short}"] = df[f"sum_{short}"] / df[f"n_{short}"].replace(0, np.nan)
+        return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Almacén incremental de estadísticas")
+    parser.add_argument("accion", choices=["update", "info"], nargs="?", default="update")
+    parser.add_argument("--full", action="store_true", help="reconstruir desde cero")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    store = StatsStore()
+    if args.accion == "update":
+        res = store.update(full=args.full)
+        print(f"{res['mode']}: {res['rows']} filas" + (f" ({res['reason']})" if res["reason"] else ""))
+    print(f"{store.path}: {store.n_rows} filas hasta el byte {store.offset}")
+    orden, counts = store.orden_grafico1()
+    print("Gráfico 1:", ", ".join(f"{c} (n={counts[c]})" for c in orden))
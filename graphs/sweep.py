@@ -0,0 +1,265 @@
+"""
+Barridos de parámetros: muchas variantes de las figuras compartiendo cálculos.
+
+  python graphs/sweep.py --grid grafico1_violin min_n=1,5,10,20 log=0,1 \\
+                         --grid grafico2_lineas_subplots n_bins=10,20,50 [--jobs N] [--out DIR]
+
+Cada ``--grid`` es una figura de render_all y listas de valores por
+parámetro de su build; se generan todas las combinaciones. En vez de repetir
+carga, unión, limpieza y resúmenes por variante, el barrido arma un grafo de
+resultados intermedios compartidos y calcula cada nodo una sola vez:
+
+  joined ──> g1_base ──> g1[min_n] ──────────> violin(min_n, log)
+     └────> long ──> orden_bins ──> resumen[n_bins] ──> facet(n_bins)
+     └──────────────────────────────────────────────> resto de figuras
+
+  - g1_base: prep_graph1 sin filtro de conteos, con las medianas por cobertura;
+    cada min_n solo filtra y reordena (subset_graph1).
+  - orden_bins: tiempos ordenados por (cobertura, tipo); cada n_bins es una
+    búsqueda binaria por intervalo (rebin_quantiles), sin reordenar.
+
+Los intermedios se calculan en el proceso principal y solo las hojas (dibujo
+y savefig) se reparten en un pool de procesos. Las salidas van a
+outputs/sweep/<figura>__<param>=<valor>_....png; con los parámetros por
+defecto cada PNG es idéntico al de render_all.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from pathlib import Path
+import importlib
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+# Aseguramos acceso al directorio raíz del proyecto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs.render_all import FIGURES, SEED, convert_param, figure_params  # noqa: E402
+from utils.trace import stage  # noqa: E402
+
+logger = logging.getLogger("sweep")
+
+SWEEP_DIR = PROJECT_ROOT / "outputs/sweep"
+
+
+# 1) Grafo de intermedios: clave (tupla) -> (función, claves de las que depende)
+
+class Dag:
+    """Nodos con dependencias; ``compute`` evalúa cada nodo necesario una sola vez."""
+
+    def __init__(self):
+        self.nodes = {}
+        self.values = {}
+
+    def add(self, key: tuple, fn, *deps: tuple) -> tuple:
+        self.nodes.setdefault(key, (fn, deps))
+        return key
+
+    def compute(self, key: tuple):
+        if key not in self.values:
+            fn, deps = self.nodes[key]
+            args = [self.compute(d) for d in deps]
+            with stage(f"sweep.{key[0]}", key=repr(key[1:])):
+                self.values[key] = fn(*args)
+        return self.values[key]
+
+
+def _joined():
+    from utils.load_data import load_joined
+    return load_joined()
+
+
+def _g1_base(joined):
+    from utils.load_data import prep_graph1
+    base, _ = prep_graph1(joined, min_n=0)
+    medians = base.groupby("land_cover", observed=True)["respiration_rate"].median()
+    return base, medians
+
+
+def _g1(base, min_n):
+    from utils.load_data import subset_graph1
+    return subset_graph1(base[0], min_n, medians=base[1])
+
+
+def _long(joined):
+    from graphs.grafico_facetgrid import preparar_long
+    return preparar_long(joined[joined["time"] >= 0])
+
+
+def _orden_bins(long):
+    from graphs.grafico_facetgrid import ordenar_para_bins
+    return ordenar_para_bins(long)
+
+
+def _resumen(pre, n_bins, n_boot=0, seed=0, cache=False):
+    from graphs.grafico_facetgrid import resumen_desde_orden
+    return resumen_desde_orden(pre, n_bins=n_bins, n_boot=n_boot, seed=seed, cache=cache)
+
+
+def plan_leaf(dag: Dag, name: str, params: dict) -> dict:
+    """
+    Registra en ``dag`` los intermedios de una variante y devuelve qué nodo va
+    a cada argumento de su build ({argumento: clave}).
+    """
+    joined = dag.add(("joined",), _joined)
+    module, _ = FIGURES[name]
+    if params.get("region"):
+        # Con región, build recorta la tabla unida por su cuenta (utils.spatial)
+        return {"df": joined}
+    if module == "grafico_violin":
+        base = dag.add(("g1_base",), _g1_base, joined)
+        min_n = params.get("min_n", 5)
+        g1 = dag.add(("g1", min_n), lambda b, m=min_n: _g1(b, m), base)
+        return {"prepared": g1}
+    if module == "grafico_facetgrid" and not params.get("approx", False):
+        long = dag.add(("long",), _long, joined)
+        pre = dag.add(("orden_bins",), _orden_bins, long)
+        n_bins = params.get("n_bins", 20)
+        # Con ci, el resumen lleva además los intervalos bootstrap (una vez por n_bins/n_boot/seed)
+        boot = (params.get("n_boot", 2000), params.get("seed", 0), params.get("ci_cache", False)) \
+            if params.get("ci") else (0, 0, False)
+        res = dag.add(("resumen", n_bins, *boot), lambda p, n=n_bins, b=boot: _resumen(p, n, *b), pre)
+        return {"resumen": res}
+    return {"df": joined}
+
+
+# 2) Hojas: dibujo y savefig en los procesos del pool
+
+_SHARED: dict = {}
+
+
+def _mp_context():
+    """
+    Contexto del pool: fork en Linux, para que los procesos hereden los
+    intermedios sin serializarlos (Python 3.14 pasa a forkserver por defecto).
+    En otros sistemas, el método por defecto (spawn en Windows y macOS).
+    """
+    return multiprocessing.get_context("fork" if sys.platform.startswith("linux") else None)
+
+
+def _init_worker(shared: dict):
+    """
+    Cada proceso del pool recibe los intermedios y dibuja sin ventanas. Con
+    fork (ver _mp_context) los hereda sin copiarlos; con spawn o forkserver se
+    serializan una vez por proceso.
+    """
+    global _SHARED
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    _SHARED = shared
+
+
+def render_leaf(name: str, params: dict, inputs: dict, out: Path) -> tuple:
+    """Construye y guarda una variante; ``inputs`` = {argumento de build: clave en _SHARED}."""
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    module, _ = FIGURES[name]
+    build = importlib.import_module(f"graphs.{module}").build
+    kwargs = {arg: _SHARED[key] for arg, key in inputs.items()}
+    t0 = time.perf_counter()
+    np.random.seed(SEED)
+    try:
+        with mpl.rc_context():
+            fig, _ = build(**kwargs, **params)
+            with stage(f"{module}.savefig", dpi=300):
+                fig.savefig(out, dpi=300)
+    finally:
+        plt.close("all")
+    return out, time.perf_counter() - t0
+
+
+def expand(grids: dict) -> list:
+    """{figura: {parámetro: [valores]}} -> lista de (figura, parámetros) con todas las combinaciones."""
+    variants = []
+    for name, grid in grids.items():
+        if name not in FIGURES:
+            raise KeyError(f"Figura desconocida: {name!r}")
+        keys = list(grid)
+        for values in product(*(grid[k] for k in keys)):
+            variants.append((name, {**FIGURES[name][1], **dict(zip(keys, values))}))
+    return variants
+
+
+def output_path(name: str, params: dict, out_dir: Path) -> Path:
+    tag = "_".join(f"{k}={v}" for k, v in sorted(params.items()))
+    return out_dir / (f"{name}__{tag}.png" if tag else f"{name}.png")
+
+
+def sweep(grids: dict, jobs=None, out_dir: Path = SWEEP_DIR) -> dict:
+    """
+    Genera todas las variantes de ``grids`` ({figura: {parámetro: [valores]}})
+    compartiendo los intermedios. Devuelve {ruta de salida: segundos}.
+    """
+    variants = expand(grids)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Intermedios: un grafo para todas las variantes, evaluado en este proceso
+    dag = Dag()
+    leaves = [(name, params, plan_leaf(dag, name, params)) for name, params in variants]
+    t0 = time.perf_counter()
+    needed = {key for _, _, inputs in leaves for key in inputs.values()}
+    shared = {key: dag.compute(key) for key in needed}
+    timings = {"(intermedios)": time.perf_counter() - t0}
+    logger.info("%d variantes, %d nodos intermedios en %.2f s", len(leaves), len(dag.values),
+                timings["(intermedios)"])
+
+    tasks = [(name, params, inputs, output_path(name, params, out_dir)) for name, params, inputs in leaves]
+    jobs = jobs or min(len(tasks), os.cpu_count() or 1)
+    if jobs <= 1:
+        _init_worker(shared)
+        for task in tasks:
+            out, secs = render_leaf(*task)
+            timings[out.name] = secs
+        return timings
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=_mp_context(), initializer=_init_worker,
+                             initargs=(shared,)) as pool:
+        futures = [pool.submit(render_leaf, *task) for task in tasks]
+        for fut in as_completed(futures):
+            out, secs = fut.result()
+            timings[out.name] = secs
+    return timings
+
+
+def parse_grid(spec: list) -> tuple:
+    """["figura", "param=v1,v2", ...] -> (figura, {param: [valores convertidos]})."""
+    name, *pairs = spec
+    if name not in FIGURES:
+        raise SystemExit(f"Figura desconocida: {name!r} (opciones: {', '.join(sorted(FIGURES))})")
+    defaults = figure_params(name)
+    grid = {}
+    for pair in pairs:
+        key, sep, raw = pair.partition("=")
+        if not sep or key not in defaults:
+            raise SystemExit(f"{name}: parámetro no válido {pair!r} (opciones: {', '.join(defaults)})")
+        values = [raw] if isinstance(defaults[key], (list, tuple)) else raw.split(",")
+        grid[key] = [convert_param(v, defaults[key]) for v in values]
+    return name, grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera variantes de figuras compartiendo los cálculos intermedios")
+    parser.add_argument("--grid", nargs="+", action="append", required=True, metavar="ARG",
+                        help="figura seguida de parametro=v1,v2,... (se puede repetir)")
+    parser.add_argument("--jobs", type=int, default=None, help="procesos para dibujar (por defecto: nº de CPUs)")
+    parser.add_argument("--out", type=Path, default=SWEEP_DIR, help="carpeta de salida")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    grids = {}
+    for spec in args.grid:
+        name, grid = parse_grid(spec)
+        grids.setdefault(name, {}).update(grid)
+    t_total = time.perf_counter()
+    timings = sweep(grids, jobs=args.jobs, out_dir=args.out)
+    width = max((len(n) for n in timings), default=5)
+    for name, secs in timings.items():
+        print(f"{name:<{width}}  {secs:7.2f} s")
+    print(f"{'total':<{width}}  {time.perf_counter() - t_total:7.2f} s")
@@ -0,0 +1,35 @@
+"""
+Configuración común de las pruebas: cada prueba usa su propia caché binaria
+en tmp_path, así que nunca lee ni modifica data/.cache del desarrollador. Los
+fixtures de módulo (que se crean antes que los de cada prueba) usan una caché
+común de la sesión.
+"""
+from pathlib import Path
+import sys
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import utils.cache  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_de_sesion(tmp_path_factory):
+    """Caché de la sesión para lo que se carga fuera de una prueba (fixtures de módulo)."""
+    cache_dir = tmp_path_factory.mktemp("cache")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(utils.cache, "CACHE_DIR", cache_dir)
+        mp.setenv("ENTREGA_CACHE_DIR", str(cache_dir))
+        yield cache_dir
+
+
+@pytest.fixture(autouse=True)
+def cache_aislada(tmp_path, monkeypatch):
+    """Redirige utils.cache.CACHE_DIR (y ENTREGA_CACHE_DIR para subprocesos) a tmp_path/cache."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(utils.cache, "CACHE_DIR", cache_dir)
+    monkeypatch.setenv("ENTREGA_CACHE_DIR", str(cache_dir))
+    return cache_dir
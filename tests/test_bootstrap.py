@@ -0,0 +1,82 @@
+"""
+Intervalos bootstrap de la mediana por intervalo (utils/quantiles.py): las
+réplicas vectorizadas son los cuantiles de cada remuestra calculados uno a
+uno, y el resultado no depende de ``jobs`` ni de la caché.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs.grafico_facetgrid import ordenar_para_bins, preparar_long  # noqa: E402
+from utils.load_data import load_joined  # noqa: E402
+from utils.quantiles import (  # noqa: E402
+    _boot_quantile_batch, _rebin_segments, bootstrap_quantile_ci, rebin_quantiles,
+)
+
+
+@pytest.fixture(scope="module")
+def pre():
+    return ordenar_para_bins(preparar_long(load_joined()))
+
+
+def _replicas_una_a_una(values: list, size: int, seed, q: float) -> np.ndarray:
+    """Referencia: mismos sorteos que _boot_quantile_batch, con np.quantile por remuestra."""
+    counts = np.array([len(v) for v in values])
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    slot_bin = np.repeat(np.arange(len(values)), counts)
+    vs = np.concatenate(values)
+    rng = np.random.default_rng(seed)
+    idx = offsets[slot_bin] + rng.integers(0, counts[slot_bin], size=(size, len(vs)))
+    return np.array([[np.quantile(vs[row[slot_bin == b]], q) for b in range(len(values))] for row in idx])
+
+
+@pytest.mark.parametrize("q", [0.5, 0.25, 0.9])
+def test_lote_igual_a_remuestras_sueltas(q):
+    rng = np.random.default_rng(2)
+    values = [np.sort(rng.lognormal(0, 1, n)) for n in (1, 2, 5, 40, 13)]
+    counts = np.array([len(v) for v in values])
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    slot_bin = np.repeat(np.arange(len(values)), counts)
+    got = _boot_quantile_batch(np.concatenate(values), 30, 7, slot_bin, offsets, counts, q)
+    np.testing.assert_allclose(got, _replicas_una_a_una(values, 30, 7, q), rtol=1e-12)
+
+
+def test_intervalos_igual_a_referencia(pre):
+    n_boot, batch, alpha = 60, 25, 0.1
+    got = bootstrap_quantile_ci(pre, n_bins=10, n_boot=n_boot, alpha=alpha, seed=3, batch=batch, jobs=1)
+
+    _, _, a0, a1 = _rebin_segments(pre, 10)
+    values = [np.sort(pre["v"][s0:s1]) for s0, s1 in zip(a0, a1)]
+    seeds = np.random.SeedSequence(3).spawn(3)
+    stack = np.concatenate([_replicas_una_a_una(values, size, ss, 0.5) for size, ss in zip([25, 25, 10], seeds)])
+    lo, hi = np.percentile(stack, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    np.testing.assert_allclose(got["ci_lo"], lo, rtol=1e-12)
+    np.testing.assert_allclose(got["ci_hi"], hi, rtol=1e-12)
+
+
+def test_mismas_filas_que_rebin_y_contiene_la_mediana(pre):
+    ci = bootstrap_quantile_ci(pre, n_bins=20, n_boot=200, seed=0, jobs=1)
+    q = rebin_quantiles(pre, n_bins=20)
+    keys = ["land_cover", "type", "bin"]
+    pd.testing.assert_frame_equal(ci[keys], q[keys])
+    assert (ci["ci_lo"] <= q["q50"]).all()
+    assert (ci["ci_hi"] >= q["q50"]).all()
+    assert (ci["ci_lo"] < ci["ci_hi"])[q["n"] > 3].all()
+
+
+def test_no_depende_de_jobs_ni_de_la_cache(pre):
+    base = bootstrap_quantile_ci(pre, n_bins=20, n_boot=300, seed=1, batch=100, jobs=1)
+    again = bootstrap_quantile_ci(pre, n_bins=20, n_boot=300, seed=1, batch=100, jobs=2)
+    pd.testing.assert_frame_equal(again, base)
+    for _ in range(2):  # la segunda llamada sale de la caché en disco
+        pd.testing.assert_frame_equal(
+            bootstrap_quantile_ci(pre, n_bins=20, n_boot=300, seed=1, batch=100, jobs=1, cache=True), base)
+    other = bootstrap_quantile_ci(pre, n_bins=20, n_boot=300, seed=2, batch=100, jobs=1)
+    assert not np.allclose(other["ci_lo"], base["ci_lo"], equal_nan=True)
@@ -0,0 +1,69 @@
+"""
+Caché columnar (utils/cache.py): el viaje de ida y vuelta conserva la tabla y
+una entrada deja de usarse en cuanto cambia su CSV.
+"""
+from pathlib import Path
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.cache import cache_info, cache_key, cached_read, clear_cache, load_frame, save_frame  # noqa: E402
+from utils.load_data import _read_csv_smart  # noqa: E402
+
+ENV = PROJECT_ROOT / "data/environmental-data.csv"
+
+
+def _contador(calls):
+    def reader(path):
+        calls.append(path)
+        return _read_csv_smart(path)
+    return reader
+
+
+def test_ida_y_vuelta():
+    df = _read_csv_smart(ENV)
+    save_frame(df, "env")
+    pd.testing.assert_frame_equal(load_frame("env"), df)
+    pd.testing.assert_frame_equal(load_frame("env", mmap=True), df)
+
+    cols = ["soil_number", "land_cover", "pH"]
+    pd.testing.assert_frame_equal(load_frame("env", columns=cols), df[cols])
+    cat = load_frame("env", columns=cols, categorical=True)
+    assert isinstance(cat["land_cover"].dtype, pd.CategoricalDtype)
+    assert cat["land_cover"].astype(str).tolist() == df["land_cover"].tolist()
+
+    rows = np.array([0, 5, 7, len(df) - 1])
+    pd.testing.assert_frame_equal(load_frame("env", rows=rows), df.iloc[rows].reset_index(drop=True))
+    assert load_frame("no-existe") is None
+
+
+def test_se_invalida_al_cambiar_el_csv(tmp_path):
+    env = tmp_path / "env.csv"
+    shutil.copy(ENV, env)
+    calls = []
+    first = cached_read(env, _contador(calls))
+    again = cached_read(env, _contador(calls))
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(again, first)
+
+    # Cambia un valor: nueva clave, se vuelve a leer y se ve el cambio
+    old_key = cache_key(env)
+    raw = env.read_bytes()
+    last = raw.rstrip(b"\n").rindex(b"\n") + 1
+    soil = str(first["soil_number"].iloc[-1]).encode()
+    env.write_bytes(raw[:last] + raw[last:].replace(soil + b",", b"999999,", 1))
+    assert cache_key(env) != old_key
+    changed = cached_read(env, _contador(calls))
+    assert len(calls) == 2
+    assert 999999 in set(changed["soil_number"])
+
+    info = cache_info()
+    assert info["stale"].sum() == 1
+    assert clear_cache(stale_only=True) == 1
+    assert not cache_info()["stale"].any()
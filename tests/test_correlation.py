@@ -0,0 +1,78 @@
+"""
+Correlaciones (utils/correlation.py): las mismas matrices que ``DataFrame.corr``
+de pandas, con filas completas o por pares.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs.grafico_pca_biplot import VARS_NUM  # noqa: E402
+from utils.correlation import _boot_batch, _dense_ranks, corr_matrix, corr_significance  # noqa: E402
+from utils.load_data import load_joined  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def datos():
+    return load_joined()[VARS_NUM].astype(np.float64)
+
+
+def _con_huecos(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia con ~15 % de NaN repartidos al azar y empates añadidos."""
+    rng = np.random.default_rng(0)
+    out = df.mask(rng.random(df.shape) < 0.15)
+    out.iloc[:, 0] = out.iloc[:, 0].round(1)
+    return out
+
+
+@pytest.mark.parametrize("method", ["spearman", "pearson"])
+def test_filas_completas_igual_a_pandas(datos, method):
+    df = _con_huecos(datos)
+    exp = df.dropna(how="any").corr(method=method)
+    for block in (256, 4):
+        pd.testing.assert_frame_equal(corr_matrix(df, method=method, block=block), exp, atol=1e-12)
+
+
+@pytest.mark.parametrize("method", ["spearman", "pearson"])
+@pytest.mark.parametrize("min_periods", [1, 590])
+def test_por_pares_igual_a_pandas(datos, method, min_periods):
+    df = _con_huecos(datos)
+    got, n = corr_matrix(df, method=method, missing="pairwise", block=5, min_periods=min_periods,
+                         return_counts=True)
+    exp = df.corr(method=method, min_periods=min_periods)
+    pd.testing.assert_frame_equal(got, exp, atol=1e-10)
+    mask = df.notna().astype(np.int64)
+    pd.testing.assert_frame_equal(n, mask.T @ mask)
+
+
+# --- significancia (bootstrap y permutaciones) --------------------------------
+
+@pytest.mark.parametrize("method", ["spearman", "pearson"])
+def test_replicas_bootstrap_igual_a_pandas(datos, method):
+    # Cada réplica del lote es la correlación de pandas sobre la misma remuestra
+    A = datos.dropna().to_numpy()[:200, :6]
+    base = _dense_ranks(A) if method == "spearman" else A
+    reps = _boot_batch(base, 5, np.random.SeedSequence(7), method)
+    idx = np.random.default_rng(np.random.SeedSequence(7)).integers(0, len(A), size=(5, len(A)))
+    for b in range(5):
+        exp = pd.DataFrame(A[idx[b]]).corr(method=method).to_numpy()
+        np.testing.assert_allclose(reps[b], exp, atol=1e-12)
+
+
+def test_significancia_no_depende_de_jobs(datos):
+    X = datos.iloc[:300, :5]
+    one = corr_significance(X, n_boot=200, n_perm=200, seed=3, jobs=1, batch=50)
+    two = corr_significance(X, n_boot=200, n_perm=200, seed=3, jobs=2, batch=50)
+    for k in ("r", "lo", "hi", "p"):
+        pd.testing.assert_frame_equal(one[k], two[k])
+    pd.testing.assert_frame_equal(one["r"], X.dropna().corr(method="spearman"), atol=1e-12)
+    off = ~np.eye(5, dtype=bool)
+    assert (one["lo"].to_numpy() <= one["r"].to_numpy() + 1e-12)[off].all()
+    assert (one["hi"].to_numpy() >= one["r"].to_numpy() - 1e-12)[off].all()
+    assert ((one["p"].to_numpy()[off] > 0) & (one["p"].to_numpy()[off] <= 1)).all()
@@ -0,0 +1,73 @@
+"""
+Servidor de figuras (graphs/figure_server.py): la caché respeta su límite en
+bytes, las peticiones se validan y recortan, y el render del servidor es el
+mismo que el de build().
+"""
+from pathlib import Path
+import io
+import sys
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import graphs.render_all as render_all  # noqa: E402
+from graphs.figure_server import ByteLRU, parse_request, render_bytes  # noqa: E402
+
+
+def test_lru_acotada_en_bytes():
+    lru = ByteLRU(10)
+    lru.put("a", b"1234")
+    lru.put("b", b"5678")
+    assert lru.get("a") == b"1234"  # "a" pasa a ser la más reciente
+    lru.put("c", b"90ab")
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (b"1234", b"90ab")
+
+    lru.put("a", b"12")  # reemplazar descuenta los bytes anteriores
+    lru.put("grande", b"x" * 11)  # no cabe: no desaloja nada
+    assert lru.get("grande") is None
+    assert lru.info() == {"entries": 2, "bytes": 6, "max_bytes": 10, "hits": 3, "misses": 2}
+
+
+def test_parse_request_valida_y_recorta():
+    params, fmt, dpi = parse_request("grafico1_violin", {"min_n": "10", "log": "1"})
+    assert (params, fmt, dpi) == ({"min_n": 10, "log": True}, "png", 300)
+
+    params, fmt, dpi = parse_request("grafico2_lineas_subplots",
+                                     {"n_bins": "100000", "jobs": "8", "fmt": "SVG", "dpi": "72"})
+    assert (params["n_bins"], params["jobs"], fmt, dpi) == (200, 1, "svg", 72)
+    assert parse_request("grafico3_heatmap_correlaciones_v2", {"alpha": "0.9"})[0]["alpha"] == 0.5
+
+    with pytest.raises(KeyError):
+        parse_request("no_existe", {})
+    for query in ({"fmt": "jpg"}, {"dpi": "5000"}, {"desconocido": "1"}, {"region": "bbox:1,2"}):
+        with pytest.raises(ValueError):
+            parse_request("grafico1_violin", query)
+
+
+def test_render_igual_a_build_directo(monkeypatch):
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import matplotlib.image as mpimg
+    import matplotlib.pyplot as plt
+    from graphs.grafico_violin import build
+    from utils.load_data import load_joined
+
+    df = load_joined()
+    monkeypatch.setattr(render_all, "_WORKER_DF", df)
+    params, fmt, dpi = parse_request("grafico1_violin", {"min_n": "10", "dpi": "60"})
+    body, secs = render_bytes("grafico1_violin", params, fmt, dpi)
+    assert body[:8] == b"\x89PNG\r\n\x1a\n" and secs >= 0
+
+    np.random.seed(render_all.SEED)
+    buf = io.BytesIO()
+    with matplotlib.rc_context():
+        fig, _ = build(df=df, min_n=10)
+        fig.savefig(buf, format="png", dpi=60)
+    plt.close("all")
+    buf.seek(0)
+    np.testing.assert_array_equal(mpimg.imread(io.BytesIO(body)), mpimg.imread(buf))
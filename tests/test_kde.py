@@ -0,0 +1,47 @@
+"""
+KDE sobre rejilla (utils/kde.py): el motor exacto es gaussian_kde de scipy y
+el FFT se aparta de él menos de un 1 % del pico.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.kde import iso_levels, kde_accuracy, kde_grid  # noqa: E402
+
+stats = pytest.importorskip("scipy.stats")
+
+
+def _bimodal(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = np.r_[rng.normal(0, 1, n // 2), rng.normal(4, 0.5, n - n // 2)]
+    return x, 0.5 * x + rng.normal(0, 1, n)
+
+
+def test_exacto_igual_a_scipy():
+    x, y = _bimodal(800)
+    xx, yy, dens = kde_grid(x, y, engine="exact", cache=False)
+    gx, gy = np.meshgrid(xx, yy)
+    exp = stats.gaussian_kde(np.vstack([x, y]))(np.vstack([gx.ravel(), gy.ravel()])).reshape(gx.shape)
+    np.testing.assert_allclose(dens, exp, rtol=1e-10, atol=1e-14)
+
+
+@pytest.mark.parametrize("n", [500, 3000])
+@pytest.mark.parametrize("bw_adjust", [1.0, 0.5])
+def test_fft_cerca_del_exacto(n, bw_adjust):
+    x, y = _bimodal(n)
+    err = kde_accuracy(x, y, bw_adjust=bw_adjust)
+    assert err["max_rel"] < 0.01
+    assert err["l1_rel"] < 0.01
+
+    # Misma rejilla y niveles de contorno casi iguales en ambos motores
+    xf, yf, fast = kde_grid(x, y, bw_adjust=bw_adjust, engine="fft", cache=False)
+    xe, ye, exact = kde_grid(x, y, bw_adjust=bw_adjust, engine="exact", cache=False)
+    np.testing.assert_allclose(xf, xe)
+    np.testing.assert_allclose(yf, ye)
+    np.testing.assert_allclose(iso_levels(fast), iso_levels(exact), rtol=0.02)
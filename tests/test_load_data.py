@@ -0,0 +1,173 @@
+"""
+Cargador (utils/load_data.py): cada camino rápido devuelve lo mismo que la
+lectura directa con pandas sobre los CSV de data/.
+"""
+from pathlib import Path
+import operator
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.load_data import (  # noqa: E402
+    _read_csv_smart, _sniff_csv, compact_frame, join_env_micro, load_env_micro, load_joined, prep_graph1,
+)
+
+ENV = PROJECT_ROOT / "data/environmental-data.csv"
+MICRO = PROJECT_ROOT / "data/microbial-responses.csv"
+
+
+def _referencia(path: Path) -> pd.DataFrame:
+    return pd.read_csv(path, encoding="latin-1" if path == ENV else "utf-8")
+
+
+# --- lectura de CSV (dialecto y bloques) -------------------------------------
+
+def test_dialecto_igual_a_pandas(tmp_path):
+    ref = _referencia(ENV)
+    pd.testing.assert_frame_equal(_read_csv_smart(ENV), ref, check_dtype=False)
+    pd.testing.assert_frame_equal(_read_csv_smart(MICRO), _referencia(MICRO), check_dtype=False)
+
+    # Punto y coma en UTF-8: mismo resultado
+    other = tmp_path / "env.csv"
+    ref.to_csv(other, sep=";", index=False, encoding="utf-8")
+    pd.testing.assert_frame_equal(_read_csv_smart(other), _read_csv_smart(ENV))
+
+
+def test_bloques_y_columnas_igual_a_lectura_completa():
+    full = _read_csv_smart(MICRO)
+    chunks = list(_read_csv_smart(MICRO, chunksize=100))
+    assert len(chunks) == -(-len(full) // 100)
+    pd.testing.assert_frame_equal(pd.concat(chunks), full)
+
+    cols = ["time", "soil_number"]
+    pd.testing.assert_frame_equal(_read_csv_smart(MICRO, usecols=cols), full[["soil_number", "time"]])
+
+
+def test_byte_latin1_despues_de_la_muestra(tmp_path):
+    # Muestra solo ASCII y una fila en latin-1 pasada la muestra: se reintenta en latin-1
+    ref = _referencia(ENV)
+    ascii_rows = ref[~ref["author_year"].str.contains("[^\x00-\x7f]")]
+    big = pd.concat([ascii_rows] * 200, ignore_index=True)
+    tail = ref[ref["author_year"].str.contains("[^\x00-\x7f]")].head(1)
+    assert len(tail) == 1
+    path = tmp_path / "env.csv"
+    pd.concat([big, tail], ignore_index=True).to_csv(path, index=False, encoding="latin-1")
+    assert path.stat().st_size > 64 * 1024
+    assert _sniff_csv(path)["encoding"] == "utf-8-sig"
+
+    expected = pd.read_csv(path, encoding="latin-1")
+    pd.testing.assert_frame_equal(_read_csv_smart(path), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.concat(_read_csv_smart(path, chunksize=5000)), expected, check_dtype=False)
+
+
+# --- columnas y filtros empujados a la lectura -------------------------------
+
+FILTROS = [
+    [("land_cover", "in", {"Forest", "Grassland"})],
+    [("time", ">=", 10), ("respiration_rate", "<", 5)],
+    [("pH", ">", 6), ("time", "<=", 48)],
+]
+
+
+OPS = {"in": lambda s, v: s.isin(v), "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+def _filtrar(df: pd.DataFrame, filters) -> pd.DataFrame:
+    """Referencia: la tabla completa filtrada con pandas."""
+    mask = pd.Series(True, index=df.index)
+    for col, op, v in filters:
+        mask &= OPS[op](df[col], v)
+    return df[mask].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+@pytest.mark.parametrize("filters", FILTROS)
+def test_pushdown_igual_a_filtrar_despues(use_cache, filters):
+    env, micro = _read_csv_smart(ENV), _read_csv_smart(MICRO)
+    env_f = _filtrar(env, [f for f in filters if f[0] in env.columns])
+    micro_f = _filtrar(micro, [f for f in filters if f[0] in micro.columns])
+    if len(env_f) < len(env):
+        micro_f = micro_f[micro_f["soil_number"].isin(env_f["soil_number"])].reset_index(drop=True)
+
+    columns = ["land_cover", "respiration_rate"]
+    got_env, got_micro = load_env_micro(use_cache=use_cache, columns=columns, filters=filters)
+    pd.testing.assert_frame_equal(got_env, env_f[list(got_env.columns)])
+    pd.testing.assert_frame_equal(got_micro, micro_f[list(got_micro.columns)])
+    assert {"soil_number", "land_cover"} <= set(got_env.columns) <= {"soil_number", "land_cover", "pH"}
+    assert set(got_micro.columns) <= {"soil_number", "respiration_rate", "time"}
+
+
+def test_filtro_de_columna_inexistente():
+    with pytest.raises(KeyError):
+        load_env_micro(filters=[("no_existe", "==", 1)])
+
+
+# --- tabla unida --------------------------------------------------------------
+
+def _merge() -> pd.DataFrame:
+    return pd.merge(_read_csv_smart(MICRO), _read_csv_smart(ENV), on="soil_number", how="inner")
+
+
+def test_join_igual_a_merge():
+    env, micro = _read_csv_smart(ENV), _read_csv_smart(MICRO)
+    pd.testing.assert_frame_equal(join_env_micro(env, micro), _merge())
+    # Suelos de micro sin fila en env se descartan, como en el inner join
+    some = env[env["soil_number"] % 3 != 0]
+    pd.testing.assert_frame_equal(join_env_micro(some, micro),
+                                  pd.merge(micro, some, on="soil_number", how="inner"))
+    # Con soil_number repetido en env se recurre al merge
+    dup = pd.concat([env, env.head(2)], ignore_index=True)
+    pd.testing.assert_frame_equal(join_env_micro(dup, micro), pd.merge(micro, dup, on="soil_number"))
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_load_joined_igual_a_merge(use_cache):
+    ref = _merge()
+    pd.testing.assert_frame_equal(load_joined(use_cache=use_cache), ref)
+
+    filters = [("land_cover", "in", {"Cropland"}), ("time", ">", 5)]
+    got = load_joined(columns=["respiration_rate"], filters=filters, use_cache=use_cache)
+    exp = ref[ref["land_cover"].isin({"Cropland"}) & (ref["time"] > 5)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(got, exp[list(got.columns)])
+
+    soils = set(ref["soil_number"].unique()[::4])
+    got = load_joined(filters=[("soil_number", "in", soils)], use_cache=use_cache)
+    pd.testing.assert_frame_equal(got, ref[ref["soil_number"].isin(soils)].reset_index(drop=True))
+
+
+def test_prep_graph1_forma_anterior():
+    env, micro = _read_csv_smart(ENV), _read_csv_smart(MICRO)
+    new_df, new_order = prep_graph1(load_joined(), min_n=10)
+    old_df, old_order = prep_graph1(env, micro, min_n=10)
+    assert new_order == old_order
+    pd.testing.assert_frame_equal(new_df.reset_index(drop=True), old_df.reset_index(drop=True))
+    with pytest.raises(TypeError):
+        prep_graph1(load_joined(), 10)
+
+
+# --- modo compacto ------------------------------------------------------------
+
+def test_compacto_conserva_los_valores():
+    ref = _merge()
+    small = compact_frame(ref)
+    report = small.attrs["compact_report"]
+    assert report["bytes_after"] < report["bytes_before"]
+    for col in ref.columns:
+        if col in report["float32"]:
+            assert small[col].dtype == np.float32
+            np.testing.assert_allclose(small[col].to_numpy(np.float64), ref[col].to_numpy(), rtol=1e-6)
+        elif isinstance(small[col].dtype, pd.CategoricalDtype):
+            assert small[col].astype(str).tolist() == ref[col].astype(str).tolist()
+        else:
+            np.testing.assert_array_equal(small[col].to_numpy(), ref[col].to_numpy())
+
+    # Desde la caché, el texto llega como categórica sin pasar por strings: mismos valores
+    for use_cache in (True, False):
+        got = load_joined(compact=True, use_cache=use_cache)
+        pd.testing.assert_frame_equal(got, small, check_categorical=False)
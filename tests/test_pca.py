@@ -0,0 +1,58 @@
+"""
+PCA por bloques (utils/pca.py): el mismo resultado que StandardScaler + PCA
+sobre todas las filas a la vez, sin importar cómo se partan los datos.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs.grafico_pca_biplot import VARS_NUM  # noqa: E402
+from utils.load_data import load_joined  # noqa: E402
+from utils.pca import StreamingPCA, chunks_of  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def datos():
+    return load_joined()[VARS_NUM]
+
+
+def _pca_batch(A: np.ndarray, k: int):
+    """Referencia: estandarizar (desviación poblacional) y SVD, con signos como sklearn."""
+    Z = (A - A.mean(axis=0)) / A.std(axis=0)
+    _, S, Vt = np.linalg.svd(Z, full_matrices=False)
+    Vt = Vt[:k]
+    Vt *= np.sign(Vt[np.arange(k), np.argmax(np.abs(Vt), axis=1)])[:, None]
+    return Vt, S[:k] ** 2 / (len(A) - 1), S[:k] ** 2 / (S ** 2).sum(), Z @ Vt.T
+
+
+@pytest.mark.parametrize("chunksize", [50, 333, 10_000])
+def test_por_bloques_igual_a_todo_junto(datos, chunksize):
+    A = datos.dropna().to_numpy(dtype=np.float64)
+    comp, var, ratio, scores = _pca_batch(A, 3)
+
+    model = StreamingPCA(VARS_NUM, n_components=3).fit(chunks_of(datos, chunksize))
+    assert model.n == len(A)
+    np.testing.assert_allclose(model.components_, comp, atol=1e-10)
+    np.testing.assert_allclose(model.explained_variance_, var, rtol=1e-10)
+    np.testing.assert_allclose(model.explained_variance_ratio_, ratio, rtol=1e-10)
+    got, index = model.transform(datos)
+    np.testing.assert_allclose(got, scores, atol=1e-9)
+    assert index.equals(datos.dropna().index)
+
+
+def test_fusion_y_json(datos, tmp_path):
+    whole = StreamingPCA(VARS_NUM).fit([datos])
+    left = StreamingPCA(VARS_NUM).partial_fit(datos.iloc[:300])
+    right = StreamingPCA(VARS_NUM).partial_fit(datos.iloc[300:])
+    merged = left.merge(right).finalize()
+    np.testing.assert_allclose(merged.components_, whole.components_, atol=1e-10)
+
+    whole.save(tmp_path / "pca.json")
+    again = StreamingPCA.load(tmp_path / "pca.json")
+    np.testing.assert_allclose(again.transform(datos)[0], whole.transform(datos)[0], atol=1e-12)
@@ -0,0 +1,69 @@
+"""
+Cuantiles por intervalo (utils/quantiles.py): mismos resultados que el
+``groupby(["type", pd.cut(time)]).quantile()`` por cobertura al que sustituyen.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs.grafico_facetgrid import preparar_long  # noqa: E402
+from utils.load_data import load_joined  # noqa: E402
+from utils.quantiles import binned_quantiles, presort_bins, rebin_quantiles  # noqa: E402
+
+
+def _resumen_pandas(df_cover: pd.DataFrame, n_bins: int) -> pd.DataFrame:
+    """Referencia: el resumen por cobertura original, con pd.cut y un groupby por intervalo."""
+    tb = pd.cut(df_cover["time"], bins=n_bins)
+    g = df_cover.groupby(["type", tb], observed=True)["growth_rate"]
+    q = (g.quantile([0.25, 0.5, 0.75]).unstack().reset_index()
+         .rename(columns={0.25: "q25", 0.5: "q50", 0.75: "q75"}))
+    q["n"] = g.size().to_numpy()
+    q["t"] = q["time"].apply(lambda iv: (iv.left + iv.right) / 2)
+    return q.dropna(subset=["q50"])
+
+
+@pytest.fixture(scope="module")
+def long():
+    return preparar_long(load_joined())
+
+
+def _sintetico() -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    n = 5000
+    df = pd.DataFrame({
+        "land_cover": rng.choice(["A", "B", "C"], n),
+        "type": rng.choice(["Bacterial", "Fungal"], n),
+        "time": rng.gamma(2.0, 10.0, n).round(1),
+        "growth_rate": rng.lognormal(-4, 1, n),
+    })
+    df.loc[rng.choice(n, 50, replace=False), "growth_rate"] = np.nan
+    df.loc[df["land_cover"] == "C", "time"] = 7.0  # un solo tiempo: bordes ampliados como pd.cut
+    return df
+
+
+@pytest.mark.parametrize("n_bins", [5, 20])
+def test_igual_a_pd_cut_por_cobertura(long, n_bins):
+    for df in (long, _sintetico()):
+        df = df.dropna(subset=["growth_rate"])
+        got = binned_quantiles(df, n_bins=n_bins)
+        for cover in sorted(df["land_cover"].unique()):
+            exp = _resumen_pandas(df[df["land_cover"] == cover], n_bins)
+            sub = got[got["land_cover"] == cover].sort_values(["type", "bin"])
+            assert sub["type"].astype(str).tolist() == exp["type"].astype(str).tolist()
+            np.testing.assert_array_equal(sub["n"].to_numpy(), exp["n"].to_numpy())
+            np.testing.assert_allclose(sub["t"].to_numpy(), exp["t"].to_numpy())
+            for c in ("q25", "q50", "q75"):
+                np.testing.assert_allclose(sub[c].to_numpy(), exp[c].to_numpy(), rtol=1e-12)
+
+
+def test_reagrupar_igual_a_calcular_de_nuevo(long):
+    pre = presort_bins(long)
+    for n_bins in (3, 20, 64):
+        pd.testing.assert_frame_equal(rebin_quantiles(pre, n_bins=n_bins), binned_quantiles(long, n_bins=n_bins))
@@ -0,0 +1,82 @@
+"""
+Generación por lotes (graphs/render_all.py): la figura del pool es la misma
+que la de su build() y solo se regenera lo que cambió. Las salidas y el
+manifiesto van a tmp_path.
+"""
+from pathlib import Path
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import graphs.render_all as render_all  # noqa: E402
+
+FIGURA = "grafico4_pca_biplot"
+
+
+@pytest.fixture
+def salidas(tmp_path, monkeypatch):
+    out = tmp_path / "outputs"
+    monkeypatch.setattr(render_all, "OUTPUT_DIR", out)
+    monkeypatch.setattr(render_all, "MANIFEST", out / ".manifest.json")
+    return out
+
+
+def test_pool_igual_a_build_directo(salidas, tmp_path):
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import matplotlib.image as mpimg
+    import matplotlib.pyplot as plt
+    from graphs.grafico_pca_biplot import build
+    from utils.load_data import load_joined
+
+    timings = render_all.render_all([FIGURA], jobs=1)
+    assert set(timings) == {"(carga de datos)", FIGURA}
+
+    np.random.seed(render_all.SEED)
+    with matplotlib.rc_context():
+        fig, _ = build(df=load_joined())
+        fig.savefig(tmp_path / "directo.png", dpi=300)
+    plt.close("all")
+    np.testing.assert_array_equal(mpimg.imread(salidas / f"{FIGURA}.png"), mpimg.imread(tmp_path / "directo.png"))
+
+
+def test_solo_regenera_lo_que_cambio(salidas):
+    render_all.render_all([FIGURA], jobs=1)
+    assert render_all.render_all([FIGURA], jobs=1) == {}
+    with pytest.raises(ValueError, match="no pedidas"):
+        render_all.render_all([FIGURA], params={"grafico1_violin": {"min_n": 10}})
+
+    manifest = render_all._read_manifest()
+    fp = render_all.figure_fingerprint(FIGURA)
+    assert render_all.stale_reason(FIGURA, fp, manifest) is None
+    assert render_all.stale_reason(FIGURA, render_all.figure_fingerprint(FIGURA, {"streaming": True}),
+                                   manifest) == "cambió: params"
+    assert render_all.stale_reason(FIGURA, {**fp, "source": "otro"}, manifest) == "cambió: source"
+    assert render_all.stale_reason(FIGURA, {**fp, "inputs": {}}, manifest) == "cambió: inputs"
+    (salidas / f"{FIGURA}.png").unlink()
+    assert render_all.stale_reason(FIGURA, fp, manifest) == "no existe la salida"
+
+    # El código de la figura incluye los módulos de utils/ que importa
+    names = {p.name for p in render_all.source_files("grafico_pca_biplot")}
+    assert {"grafico_pca_biplot.py", "pca.py", "correlation.py", "load_data.py"} <= names
+
+
+def test_importar_las_figuras_no_carga_nada(tmp_path):
+    # En un proceso limpio: importar los módulos no importa librerías pesadas ni lee datos
+    mods = sorted({module for module, _ in render_all.FIGURES.values()})
+    code = (
+        "import importlib, sys\n"
+        f"sys.path.insert(0, {str(PROJECT_ROOT)!r})\n"
+        f"for m in {mods!r}: importlib.import_module('graphs.' + m)\n"
+        "heavy = ['matplotlib', 'seaborn', 'scipy', 'sklearn']\n"
+        "print([m for m in heavy if m in sys.modules])\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,55 @@
+"""
+Submuestreo estratificado (utils/sampling.py): nunca más de ``max_points``
+filas, mínimos por grupo y orden original.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.sampling import stratified_sample  # noqa: E402
+
+PESOS = [0.5, 0.3, 0.1, 0.05, 0.02, 0.01, 0.01, 0.005, 0.003, 0.002]
+
+
+@pytest.fixture
+def datos():
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({"g": rng.choice(list("abcdefghij"), 100_000, p=PESOS), "v": np.arange(100_000)})
+
+
+@pytest.mark.parametrize("max_points,min_per_group", [(1000, 50), (5000, 0), (300, 50), (10, 50)])
+def test_tope_minimos_y_orden(datos, max_points, min_per_group):
+    for df in (datos, datos.astype({"g": "category"})):
+        s = stratified_sample(df, "g", max_points, min_per_group=min_per_group)
+        assert len(s) <= max_points
+        assert s["v"].is_monotonic_increasing
+        assert s["v"].is_unique
+        counts = s["g"].value_counts()
+        sizes = df["g"].value_counts()
+        if min_per_group * len(sizes) <= max_points:
+            assert (counts.reindex(sizes.index, fill_value=0) >= np.minimum(sizes, min_per_group)).all()
+        else:
+            assert counts.max() - counts.min() <= 1
+        pd.testing.assert_frame_equal(s, df.loc[s.index])
+
+
+def test_reparto_proporcional_sin_minimos(datos):
+    s = stratified_sample(datos, "g", 5000, min_per_group=0)
+    share = s["g"].value_counts(normalize=True).sort_index()
+    exp = datos["g"].value_counts(normalize=True).sort_index()
+    np.testing.assert_allclose(share.to_numpy(), exp.to_numpy(), atol=2e-3)
+
+
+def test_tabla_que_ya_cabe(datos):
+    small = datos.head(100)
+    assert stratified_sample(small, "g", 100) is small
+    a = stratified_sample(datos, "g", 1000, seed=5)
+    b = stratified_sample(datos, "g", 1000, seed=5)
+    pd.testing.assert_frame_equal(a, b)
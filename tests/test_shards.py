@@ -0,0 +1,106 @@
+"""
+Fragmentos por estudio (utils/shards.py): cargar varios fragmentos equivale a
+concatenar sus tablas con soil_number renumerado, y los filtros dan lo mismo
+que filtrar el resultado completo. Los fragmentos son copias de data/ en
+tmp_path.
+"""
+from pathlib import Path
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.load_data import _read_csv_smart, load_joined  # noqa: E402
+from utils.shards import CATEGORICAS, find_shards, load_shards  # noqa: E402
+
+ENV = PROJECT_ROOT / "data/environmental-data.csv"
+MICRO = PROJECT_ROOT / "data/microbial-responses.csv"
+
+
+@pytest.fixture
+def fragmentos(tmp_path):
+    root = tmp_path / "shards"
+    for name in ("a", "b"):
+        (root / name).mkdir(parents=True)
+        for p in (ENV, MICRO):
+            shutil.copy(p, root / name / p.name)
+    return root
+
+
+def _como_csv(df: pd.DataFrame, ref: pd.DataFrame) -> pd.DataFrame:
+    """Quita las columnas añadidas y devuelve las categóricas a su tipo del CSV."""
+    df = df.drop(columns=["shard", "soil_number", "soil_number_local"])
+    for col in CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype(ref[col].dtype)
+    return df
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_concatena_y_renumera(fragmentos, jobs):
+    env, micro = load_shards(fragmentos, jobs=jobs)
+    ref_env, ref_micro = _read_csv_smart(ENV), _read_csv_smart(MICRO)
+
+    for got, ref in ((env, ref_env), (micro, ref_micro)):
+        assert got["shard"].astype(str).tolist() == ["a"] * len(ref) + ["b"] * len(ref)
+        exp = pd.concat([ref, ref], ignore_index=True)
+        np.testing.assert_array_equal(got["soil_number_local"], exp["soil_number"])
+        pd.testing.assert_frame_equal(_como_csv(got, ref), exp.drop(columns="soil_number"))
+
+    # Los números se repiten entre fragmentos: identificadores globales 1..N por (shard, local)
+    assert env["soil_number"].is_unique
+    assert env["soil_number"].tolist() == list(range(1, 2 * len(ref_env) + 1))
+    pairs = dict(zip(zip(env["shard"], env["soil_number_local"]), env["soil_number"]))
+    assert micro["soil_number"].tolist() == [pairs[k] for k in zip(micro["shard"], micro["soil_number_local"])]
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_filtros_igual_a_filtrar_despues(fragmentos, use_cache):
+    full_env, full_micro = load_shards(fragmentos, jobs=1)
+    soils = set(full_env["soil_number"].iloc[::7]) | {full_env["soil_number"].max()}
+    filters = [("soil_number", "in", soils), ("pH", ">", 6.5)]
+
+    env, micro = load_shards(fragmentos, filters=filters, use_cache=use_cache, jobs=1)
+    exp_env = full_env[full_env["soil_number"].isin(soils) & (full_env["pH"] > 6.5)].reset_index(drop=True)
+    exp_micro = full_micro[full_micro["soil_number"].isin(exp_env["soil_number"])].reset_index(drop=True)
+    pd.testing.assert_frame_equal(env, exp_env, check_categorical=False)
+    pd.testing.assert_frame_equal(micro, exp_micro, check_categorical=False)
+
+    joined = load_joined(filters=filters[:1], use_cache=use_cache, source=fragmentos)
+    full = load_joined(source=fragmentos)
+    exp = full[full["soil_number"].isin(soils)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(joined.reset_index(drop=True), exp, check_categorical=False)
+
+
+def test_nombres_por_prefijo_y_errores(tmp_path, fragmentos):
+    flat = tmp_path / "flat"
+    flat.mkdir()
+    for name in ("x2020", "y2021"):
+        for p in (ENV, MICRO):
+            shutil.copy(p, flat / f"{name}_{p.name}")
+    assert [s[0] for s in find_shards(flat)] == ["x2020", "y2021"]
+    assert [s[0] for s in find_shards(str(fragmentos / "*"))] == ["a", "b"]
+
+    with pytest.raises(FileNotFoundError):
+        find_shards(tmp_path / "vacia")
+    (flat / f"y2021_{MICRO.name}").unlink()
+    with pytest.raises(FileNotFoundError, match="sin tabla microbiana"):
+        find_shards(flat)
+    # Dos carpetas "a" a distinta profundidad darían el mismo nombre de fragmento
+    shutil.copytree(fragmentos / "a", fragmentos / "otro" / "a")
+    with pytest.raises(ValueError, match="repetido"):
+        find_shards(fragmentos)
+
+
+def test_esquemas_incompatibles(fragmentos):
+    env_b = fragmentos / "b" / ENV.name
+    df = _read_csv_smart(env_b).drop(columns="pH")
+    df.to_csv(env_b, index=False)
+    with pytest.raises(ValueError, match=r"env incompatibles(.|\n)*b: faltan \['pH'\]"):
+        load_shards(fragmentos, jobs=1)
@@ -0,0 +1,62 @@
+"""
+Sketches KLL (utils/sketches.py): exactos mientras caben, error de rango
+acotado con muchos valores y el mismo resultado fusionando por bloques.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs.grafico_facetgrid import preparar_long  # noqa: E402
+from utils.load_data import load_joined  # noqa: E402
+from utils.quantiles import binned_quantiles, edges_from_range  # noqa: E402
+from utils.sketches import BinnedSketches, KLLSketch, rank_error  # noqa: E402
+
+QS = np.linspace(0.01, 0.99, 99)
+
+
+def test_exacto_con_pocos_valores():
+    x = np.random.default_rng(0).lognormal(size=150)
+    sk = KLLSketch(k=200, seed=0).update(x[:70]).update(x[70:])
+    np.testing.assert_allclose(sk.quantile(QS), np.quantile(x, QS))
+
+
+def test_error_de_rango_acotado_y_fusion():
+    rng = np.random.default_rng(1)
+    x = rng.lognormal(size=200_000)
+    blocks = np.array_split(x, 37)
+
+    whole = KLLSketch(k=200, seed=0)
+    for b in blocks:
+        whole.update(b)
+    merged = KLLSketch(k=200, seed=1)
+    for b in blocks:
+        merged.merge(KLLSketch(k=200, seed=2).update(b))
+
+    for sk in (whole, merged):
+        assert sk.n == len(x)
+        assert sk._size() < 3 * 200 + 50
+        assert rank_error(sk, x, QS) < 0.01
+    again = KLLSketch.from_dict(whole.to_dict())
+    np.testing.assert_array_equal(again.quantile(QS), whole.quantile(QS))
+
+
+def test_resumen_por_intervalos_igual_al_exacto():
+    long = preparar_long(load_joined())
+    edges = {str(c): edges_from_range(d["time"].min(), d["time"].max(), 20)
+             for c, d in long.groupby("land_cover", observed=True)}
+    sk = BinnedSketches(edges, k=10_000, seed=0)
+    for part in np.array_split(np.arange(len(long)), 5):
+        sk.update(long.iloc[part])
+
+    got = sk.summary().sort_values(["land_cover", "type", "bin"]).reset_index(drop=True)
+    exp = binned_quantiles(long, n_bins=20).sort_values(["land_cover", "type", "bin"]).reset_index(drop=True)
+    for c in ("land_cover", "type"):
+        assert got[c].astype(str).tolist() == exp[c].astype(str).tolist()
+    pd.testing.assert_frame_equal(got.drop(columns=["land_cover", "type"]), exp.drop(columns=["land_cover", "type"]),
+                                  check_dtype=False)
@@ -0,0 +1,110 @@
+"""
+Índice espacial (utils/spatial.py): bbox, radio y k vecinos dan lo mismo que
+recorrer todos los suelos, también cerca de los polos y del antimeridiano, y
+las regiones filtran load_joined igual que ``restrict`` sobre la tabla entera.
+"""
+from pathlib import Path
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.load_data import iter_joined, load_joined  # noqa: E402
+from utils.shards import load_shards  # noqa: E402
+from utils.spatial import (  # noqa: E402
+    SpatialIndex, aggregate_cells, haversine_km, load_index, region_filters, restrict,
+)
+
+
+def _global(n: int = 3000, seed: int = 0) -> SpatialIndex:
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-180, 180, n)
+    lat = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    lat[:20] = rng.uniform(88, 90, 20)  # algunos suelos junto al polo norte
+    return SpatialIndex(np.arange(1, n + 1) * 3, lon, lat)
+
+
+def _bbox_bruto(t: pd.DataFrame, lon_min, lat_min, lon_max, lat_max) -> set:
+    lon, lat = t["longitude"], t["latitude"]
+    in_lon = (lon >= lon_min) | (lon <= lon_max) if lon_min > lon_max else (lon >= lon_min) & (lon <= lon_max)
+    return set(t.loc[in_lon & (lat >= lat_min) & (lat <= lat_max), "soil_number"])
+
+
+def _cercanos_bruto(t: pd.DataFrame, lon, lat):
+    d = haversine_km(lon, lat, t["longitude"].to_numpy(), t["latitude"].to_numpy())
+    order = np.lexsort((t["soil_number"].to_numpy(), d))
+    return t["soil_number"].to_numpy()[order], d[order]
+
+
+CAJAS = [(-10, 35, 30, 60), (170, -20, -170, 20), (-180, -90, 180, 90), (0, 85, 90, 90), (5, 5, 5.5, 5.2)]
+PUNTOS = [(12.5, 55.7), (179.5, 0.0), (-179.9, -40.0), (0.0, 89.5), (100.0, -89.0)]
+
+
+@pytest.mark.parametrize("cell_deg", [0.5, 1.0, 7.0])
+def test_consultas_igual_a_fuerza_bruta(cell_deg):
+    base = _global()
+    index = SpatialIndex(base.soils, base.lon, base.lat, cell_deg)
+    t = index.to_frame()
+    for box in CAJAS:
+        assert set(index.bbox(*box)) == _bbox_bruto(t, *box)
+    for lon, lat in PUNTOS:
+        soils, d = _cercanos_bruto(t, lon, lat)
+        for km in (50.0, 800.0, 5000.0, 25000.0):
+            got, got_d = index.radius(lon, lat, km, return_distance=True)
+            np.testing.assert_array_equal(got, soils[d <= km])
+            np.testing.assert_allclose(got_d, d[d <= km])
+        for k in (1, 7, 100):
+            np.testing.assert_array_equal(index.nearest(lon, lat, k=k), soils[:k])
+
+
+def test_datos_reales_y_regiones():
+    index = load_index()
+    t = index.to_frame()
+    soils, d = _cercanos_bruto(t, 12.5, 55.7)
+    np.testing.assert_array_equal(index.nearest(12.5, 55.7, k=5), soils[:5])
+    assert load_index(use_cache=False).to_frame().equals(t)
+
+    full = load_joined()
+    for region in ("radius:12.5:55.7:3000", "bbox:-20:30:40:70", "knn:-60:-10:4"):
+        exp = restrict(full, region)
+        assert 0 < len(exp) < len(full)
+        filters = region_filters(region)
+        for use_cache in (True, False):
+            got = load_joined(filters=filters, use_cache=use_cache)
+            pd.testing.assert_frame_equal(got.reset_index(drop=True), exp)
+        chunks = pd.concat(iter_joined(filters=filters, chunksize=100), ignore_index=True)
+        pd.testing.assert_frame_equal(chunks, exp[chunks.columns])
+
+
+def test_agregado_por_celda():
+    df = load_joined(columns=["respiration_rate"])
+    got = aggregate_cells(df, ["respiration_rate"], cell_deg=5.0, stats=("median", "count"))
+    index = load_index(cell_deg=5.0)
+    d = df.assign(cell=index.cells_of_soils(df["soil_number"]))
+    exp = d[d["cell"] >= 0].groupby("cell")["respiration_rate"].agg(["median", "count"])
+    np.testing.assert_allclose(got["respiration_rate_median"], exp["median"])
+    np.testing.assert_array_equal(got["respiration_rate_count"], exp["count"])
+    assert got["n"].sum() == (d["cell"] >= 0).sum()
+
+
+def test_indice_de_fragmentos(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        for p in ("environmental-data.csv", "microbial-responses.csv"):
+            shutil.copy(PROJECT_ROOT / "data" / p, tmp_path / name / p)
+    env, _ = load_shards(tmp_path, jobs=1)
+    index = load_index(source=tmp_path)
+    exp = SpatialIndex.from_frame(env).to_frame()
+    pd.testing.assert_frame_equal(index.to_frame(), exp)
+    assert index.to_frame()["soil_number"].is_unique
+
+    region = "radius:12.5:55.7:3000"
+    full = load_joined(source=tmp_path)
+    got = load_joined(filters=region_filters(region, index), source=tmp_path)
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), restrict(full, region, index))
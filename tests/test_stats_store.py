@@ -0,0 +1,174 @@
+"""
+Modos de actualización del almacén incremental (graphs/stats_store.py):
+"none" sin cambios, "delta" con filas añadidas y "full" cuando lo ya leído
+deja de ser válido. Cada prueba trabaja sobre copias de los CSV en tmp_path.
+"""
+from pathlib import Path
+import io
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from graphs.stats_store import StatsStore  # noqa: E402
+
+ENV = PROJECT_ROOT / "data/environmental-data.csv"
+MICRO = PROJECT_ROOT / "data/microbial-responses.csv"
+
+
+@pytest.fixture
+def datos(tmp_path):
+    """Copia de env y la primera mitad de micro; devuelve (env, micro, líneas restantes)."""
+    env = tmp_path / "env.csv"
+    shutil.copy(ENV, env)
+    lines = MICRO.read_bytes().splitlines(keepends=True)
+    half = len(lines) // 2
+    micro = tmp_path / "micro.csv"
+    micro.write_bytes(b"".join(lines[:half]))
+    return env, micro, lines[half:]
+
+
+def _store(tmp_path, env, micro, name="store.json"):
+    return StatsStore(path=tmp_path / name, micro_path=micro, env_path=env)
+
+
+def _rebuilt(tmp_path, env, micro):
+    """Almacén construido desde cero, en otro archivo, sobre el CSV actual."""
+    store = _store(tmp_path, env, micro, "desde_cero.json")
+    assert store.update()["mode"] == "full"
+    return store
+
+
+def _append(path: Path, lines) -> None:
+    with open(path, "ab") as fh:
+        fh.write(b"".join(lines))
+
+
+def _assert_same(a: StatsStore, b: StatsStore) -> None:
+    """Mismos agregados (con pocos datos los sketches guardan todos los valores: resultados exactos)."""
+    assert a.n_rows == b.n_rows
+    assert a.ranges == b.ranges
+    assert a.orden_grafico1()[0] == b.orden_grafico1()[0]
+    pd.testing.assert_series_equal(a.orden_grafico1()[1].sort_index(), b.orden_grafico1()[1].sort_index())
+    pd.testing.assert_frame_equal(a.medias_por_suelo(), b.medias_por_suelo())
+    np.testing.assert_allclose(a.correlacion().to_numpy(), b.correlacion().to_numpy(), atol=1e-12)
+    fa, fb = a.resumen_facet(), b.resumen_facet()
+    assert fa.keys() == fb.keys()
+    for cover in fa:
+        pd.testing.assert_frame_equal(fa[cover], fb[cover])
+
+
+def test_none_sin_cambios(tmp_path, datos):
+    env, micro, _ = datos
+    store = _store(tmp_path, env, micro)
+    assert store.update()["mode"] == "full"
+    res = _store(tmp_path, env, micro).update()
+    assert res == {"mode": "none", "rows": 0, "reason": None}
+
+
+def test_delta_igual_a_reconstruir(tmp_path, datos):
+    env, micro, rest = datos
+    _store(tmp_path, env, micro).update()
+    _append(micro, rest)
+
+    res = _store(tmp_path, env, micro).update()
+    assert res["mode"] == "delta"
+    assert res["rows"] == len(rest)
+    _assert_same(_store(tmp_path, env, micro), _rebuilt(tmp_path, env, micro))
+
+
+def test_delta_con_tiempos_fuera_de_rango(tmp_path, datos):
+    env, micro, rest = datos
+    store = _store(tmp_path, env, micro)
+    store.update()
+    # Las filas restantes con tiempos mayores que todos los leídos: amplían el rango sin reconstruir
+    header = micro.read_bytes().splitlines(keepends=True)[0]
+    df = pd.read_csv(io.BytesIO(header + b"".join(rest)))
+    df["time"] = df["time"] + 1000.0
+    _append(micro, [df.to_csv(index=False, header=False).encode()])
+
+    res = _store(tmp_path, env, micro).update()
+    assert res["mode"] == "delta"
+    after = _store(tmp_path, env, micro)
+    assert all(hi > 1000.0 for _, hi in after.ranges.values())
+    _assert_same(after, _rebuilt(tmp_path, env, micro))
+
+    # Y la mediana por intervalo coincide con la del Gráfico 2 sobre la tabla completa
+    from graphs.grafico_facetgrid import preparar_long, resumen_por_cobertura
+    from utils.load_data import join_env_micro, load_env
+
+    long = preparar_long(join_env_micro(load_env(env), pd.read_csv(micro)))
+    exact = resumen_por_cobertura(long, n_bins=after.n_bins)
+    approx = after.resumen_facet()
+    for cover, q in exact.items():
+        np.testing.assert_array_equal(q["n"].to_numpy(), approx[cover]["n"].to_numpy())
+        np.testing.assert_allclose(q["q50"].to_numpy(), approx[cover]["q50"].to_numpy())
+
+
+def test_full_si_cambian_bytes_ya_leidos(tmp_path, datos):
+    env, micro, rest = datos
+    _store(tmp_path, env, micro).update()
+    # Editamos un valor al principio del archivo (lejos del final ya leído)
+    raw = micro.read_bytes()
+    pos = raw.index(b"\n") + 1
+    first = raw[pos:raw.index(b"\n", pos)]
+    edited = first.replace(b",", b",9", 1)
+    micro.write_bytes(raw[:pos] + edited + raw[pos + len(first):])
+    _append(micro, rest)
+
+    res = _store(tmp_path, env, micro).update()
+    assert res["mode"] == "full"
+    assert res["reason"] == "bytes ya leídos modificados"
+
+
+def test_full_si_el_csv_es_mas_corto(tmp_path, datos):
+    env, micro, _ = datos
+    _store(tmp_path, env, micro).update()
+    lines = micro.read_bytes().splitlines(keepends=True)
+    micro.write_bytes(b"".join(lines[:-10]))
+
+    res = _store(tmp_path, env, micro).update()
+    assert res["mode"] == "full"
+    assert res["reason"] == "el CSV es más corto que lo ya leído"
+
+
+def test_full_si_cambia_env(tmp_path, datos):
+    env, micro, _ = datos
+    _store(tmp_path, env, micro).update()
+    _append(env, [b"\n"])
+
+    res = _store(tmp_path, env, micro).update()
+    assert res["mode"] == "full"
+    assert res["reason"] == "tabla ambiental modificada"
+
+
+def test_full_pedido(tmp_path, datos):
+    env, micro, _ = datos
+    _store(tmp_path, env, micro).update()
+    res = _store(tmp_path, env, micro).update(full=True)
+    assert res["mode"] == "full"
+    assert res["reason"] == "reconstrucción pedida"
+
+
+def test_sin_cambios_no_relee_lo_ya_leido(tmp_path, datos, monkeypatch):
+    import graphs.stats_store as stats_store
+
+    env, micro, rest = datos
+    _store(tmp_path, env, micro).update()
+    calls = []
+    real = stats_store._range_hash
+    monkeypatch.setattr(stats_store, "_range_hash", lambda fh, a, b: calls.append((a, b)) or real(fh, a, b))
+
+    assert _store(tmp_path, env, micro).update()["mode"] == "none"
+    assert calls == []
+    # Con filas nuevas se comprueba el bloque que acaba en la posición guardada
+    offset = _store(tmp_path, env, micro).offset
+    _append(micro, rest)
+    assert _store(tmp_path, env, micro).update()["mode"] == "delta"
+    assert calls[0][1] == offset
@@ -0,0 +1,83 @@
+"""
+Barridos de parámetros (graphs/sweep.py): los intermedios compartidos dan lo
+mismo que preparar cada variante por separado, se calculan una vez y cada PNG
+es el de su build() directo.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import graphs.sweep as sweep  # noqa: E402
+from graphs.grafico_facetgrid import (  # noqa: E402
+    ordenar_para_bins, preparar_long, resumen_desde_orden, resumen_por_cobertura,
+)
+from graphs.render_all import SEED  # noqa: E402
+from utils.load_data import load_joined, prep_graph1, subset_graph1  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def joined():
+    return load_joined()
+
+
+@pytest.mark.parametrize("min_n", [0, 5, 20, 200, 1000])
+def test_subset_igual_a_preparar_de_nuevo(joined, min_n):
+    base, _ = prep_graph1(joined, min_n=0)
+    medians = base.groupby("land_cover", observed=True)["respiration_rate"].median()
+    exp, exp_order = prep_graph1(joined, min_n=min_n)
+    for got, order in (subset_graph1(base, min_n), subset_graph1(base, min_n, medians=medians)):
+        pd.testing.assert_frame_equal(got, exp)
+        assert order == exp_order
+
+
+def test_resumen_desde_orden_igual_al_directo(joined):
+    long = preparar_long(joined[joined["time"] >= 0])
+    pre = ordenar_para_bins(long)
+    for n_bins in (10, 20):
+        got, exp = resumen_desde_orden(pre, n_bins=n_bins), resumen_por_cobertura(long, n_bins=n_bins)
+        assert list(got) == list(exp)
+        for cover in exp:
+            pd.testing.assert_frame_equal(got[cover].reset_index(drop=True), exp[cover].reset_index(drop=True))
+
+
+def test_dag_calcula_cada_nodo_una_vez():
+    calls = []
+    dag = sweep.Dag()
+    a = dag.add(("a",), lambda: calls.append("a") or 1)
+    b = dag.add(("b",), lambda x: calls.append("b") or x + 1, a)
+    c = dag.add(("c",), lambda x, y: calls.append("c") or x + y, a, b)
+    assert dag.add(("a",), lambda: 99) == a  # una clave repetida no reemplaza el nodo
+    assert (dag.compute(c), dag.compute(b)) == (3, 2)
+    assert calls == ["a", "b", "c"]
+
+
+def test_variantes_iguales_a_build_directo(tmp_path, joined):
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import matplotlib.image as mpimg
+    import matplotlib.pyplot as plt
+    from graphs.grafico_facetgrid import build as build_facet
+    from graphs.grafico_violin import build as build_violin
+
+    grids = {"grafico1_violin": {"min_n": [5, 200]}, "grafico2_lineas_subplots": {"n_bins": [10]}}
+    timings = sweep.sweep(grids, jobs=1, out_dir=tmp_path / "sweep")
+    builds = {"grafico1_violin": build_violin, "grafico2_lineas_subplots": build_facet}
+    variants = sweep.expand(grids)
+    assert len(timings) == len(variants) + 1
+
+    for name, params in variants:
+        out = sweep.output_path(name, params, tmp_path / "sweep")
+        assert out.name in timings
+        np.random.seed(SEED)
+        with matplotlib.rc_context():
+            fig, _ = builds[name](df=joined, **params)
+            fig.savefig(tmp_path / "directo.png", dpi=300)
+        plt.close("all")
+        np.testing.assert_array_equal(mpimg.imread(out), mpimg.imread(tmp_path / "directo.png"))
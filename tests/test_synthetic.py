@@ -0,0 +1,67 @@
+"""
+Datos sintéticos y banco de pruebas (utils/synthetic.py, graphs/benchmark.py):
+mismo esquema que los CSV reales, resultado fijado por la semilla. Todo se
+escribe en tmp_path.
+"""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import utils.synthetic as synthetic  # noqa: E402
+from utils.load_data import _read_csv_smart, join_env_micro  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def carpeta(tmp_path, monkeypatch):
+    monkeypatch.setattr(synthetic, "SYNTH_DIR", tmp_path / "synthetic")
+    return tmp_path / "synthetic"
+
+
+def test_esquema_y_tamano(tmp_path):
+    info = synthetic.generate(3000, tmp_path / "a", seed=1, chunk_rows=700)
+    env, micro = _read_csv_smart(info["env"]), _read_csv_smart(info["micro"])
+    real_env, real_micro = _read_csv_smart(synthetic.ENV_PATH), _read_csv_smart(synthetic.MICRO_PATH)
+
+    assert info["rows"] == len(micro) == 3000
+    assert info["soils"] == len(env)
+    pd.testing.assert_series_equal(env.dtypes, real_env.dtypes)
+    pd.testing.assert_series_equal(micro.dtypes, real_micro.dtypes)
+    assert env["soil_number"].is_unique
+    assert set(micro["soil_number"]) <= set(env["soil_number"])
+    assert set(env["land_cover"]) <= set(real_env["land_cover"])
+    assert len(join_env_micro(env, micro)) == len(micro)
+    # Las mediciones faltantes se conservan como en las plantillas
+    assert micro["respiration_rate"].isna().any() == real_micro["respiration_rate"].isna().any()
+
+
+def test_determinista_por_semilla(tmp_path):
+    a = synthetic.generate(2000, tmp_path / "a", seed=3)
+    b = synthetic.generate(2000, tmp_path / "b", seed=3)
+    c = synthetic.generate(2000, tmp_path / "c", seed=4)
+    for k in ("env", "micro"):
+        assert a[k].read_bytes() == b[k].read_bytes()
+    assert a["micro"].read_bytes() != c["micro"].read_bytes()
+
+
+def test_ensure_reutiliza(carpeta):
+    first = synthetic.ensure(1500, seed=0)
+    mtime = first["micro"].stat().st_mtime_ns
+    again = synthetic.ensure(1500, seed=0)
+    assert again["micro"] == first["micro"]
+    assert again["micro"].stat().st_mtime_ns == mtime
+    assert first["micro"].is_relative_to(carpeta)
+
+
+def test_benchmark_por_etapas(carpeta):
+    from graphs.benchmark import run
+
+    records = run(1500, stages=["read", "merge", "prep_graph1"], repeat=1, memory=False)
+    assert [r["stage"] for r in records] == ["read", "merge", "prep_graph1"]
+    assert all(r["rows"] == 1500 and np.isfinite(r["wall_s"]) for r in records)
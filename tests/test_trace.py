@@ -0,0 +1,57 @@
+"""
+Trazas por etapa (utils/trace.py): desactivadas no cambian nada; activadas,
+cada etapa deja un registro con su anidamiento, convertible a Chrome.
+"""
+from pathlib import Path
+import json
+import sys
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils import trace  # noqa: E402
+
+
+@trace.traced()
+def _suma(a, b=1):
+    with trace.stage("interna", paso=1):
+        return a + b
+
+
+@pytest.fixture
+def traza(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    trace.enable(path, profile_dir=tmp_path / "perfiles")
+    yield path
+    trace.disable()
+
+
+def test_desactivado_no_registra(tmp_path):
+    assert not trace.enabled()
+    assert trace.stage("x") is trace.stage("y")
+    assert _suma(2, b=3) == 5
+    assert _suma.__name__ == "_suma"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_etapas_anidadas_y_chrome(traza, tmp_path):
+    assert _suma(2, b=3) == 5
+    assert _suma(1) == 2
+    recs = trace.read_trace(traza)
+    assert [r["name"] for r in recs] == ["interna", "test_trace._suma"] * 2
+    inner, outer = recs[0], recs[1]
+    assert (inner["depth"], inner["parent"], inner["args"]) == (1, "test_trace._suma", {"paso": 1})
+    assert (outer["depth"], outer["parent"]) == (0, None)
+    assert outer["wall_s"] >= inner["wall_s"] >= 0
+    # Solo la etapa externa se perfila
+    assert "profile" not in inner and Path(outer["profile"]).exists()
+
+    out = tmp_path / "trace.json"
+    assert trace.to_chrome(traza, out) == 4
+    events = json.loads(out.read_text(encoding="utf-8"))["traceEvents"]
+    assert {e["ph"] for e in events} == {"X"}
+    assert events[1]["dur"] == pytest.approx(outer["wall_s"] * 1e6)
+    assert trace.summary(traza).loc["test_trace._suma", "calls"] == 2
@@ -0,0 +1,270 @@
+# utils/cache.py
+"""
+Caché columnar en disco para los CSV del proyecto.
+
+La primera lectura de un CSV se guarda como un directorio con un ``.npy`` por
+columna (más un ``meta.json`` con tipos y categorías). Las siguientes lecturas
+cargan esas columnas directamente, opcionalmente como memoria mapeada, sin
+volver a parsear el texto.
+
+La clave de cada entrada combina ruta, tamaño, fecha de modificación y hash del
+contenido del archivo fuente: si el CSV cambia, la entrada vieja deja de usarse.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Directorio raíz del proyecto (sube un nivel desde /utils/)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# Carpeta donde se guardan las copias binarias (se puede cambiar por variable de entorno)
+CACHE_DIR = Path(os.environ.get("ENTREGA_CACHE_DIR", PROJECT_ROOT / "data" / ".cache"))
+
+# Índice ruta -> (tamaño, mtime, hash): evita recalcular el hash si el archivo no cambió
+_INDEX_FILE = "index.json"
+_META_FILE = "meta.json"
+_HASH_BLOCK = 1 << 20
+
+
+class LRUMemo(OrderedDict):
+    """
+    Memo en proceso con tope de entradas: al superar ``maxsize`` se descarta la
+    usada hace más tiempo. Se usa como un dict (``in``, ``[]``, ``clear``).
+    """
+
+    def __init__(self, maxsize: int = 8):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+def _content_hash(path: Path) -> str:
+    """Hash BLAKE2b del contenido del archivo, leído por bloques."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_index() -> dict:
+    try:
+        with open(CACHE_DIR / _INDEX_FILE, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json_atomic(path: Path, obj) -> None:
+    """Escribe JSON en un temporal y lo renombra (nunca deja archivos a medias)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(obj, fh, indent=1, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def file_fingerprint(path: Path) -> dict:
+    """
+    Devuelve ruta, tamaño, mtime y hash de contenido de un archivo.
+    El hash solo se recalcula cuando tamaño o mtime difieren de lo registrado.
+    """
+    path = Path(path).resolve()
+    st = path.stat()
+    index = _read_index()
+    entry = index.get(str(path))
+    if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        return entry
+
+    entry = {
+        "path": str(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha": _content_hash(path),
+    }
+    raw = f"{entry['path']}|{entry['size']}|{entry['mtime_ns']}|{entry['sha']}"
+    entry["key"] = f"{path.stem}-{hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()}"
+    try:
+        index[str(path)] = entry
+        _write_json_atomic(CACHE_DIR / _INDEX_FILE, index)
+    except OSError:
+        pass  # caché de solo lectura: seguimos sin registrar
+    return entry
+
+
+def cache_key(path: Path) -> str:
+    """Clave de caché del archivo (cambia si cambia su ruta, tamaño, mtime o contenido)."""
+    return file_fingerprint(path)["key"]
+
+
+def save_frame(df: pd.DataFrame, key: str, sources: Iterable[Path] = ()) -> Path:
+    """
+    Guarda un DataFrame como directorio de columnas ``.npy`` bajo ``CACHE_DIR/key``.
+    ``sources`` son los archivos de los que se derivó (para marcarlo obsoleto si cambian).
+    """
+    target = CACHE_DIR / key
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=CACHE_DIR, prefix=f".{key}-"))
+    meta = {"columns": [], "nrows": int(len(df)),
+            "sources": {str(Path(p).resolve()): cache_key(p) for p in sources}}
+    try:
+        for i, col in enumerate(df.columns):
+            s = df[col]
+            info = {"name": col, "file": f"c{i}.npy", "dtype": str(s.dtype)}
+            if isinstance(s.dtype, pd.CategoricalDtype) or not (
+                pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s)
+            ):
+                # Texto: guardamos códigos enteros + lista de categorías
+                cat = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+                info["categories"] = [str(c) for c in cat.cat.categories]
+                arr = cat.cat.codes.to_numpy()
+            else:
+                arr = s.to_numpy()
+            np.save(tmp / info["file"], arr, allow_pickle=False)
+            meta["columns"].append(info)
+        _write_json_atomic(tmp / _META_FILE, meta)
+        if target.exists():
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
+
+
+def load_frame(key: str, columns: Optional[Iterable[str]] = None, mmap: bool = False,
+               categorical: bool = False, rows: Optional[np.ndarray] = None) -> Optional[pd.DataFrame]:
+    """
+    Carga una entrada de la caché (o ``None`` si no existe).
+    Con ``columns`` solo se leen esas columnas; con ``mmap`` los arrays numéricos
+    se mapean en memoria en lugar de copiarse; con ``categorical`` las columnas
+    de texto se devuelven como categóricas (sin materializar los strings). Con
+    ``rows`` (posiciones) solo se copian esas filas de cada columna mapeada.
+    """
+    entry_dir = CACHE_DIR / key
+    try:
+        with open(entry_dir / _META_FILE, encoding="utf-8") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+    wanted = None if columns is None else set(columns)
+    data = {}
+    for info in meta["columns"]:
+        if wanted is not None and info["name"] not in wanted:
+            continue
+        arr = np.load(entry_dir / info["file"], mmap_mode="r" if mmap or rows is not None else None,
+                      allow_pickle=False)
+        arr = arr.view(np.ndarray)  # vista sin copia: pandas no debe ver la subclase memmap
+        if rows is not None:
+            arr = arr[rows]
+        if "categories" in info:
+            s = pd.Series(pd.Categorical.from_codes(np.asarray(arr), info["categories"]))
+            if info["dtype"] != "category" and not categorical:
+                s = s.astype(info["dtype"])
+            arr = s
+        data[info["name"]] = arr
+    return pd.DataFrame(data, copy=False)
+
+
+def cached_read(path: Path, reader: Callable[[Path], pd.DataFrame],
+                columns: Optional[Iterable[str]] = None, mmap: bool = False,
+                tag: str = "", categorical: bool = False) -> pd.DataFrame:
+    """
+    Lee ``path`` desde la caché si hay una copia vigente; si no, lo lee con
+    ``reader`` y guarda la copia binaria para la próxima vez.
+    ``tag`` distingue copias del mismo archivo hechas con lectores distintos
+    (p.ej. otro esquema de tipos).
+    """
+    key = cache_key(path) + (f"-{tag}" if tag else "")
+    df = load_frame(key, columns=columns, mmap=mmap, categorical=categorical)
+    if df is not None:
+        return df
+
+    df = reader(path)
+    try:
+        save_frame(df, key, sources=[path])
+    except OSError:
+        return df if columns is None else df[[c for c in df.columns if c in set(columns)]]
+    return load_frame(key, columns=columns, mmap=mmap, categorical=categorical)
+
+
+def cache_info() -> pd.DataFrame:
+    """
+    Tabla con las entradas de la caché: archivos fuente, clave, filas y bytes en disco.
+    Una entrada es obsoleta (``stale``) si alguno de sus archivos fuente cambió.
+    """
+    index = _read_index()
+    rows = []
+    if CACHE_DIR.exists():
+        for d in sorted(p for p in CACHE_DIR.iterdir() if p.is_dir() and not p.name.startswith(".")):
+            try:
+                with open(d / _META_FILE, encoding="utf-8") as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            sources = meta.get("sources", {})
+            rows.append({
+                "key": d.name,
+                "source": ", ".join(Path(s).name for s in sources),
+                "stale": any(index.get(s, {}).get("key") != k for s, k in sources.items()),
+                "nrows": meta["nrows"],
+                "ncols": len(meta["columns"]),
+                "bytes": sum(f.stat().st_size for f in d.iterdir()),
+            })
+    return pd.DataFrame(rows, columns=["key", "source", "stale", "nrows", "ncols", "bytes"])
+
+
+def clear_cache(path: Optional[Path] = None, stale_only: bool = False) -> int:
+    """
+    Borra entradas de la caché y devuelve cuántas se eliminaron.
+      - ``path``: solo las derivadas del archivo indicado.
+      - ``stale_only``: solo las que ya no corresponden a la versión vigente de sus fuentes.
+    """
+    if not CACHE_DIR.exists():
+        return 0
+    info = cache_info()
+    if path is not None:
+        info = info[info["source"].str.split(", ").apply(lambda names: Path(path).name in names)]
+    if stale_only:
+        info = info[info["stale"]]
+
+    for key in info["key"]:
+        shutil.rmtree(CACHE_DIR / key, ignore_errors=True)
+    if path is None and not stale_only:
+        for leftover in CACHE_DIR.iterdir():  # temporales de escrituras interrumpidas
+            if leftover.is_dir():
+                shutil.rmtree(leftover, ignore_errors=True)
+        (CACHE_DIR / _INDEX_FILE).unlink(missing_ok=True)
+    return len(info)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspecciona o limpia la caché de CSV")
+    parser.add_argument("accion", choices=["info", "clear"], help="mostrar entradas o borrarlas")
+    parser.add_argument("--stale", action="store_true", help="borrar solo entradas obsoletas")
+    args = parser.parse_args()
+    if args.accion == "info":
+        print(cache_info().to_string(index=False))
+    else:
+        print(f"Entradas eliminadas: {clear_cache(stale_only=args.stale)}")
@@ -0,0 +1,294 @@
+# utils/correlation.py
+"""
+Matrices de correlación (Spearman o Pearson) con productos de matrices.
+
+Cada columna se rankea una sola vez (rangos promedio en los empates, como
+pandas/scipy) y la matriz sale de productos Zᵀ·Z (BLAS) calculados por bloques
+de columnas, así que cientos de variables no necesitan matrices intermedias
+N x p x p.
+
+Datos faltantes:
+  - "complete": se descartan las filas con algún NaN (lo que hacía
+    ``dropna(how="any")`` antes de ``df.corr``); resultado idéntico a pandas.
+  - "pairwise": cada par usa las filas donde ambas variables existen, con
+    conteos, sumas y sumas de cuadrados enmascarados (también por productos de
+    matrices). Para Spearman los rangos de cada columna completa solo sirven
+    a los pares que no pierden filas; los pares cuyas filas comunes son menos
+    que las de alguna de sus columnas se re-rankean sobre esas filas, como
+    pandas (resultado idéntico; el costo crece con los pares afectados).
+"""
+from typing import Optional, Sequence
+import numpy as np
+import pandas as pd
+
+from utils.cache import LRUMemo
+from utils.trace import traced
+
+
+def rank_columns(X: np.ndarray) -> np.ndarray:
+    """Rangos promedio por columna (NaN se mantiene como NaN)."""
+    return pd.DataFrame(X).rank(method="average", na_option="keep").to_numpy(dtype=np.float64)
+
+
+def _blocks(p: int, block: int):
+    return [slice(i, min(i + block, p)) for i in range(0, p, block)]
+
+
+def _corr_complete(R: np.ndarray, block: int) -> np.ndarray:
+    # Centramos y normalizamos cada columna: la correlación es el producto escalar
+    Z = R - R.mean(axis=0)
+    norms = np.sqrt((Z ** 2).sum(axis=0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        Z = Z / norms
+    p = Z.shape[1]
+    C = np.empty((p, p))
+    for bi in _blocks(p, block):
+        for bj in _blocks(p, block):
+            if bj.start < bi.start:
+                continue
+            C[bi, bj] = Z[:, bi].T @ Z[:, bj]
+            C[bj, bi] = C[bi, bj].T
+    return C
+
+
+def _corr_pairwise(R: np.ndarray, block: int, min_periods: int):
+    M = (~np.isnan(R)).astype(np.float64)
+    # Centramos con la media de cada columna (reduce la cancelación numérica)
+    with np.errstate(invalid="ignore"):
+        R = R - np.nanmean(R, axis=0)
+    Rz = np.where(M > 0, R, 0.0)
+    R2 = Rz ** 2
+    p = R.shape[1]
+    C = np.empty((p, p))
+    N = np.empty((p, p))
+    for bi in _blocks(p, block):
+        for bj in _blocks(p, block):
+            if bj.start < bi.start:
+                continue
+            Ma, Mb = M[:, bi], M[:, bj]
+            n = Ma.T @ Mb
+            sx = Rz[:, bi].T @ Mb
+            sy = Ma.T @ Rz[:, bj]
+            sxx = R2[:, bi].T @ Mb
+            syy = Ma.T @ R2[:, bj]
+            sxy = Rz[:, bi].T @ Rz[:, bj]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+            r[n < max(min_periods, 2)] = np.nan
+            C[bi, bj], C[bj, bi] = r, r.T
+            N[bi, bj], N[bj, bi] = n, n.T
+    return np.clip(C, -1.0, 1.0), N
+
+
+def _rerank_pairs(A: np.ndarray, C: np.ndarray, N: np.ndarray, min_periods: int) -> np.ndarray:
+    """
+    Spearman por pares: recalcula, re-rankeando sobre sus filas comunes, los
+    pares cuyo conteo es menor que el de alguna de sus columnas (ahí los
+    rangos de la columna completa no son los del par).
+    """
+    M = ~np.isnan(A)
+    n_col = M.sum(axis=0)
+    C = C.copy()
+    for i, j in zip(*np.nonzero(np.triu((N < n_col[:, None]) | (N < n_col[None, :]), k=1))):
+        if N[i, j] < max(min_periods, 2):
+            continue
+        both = M[:, i] & M[:, j]
+        r = np.corrcoef(rank_columns(A[both][:, [i, j]]), rowvar=False)[0, 1]
+        C[i, j] = C[j, i] = np.clip(r, -1.0, 1.0)
+    return C
+
+
+@traced()
+def corr_matrix(X, method: str = "spearman", missing: str = "complete",
+                block: int = 256, min_periods: int = 1, return_counts: bool = False):
+    """
+    Matriz de correlación de las columnas de ``X`` (DataFrame o array 2D).
+      - method: "spearman" (rangos) o "pearson" (valores).
+      - missing: "complete" o "pairwise" (ver docstring del módulo).
+      - block: columnas por bloque en los productos de matrices.
+      - min_periods: mínimo de observaciones por par (modo pairwise).
+    Con un DataFrame devuelve un DataFrame con sus etiquetas. Con
+    ``return_counts`` devuelve también el número de observaciones de cada par.
+    """
+    if method not in ("spearman", "pearson"):
+        raise ValueError(f"Método de correlación no soportado: {method!r}")
+    if missing not in ("complete", "pairwise"):
+        raise ValueError(f"Tratamiento de faltantes no soportado: {missing!r}")
+    labels = list(X.columns) if isinstance(X, pd.DataFrame) else None
+    A = np.asarray(X.apply(pd.to_numeric, errors="coerce") if labels is not None else X, dtype=np.float64)
+
+    if missing == "complete":
+        A = A[~np.isnan(A).any(axis=1)]
+        R = rank_columns(A) if method == "spearman" else A
+        C = _corr_complete(R, block)
+        N = np.full(C.shape, float(len(A)))
+    else:
+        R = rank_columns(A) if method == "spearman" else A
+        C, N = _corr_pairwise(R, block, min_periods)
+        if method == "spearman":
+            C = _rerank_pairs(A, C, N, min_periods)
+
+    if labels is not None:
+        C = pd.DataFrame(C, index=labels, columns=labels)
+        N = pd.DataFrame(N.astype(np.int64), index=labels, columns=labels)
+    return (C, N) if return_counts else C
+
+
+# Memo en proceso: (huella de los datos, columnas, método, faltantes) -> matriz; acotado (LRU)
+_MEMO = LRUMemo(maxsize=32)
+
+
+def correlaciones(df: pd.DataFrame, variables: Sequence[str], method: str = "spearman",
+                  missing: str = "complete", labels: Optional[dict] = None) -> pd.DataFrame:
+    """
+    Matriz de correlación de ``variables`` (las que existan en df), memorizada
+    por contenido: el heatmap y el PCA que usan la misma tabla la calculan una
+    sola vez por proceso. ``labels`` renombra filas/columnas del resultado.
+    """
+    cols = [c for c in variables if c in df.columns]
+    data = df[cols].apply(pd.to_numeric, errors="coerce")
+    key = (int(pd.util.hash_pandas_object(data, index=False).sum()), tuple(cols), len(data), method, missing)
+    if key not in _MEMO:
+        _MEMO[key] = corr_matrix(data, method=method, missing=missing)
+    C = _MEMO[key]
+    return C.rename(index=labels, columns=labels) if labels else C.copy()
+
+
+def pca_from_corr(C: np.ndarray, n_components: int = 2):
+    """
+    Componentes principales de datos estandarizados a partir de su matriz de
+    correlación (equivale a StandardScaler + PCA). Devuelve (componentes
+    p x k, autovalores, proporción de varianza explicada); el signo de cada
+    componente se fija como sklearn: su carga de mayor valor absoluto es positiva.
+    """
+    C = np.asarray(C, dtype=np.float64)
+    vals, vecs = np.linalg.eigh(C)
+    order = np.argsort(vals)[::-1][:n_components]
+    vals, vecs = vals[order], vecs[:, order]
+    signs = np.sign(vecs[np.argmax(np.abs(vecs), axis=0), np.arange(vecs.shape[1])])
+    signs[signs == 0] = 1.0
+    return vecs * signs, vals, vals / np.trace(C)
+
+
+# ---------------------------------------------------------------------------
+# Significancia: intervalos bootstrap y p-valores por permutación
+# ---------------------------------------------------------------------------
+
+def _dense_ranks(A: np.ndarray) -> np.ndarray:
+    """Rango denso (0..n-1, empates con el mismo entero) de cada columna."""
+    out = np.empty(A.shape, dtype=np.intp)
+    for j in range(A.shape[1]):
+        _, out[:, j] = np.unique(A[:, j], return_inverse=True)
+    return out
+
+
+def _rerank(D: np.ndarray) -> np.ndarray:
+    """
+    Rangos promedio de un lote de remuestras (B, n, p) dadas como rangos densos
+    del original: conteo por valor (bincount) + suma acumulada, sin ordenar.
+    """
+    B, n, p = D.shape
+    key = (np.arange(B)[:, None, None] * p + np.arange(p)[None, None, :]) * n + D
+    counts = np.bincount(key.ravel(), minlength=B * p * n).reshape(B, p, n)
+    cum = np.cumsum(counts, axis=2)
+    avg = (cum - counts) + (counts + 1) / 2.0
+    return avg.ravel()[key]
+
+
+def _standardize(R: np.ndarray) -> np.ndarray:
+    """Centra y normaliza cada columna de un lote (B, n, p)."""
+    Z = R - R.mean(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return Z / np.sqrt((Z ** 2).sum(axis=1, keepdims=True))
+
+
+def _boot_batch(base: np.ndarray, size: int, seed, method: str) -> np.ndarray:
+    """Matrices de correlación de ``size`` remuestras bootstrap (un matmul por lote)."""
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, base.shape[0], size=(size, base.shape[0]))
+    sample = base[idx]
+    Z = _standardize(_rerank(sample) if method == "spearman" else sample)
+    return np.matmul(Z.transpose(0, 2, 1), Z)
+
+
+def _perm_batch(Z0: np.ndarray, size: int, seed, observed: np.ndarray) -> np.ndarray:
+    """
+    Cuántas permutaciones igualan o superan |r observado| en cada celda. Cada
+    columna se permuta por separado (nula conjunta de independencia); los rangos
+    estandarizados no cambian al permutar, así que no hay que re-rankear.
+    """
+    rng = np.random.default_rng(seed)
+    Z = rng.permuted(np.broadcast_to(Z0, (size, *Z0.shape)), axis=1)
+    C = np.matmul(Z.transpose(0, 2, 1), Z)
+    return (np.abs(C) >= np.abs(observed) - 1e-12).sum(axis=0)
+
+
+# Elementos (réplicas x filas x columnas) por lote de corr_significance: acota
+# la memoria de cada lote sin importar el tamaño de los datos
+_BATCH_BUDGET = 1_000_000
+
+
+def _run_batches(fn, args, n_rep: int, batch: int, seed, jobs: Optional[int]):
+    """
+    Reparte ``n_rep`` réplicas en lotes, cada uno con su semilla (SeedSequence).
+    Sin ``jobs``, un proceso por núcleo; dentro de un proceso hijo (pool de
+    figure_server, sweep o render_all) uno solo, para no multiplicar procesos.
+    """
+    import multiprocessing
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+
+    sizes = [min(batch, n_rep - s) for s in range(0, n_rep, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if jobs is None:
+        jobs = 1 if multiprocessing.parent_process() is not None else os.cpu_count() or 1
+    if jobs <= 1 or len(sizes) == 1:
+        return [fn(*args[:1], size, ss, *args[1:]) for size, ss in zip(sizes, seeds)]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(sizes))) as pool:
+        futs = [pool.submit(fn, *args[:1], size, ss, *args[1:]) for size, ss in zip(sizes, seeds)]
+        return [f.result() for f in futs]
+
+
+@traced()
+def corr_significance(X, method: str = "spearman", n_boot: int = 10_000, n_perm: int = 10_000,
+                      alpha: float = 0.05, seed: Optional[int] = 0, jobs: Optional[int] = None,
+                      batch: Optional[int] = None) -> dict:
+    """
+    Intervalos de confianza bootstrap (percentil, 1 - alpha) y p-valores de
+    permutación (bilaterales) para cada celda de la matriz de correlación de
+    ``X``, sobre las filas completas. Las réplicas se procesan por lotes de
+    ``batch`` (un producto de matrices por lote; por defecto, tantas como
+    quepan en _BATCH_BUDGET elementos de n x p) repartidos en ``jobs``
+    procesos; con la misma ``seed`` y ``batch`` el resultado no depende de ``jobs``.
+    Devuelve {"r", "lo", "hi", "p", "n", "n_boot", "n_perm", "alpha"} (DataFrames
+    etiquetados si X lo es).
+    """
+    if method not in ("spearman", "pearson"):
+        raise ValueError(f"Método de correlación no soportado: {method!r}")
+    labels = list(X.columns) if isinstance(X, pd.DataFrame) else None
+    A = np.asarray(X.apply(pd.to_numeric, errors="coerce") if labels is not None else X, dtype=np.float64)
+    A = A[~np.isnan(A).any(axis=1)]
+    p = A.shape[1]
+    batch = batch or max(1, min(max(n_boot, n_perm), _BATCH_BUDGET // max(A.size, 1)))
+
+    base = _dense_ranks(A) if method == "spearman" else A
+    Z0 = _standardize((rank_columns(A) if method == "spearman" else A)[None])[0]
+    r = Z0.T @ Z0
+
+    lo = hi = np.full((p, p), np.nan)
+    if n_boot:
+        stack = np.concatenate(_run_batches(_boot_batch, (base, method), n_boot, batch, seed, jobs))
+        with np.errstate(invalid="ignore"):
+            lo, hi = np.nanpercentile(stack, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    pval = np.full((p, p), np.nan)
+    if n_perm:
+        perm_seed = None if seed is None else [seed, 1]
+        hits = sum(_run_batches(_perm_batch, (Z0, r), n_perm, batch, perm_seed, jobs))
+        pval = (hits + 1) / (n_perm + 1)
+        np.fill_diagonal(pval, 0.0)
+
+    out = {"r": r, "lo": lo, "hi": hi, "p": pval}
+    if labels is not None:
+        out = {k: pd.DataFrame(v, index=labels, columns=labels) for k, v in out.items()}
+    out.update(n=len(A), n_boot=n_boot, n_perm=n_perm, alpha=alpha)
+    return out
@@ -1,22 +1,344 @@
 # utils/load_data.py
 from pathlib import Path
+from typing import Optional
+import csv
+import hashlib
+import io
+import logging
+import sys
+import warnings
+
+import numpy as np
 import pandas as pd
 
+from utils.cache import LRUMemo, cache_key, cached_read, load_frame, save_frame
+from utils.trace import traced
+
 # Directorio raíz del proyecto (sube un nivel desde /utils/)
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 
-def _read_csv_smart(path: Path) -> pd.DataFrame:
-    """Lector robusto para CSV (coma/; y utf-8/latin-1)."""
+logger = logging.getLogger(__name__)
+
+# Esquema de tipos de las columnas conocidas (evita que pandas los infiera en cada lectura)
+MICRO_SCHEMA = {
+    "soil_number": "int64",
+    "time": "float64",
+    "bacterial_growth_rate": "float64",
+    "fungal_growth_rate": "float64",
+    "respiration_rate": "float64",
+}
+ENV_SCHEMA = {
+    "soil_number": "int64",
+    "author_year": str,
+    "longitude": "float64",
+    "latitude": "float64",
+    "land_cover": str,
+    "aridity_index": "float64",
+    "pH": "float64",
+    "carbon_availability": "float64",
+    "fungal_to_bacterial_dominance_in_the_moist_control": "float64",
+    "carbon_use_efficiency_in_the_moist_control": "float64",
+    "incubation_temperature": "float64",
+    "soil_moisture_at_the_end_of_drying": "float64",
+    "soil_moisture_in_the_moist_control": "float64",
+    "soil_moisture_after_rewetting": "float64",
+    "soil_moisture_increment_at_rewetting": "float64",
+}
+SCHEMA = {**ENV_SCHEMA, **MICRO_SCHEMA}
+# Huella del esquema: si cambia, las copias en caché hechas con el anterior no se reutilizan
+_SCHEMA_TAG = hashlib.blake2b(repr(sorted(SCHEMA.items(), key=str)).encode(), digest_size=4).hexdigest()
+
+# Tamaño de la muestra usada para detectar separador y codificación
+_SNIFF_BYTES = 64 * 1024
+
+
+def _sniff_csv(path: Path) -> dict:
+    """
+    Detecta separador, codificación y cabecera leyendo solo una muestra inicial.
+    Devuelve un dict con "sep", "encoding" y "header" (lista de columnas).
+    """
+    with open(path, "rb") as fh:
+        raw = fh.read(_SNIFF_BYTES)
+    # Cortamos en el último salto de línea para no partir un carácter multibyte
+    if len(raw) == _SNIFF_BYTES and b"\n" in raw:
+        raw = raw[: raw.rindex(b"\n")]
     try:
-        return pd.read_csv(path)
-    except Exception:
+        text, encoding = raw.decode("utf-8-sig"), "utf-8-sig"
+    except UnicodeDecodeError:
+        text, encoding = raw.decode("latin-1"), "latin-1"
+
+    try:
+        sep = csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+    except csv.Error:
+        sep = ","
+    first = text.splitlines()[0] if text else ""
+    header = next(csv.reader([first], delimiter=sep), [])
+    return {"sep": sep, "encoding": encoding, "header": [h.strip() for h in header]}
+
+
+def _fallback(kwargs: dict, exc: ValueError, name: str) -> dict:
+    """
+    Respaldo de lectura tras un error: un byte no UTF-8 más allá de la muestra
+    -> latin-1; datos que no encajan en el esquema (p.ej. texto en una columna
+    numérica) -> tipos inferidos. Si ya no queda respaldo, relanza ``exc``.
+    """
+    if isinstance(exc, UnicodeDecodeError):  # subclase de ValueError
+        if kwargs.get("encoding") == "latin-1":
+            raise exc
+        return {**kwargs, "encoding": "latin-1"}
+    if kwargs.get("dtype") is None:
+        raise exc
+    warnings.warn(f"{name}: esquema de tipos no aplicable ({exc}); se infieren los tipos")
+    return {**kwargs, "dtype": None}
+
+
+def _with_fallbacks(read, kwargs: dict, name: str):
+    """``read(**kwargs)`` con los respaldos de _fallback (combinables); devuelve (resultado, kwargs usados)."""
+    while True:
         try:
-            return pd.read_csv(path, sep=None, engine="python")
-        except Exception:
-            return pd.read_csv(path, sep=None, engine="python", encoding="latin-1")
+            return read(**kwargs), kwargs
+        except ValueError as exc:
+            kwargs = _fallback(kwargs, exc, name)
+
+
+def _iter_chunks(path: Path, chunksize: int, kwargs: dict):
+    """
+    Bloques de ``chunksize`` filas con los mismos respaldos que la lectura
+    completa. Si un bloque falla a mitad del archivo, el iterador se vuelve a
+    abrir con el respaldo y continúa tras las filas ya entregadas (con el mismo
+    índice continuo que un solo lector), en vez de cortarse.
+    """
+    done = 0
+    while True:
+        offset = done
+        try:
+            with pd.read_csv(path, chunksize=chunksize, skiprows=range(1, done + 1) if done else None,
+                             **kwargs) as reader:
+                for chunk in reader:
+                    if offset:
+                        chunk.index = chunk.index + offset
+                    done += len(chunk)
+                    yield chunk
+            return
+        except ValueError as exc:
+            kwargs = _fallback(kwargs, exc, path.name)
+
+
+@traced()
+def _read_csv_smart(path: Path, chunksize: Optional[int] = None, usecols: Optional[list] = None):
+    """
+    Lector robusto para CSV (coma/; y utf-8/latin-1).
+    Detecta el dialecto una sola vez con una muestra y luego parsea con el motor C
+    y el esquema de tipos conocido. Con ``chunksize`` devuelve un iterador de
+    DataFrames (para archivos más grandes que la memoria); con ``usecols`` solo
+    se materializan esas columnas. La muestra puede no ver todo el archivo: en
+    ambos modos, un byte no UTF-8 o un valor fuera del esquema más adelante
+    activan los respaldos de _fallback.
+    """
+    path = Path(path)
+    dialect = _sniff_csv(path)
+    cols = dialect["header"] if usecols is None else [c for c in dialect["header"] if c in set(usecols)]
+    dtype = {c: SCHEMA[c] for c in cols if c in SCHEMA}
+    kwargs = dict(sep=dialect["sep"], encoding=dialect["encoding"], dtype=dtype, engine="c")
+    if usecols is not None:
+        kwargs["usecols"] = cols
+
+    if chunksize is not None:
+        return _iter_chunks(path, chunksize, kwargs)
+    return _with_fallbacks(lambda **kw: pd.read_csv(path, **kw), kwargs, path.name)[0]
+
+
+def iter_csv(path: Path, chunksize: int = 1_000_000):
+    """Itera un CSV por bloques de ``chunksize`` filas (ver _read_csv_smart)."""
+    return _read_csv_smart(Path(path), chunksize=chunksize)
+
+
+def csv_data_start(path: Path) -> int:
+    """Posición en bytes donde empiezan los datos (justo después de la cabecera)."""
+    with open(path, "rb") as fh:
+        fh.readline()
+        return fh.tell()
+
+
+def csv_complete_end(path: Path) -> int:
+    """Posición en bytes tras la última línea completa (ignora una línea a medio escribir)."""
+    size = Path(path).stat().st_size
+    with open(path, "rb") as fh:
+        pos = size
+        while pos > 0:
+            step = min(_SNIFF_BYTES, pos)
+            fh.seek(pos - step)
+            block = fh.read(step)
+            if b"\n" in block:
+                return pos - step + block.rindex(b"\n") + 1
+            pos -= step
+    return 0
+
+
+def iter_csv_range(path: Path, start: Optional[int] = None, end: Optional[int] = None,
+                   block_bytes: int = 64 << 20):
+    """
+    Itera como DataFrames las filas de un CSV entre los bytes ``start`` (por
+    defecto, el inicio de los datos) y ``end`` (por defecto, la última línea
+    completa), en bloques de ~``block_bytes`` cortados en saltos de línea.
+    Permite leer solo lo añadido a un archivo desde una posición conocida.
+    """
+    path = Path(path)
+    dialect = _sniff_csv(path)
+    header = dialect["header"]
+    dtype = {c: SCHEMA[c] for c in header if c in SCHEMA}
+    start = csv_data_start(path) if start is None else start
+    end = csv_complete_end(path) if end is None else end
+    kwargs = dict(header=None, names=header, sep=dialect["sep"], encoding=dialect["encoding"], dtype=dtype,
+                  engine="c")
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        pos = start
+        while pos < end:
+            data = fh.read(min(block_bytes, end - pos))
+            if pos + len(data) < end and b"\n" in data:
+                cut = data.rindex(b"\n") + 1
+                fh.seek(pos + cut)
+                data = data[:cut]
+            pos += len(data)
+            if data.strip():
+                df, kwargs = _with_fallbacks(lambda **kw: pd.read_csv(io.BytesIO(data), **kw), kwargs, path.name)
+                yield df
+
+
+# Operadores admitidos en ``filters`` (mismo formato que los filtros de pyarrow/parquet)
+_FILTER_OPS = {
+    "==": lambda s, v: s == v,
+    "!=": lambda s, v: s != v,
+    "<": lambda s, v: s < v,
+    "<=": lambda s, v: s <= v,
+    ">": lambda s, v: s > v,
+    ">=": lambda s, v: s >= v,
+    "in": lambda s, v: s.isin(list(v)),
+    "not in": lambda s, v: ~s.isin(list(v)),
+}
+
+
+def _filter_mask(df: pd.DataFrame, filters) -> pd.Series:
+    """Máscara booleana con la conjunción de los filtros (col, op, valor) aplicables a df."""
+    mask = pd.Series(True, index=df.index)
+    for col, op, value in filters:
+        if op not in _FILTER_OPS:
+            raise ValueError(f"Operador de filtro no soportado: {op!r}")
+        mask &= _FILTER_OPS[op](df[col], value).fillna(False).astype(bool)
+    return mask
+
+
+def _read_table(path: Path, columns: Optional[list], filters: list,
+                use_cache: bool, mmap: bool, categorical: bool = False,
+                chunksize: int = 1_000_000) -> pd.DataFrame:
+    """
+    Lee una tabla leyendo solo ``columns`` (None = todas) y aplicando ``filters``
+    durante la lectura: desde la caché, filtrando sobre las columnas cargadas;
+    desde el CSV, con usecols y filtrado bloque a bloque.
+    """
+    if use_cache:
+        df = cached_read(path, _read_csv_smart, columns=columns, mmap=mmap, tag=_SCHEMA_TAG,
+                         categorical=categorical)
+        return df[_filter_mask(df, filters)].reset_index(drop=True) if filters else df
+
+    if not filters:
+        return _read_csv_smart(path, usecols=columns)
+    parts = [chunk[_filter_mask(chunk, filters)]
+             for chunk in _read_csv_smart(path, chunksize=chunksize, usecols=columns)]
+    return pd.concat(parts, ignore_index=True)
+
+
+def _split_request(header: list, columns: Optional[list], filters: list):
+    """Columnas a leer y filtros que corresponden a una tabla con esa cabecera."""
+    own_filters = [f for f in filters if f[0] in header]
+    if columns is None:
+        return None, own_filters
+    wanted = {"soil_number", *columns, *(f[0] for f in own_filters)}
+    return [c for c in header if c in wanted], own_filters
+
+
+def _default_nbytes(s: pd.Series) -> int:
+    """Bytes que ocuparía la columna en la representación por defecto (64 bits / texto)."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Equivalente en texto: cada fila guarda un puntero a su string
+        sizes = np.array([sys.getsizeof(str(c)) for c in s.cat.categories] + [0], dtype=np.int64)
+        return int(np.take(sizes, s.cat.codes.to_numpy()).sum() + 8 * len(s))
+    if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s):
+        return 8 * len(s)
+    return int(s.memory_usage(deep=True, index=False))
+
+
+def compact_frame(df: pd.DataFrame, float_rtol: float = 1e-6) -> pd.DataFrame:
+    """
+    Representación compacta de una tabla cargada:
+      - columnas de texto (land_cover, author_year) como categóricas;
+      - enteros (soil_number...) reducidos al tipo más pequeño que los contiene;
+      - mediciones float64 en float32 si todas conservan la precisión
+        (error relativo <= float_rtol tras el viaje de ida y vuelta).
+    El resumen (bytes antes/después/ahorrados y columnas en float32) queda en
+    ``df.attrs["compact_report"]`` y se registra en el log.
+    """
+    before = sum(_default_nbytes(df[c]) for c in df.columns)
+    out = {}
+    to_float32 = []
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            out[col] = s
+        elif pd.api.types.is_bool_dtype(s):
+            out[col] = s
+        elif pd.api.types.is_integer_dtype(s):
+            out[col] = pd.to_numeric(s, downcast="integer")
+        elif pd.api.types.is_float_dtype(s):
+            x = s.to_numpy(dtype=np.float64)
+            x32 = x.astype(np.float32)
+            finite = np.isfinite(x)
+            ok = np.array_equal(np.isfinite(x32), finite) and np.allclose(
+                x32[finite].astype(np.float64), x[finite], rtol=float_rtol, atol=0.0)
+            if ok:
+                out[col] = pd.Series(x32, index=s.index, name=col)
+                to_float32.append(col)
+            else:
+                out[col] = s
+        else:
+            out[col] = s.astype("category")
+    df = pd.DataFrame(out, index=df.index, copy=False)
+
+    after = int(df.memory_usage(deep=True, index=False).sum())
+    report = {"bytes_before": before, "bytes_after": after,
+              "bytes_saved": before - after, "float32": to_float32}
+    df.attrs["compact_report"] = report
+    logger.info("compact: %d -> %d bytes (ahorro %d); float32: %s",
+                before, after, before - after, ", ".join(to_float32) or "-")
+    return df
+
+
+@traced()
+def load_env_micro(use_cache: bool = True, mmap: bool = False,
+                   columns: Optional[list] = None, filters: Optional[list] = None,
+                   compact: bool = False, source=None):
+    """
+    Carga los dos CSV ubicados en la raíz del proyecto.
+      - use_cache: sirve la copia binaria de utils.cache si está vigente
+        (y la crea en la primera lectura).
+      - mmap: con caché, mapea las columnas numéricas en memoria en vez de copiarlas.
+      - columns: columnas a cargar (de cualquiera de las dos tablas); soil_number
+        se incluye siempre. None = todas.
+      - filters: lista de (columna, operador, valor), p.ej.
+        [("land_cover", "in", {"Forest", "Grassland"}), ("time", ">=", 0)].
+        Se aplican mientras se lee; si filtran la tabla ambiental, la microbiana
+        se restringe a los soil_number que quedan.
+      - compact: tipos compactos (ver compact_frame); el texto llega como
+        categórica desde la caché, sin pasar por strings.
+      - source: carpeta o patrón glob con fragmentos por estudio en lugar de
+        data/ (ver utils.shards.load_shards: lectura en paralelo, columnas
+        "shard" y "soil_number_local", soil_number único entre estudios).
+    """
+    if source is not None:
+        from utils.shards import load_shards
+        return load_shards(source, columns=columns, filters=filters, use_cache=use_cache, compact=compact)
 
-def load_env_micro():
-    """Carga los dos CSV ubicados en la raíz del proyecto."""
     env_path = PROJECT_ROOT / "data/environmental-data.csv"
     micro_path = PROJECT_ROOT / "data/microbial-responses.csv"
 
@@ -25,28 +347,225 @@ def load_env_micro():
         if not p.exists():
             raise FileNotFoundError(f"No se encontró el archivo: {p}")
 
-    df_env = _read_csv_smart(env_path)
-    df_micro = _read_csv_smart(micro_path)
+    filters = list(filters or [])
+    env_header = _sniff_csv(env_path)["header"]
+    micro_header = _sniff_csv(micro_path)["header"]
+    unknown = {f[0] for f in filters} - set(env_header) - set(micro_header)
+    if unknown:
+        raise KeyError(f"Columnas de filtro inexistentes: {sorted(unknown)}")
+
+    env_cols, env_filters = _split_request(env_header, columns, filters)
+    micro_cols, micro_filters = _split_request(micro_header, columns, filters)
+    df_env = _read_table(env_path, env_cols, env_filters, use_cache, mmap, categorical=compact)
+    if env_filters:
+        # Semi-join: solo las mediciones de los suelos que pasaron el filtro
+        micro_filters = micro_filters + [("soil_number", "in", set(df_env["soil_number"]))]
+    df_micro = _read_table(micro_path, micro_cols, micro_filters, use_cache, mmap, categorical=compact)
+    if compact:
+        df_env, df_micro = compact_frame(df_env), compact_frame(df_micro)
     return df_env, df_micro
 
-def prep_graph1(df_env: pd.DataFrame, df_micro: pd.DataFrame, min_n: int = 5):
+
+@traced()
+def load_env(path: Optional[Path] = None, columns: Optional[list] = None, use_cache: bool = True) -> pd.DataFrame:
+    """Solo la tabla ambiental (por defecto data/environmental-data.csv), con la misma caché."""
+    path = Path(path) if path is not None else PROJECT_ROOT / "data/environmental-data.csv"
+    if not path.exists():
+        raise FileNotFoundError(f"No se encontró el archivo: {path}")
+    cols, _ = _split_request(_sniff_csv(path)["header"], columns, [])
+    return _read_table(path, cols, [], use_cache, False)
+
+
+@traced()
+def join_env_micro(df_env: pd.DataFrame, df_micro: pd.DataFrame) -> pd.DataFrame:
+    """
+    Une micro con env por soil_number (inner, orden de micro), igual que
+    ``pd.merge(df_micro, df_env, on="soil_number")`` pero con una búsqueda en el
+    índice de suelos en lugar de un hash-merge: cada fila de micro toma la fila
+    de env en la posición de su soil_number. Las demás columnas presentes en
+    ambas tablas (p.ej. "shard" de utils.shards) se toman de micro.
+    """
+    shared = [c for c in df_env.columns if c in df_micro.columns and c != "soil_number"]
+    soils = pd.Index(df_env["soil_number"])
+    if not soils.is_unique:
+        return pd.merge(df_micro, df_env, on=["soil_number", *shared], how="inner")
+
+    pos = soils.get_indexer(df_micro["soil_number"])
+    keep = pos >= 0
+    left = df_micro[keep].reset_index(drop=True) if not keep.all() else df_micro.reset_index(drop=True)
+    right = df_env.drop(columns=["soil_number", *shared]).take(pos[keep]).reset_index(drop=True)
+    return pd.concat([left, right], axis=1)
+
+
+# Memo en proceso de load_joined: (clave de la unión completa, petición) -> DataFrame unido.
+# Acotado (LRU): cada combinación de columnas/filtros (p.ej. cada región) es una entrada.
+_JOINED_MEMO = LRUMemo(maxsize=8)
+
+
+def _select_joined(df: pd.DataFrame, columns: Optional[list], filters: list) -> pd.DataFrame:
+    """Columnas pedidas (más soil_number, las de los filtros y las de fragmentos) y filas que pasan los filtros."""
+    unknown = {f[0] for f in filters} - set(df.columns)
+    if unknown:
+        raise KeyError(f"Columnas de filtro inexistentes: {sorted(unknown)}")
+    if columns is not None:
+        wanted = {"soil_number", "shard", "soil_number_local", *columns, *(f[0] for f in filters)}
+        df = df[[c for c in df.columns if c in wanted]]
+    return df[_filter_mask(df, filters)].reset_index(drop=True) if filters else df
+
+
+def _save_soil_index(df: pd.DataFrame, key: str, sources: list) -> None:
+    """Índice por suelo de la unión persistida: soil_number ordenado y la fila de cada valor ("<clave>-soils")."""
+    soils = df["soil_number"].to_numpy()
+    order = np.argsort(soils, kind="stable")
+    save_frame(pd.DataFrame({"soil_number": soils[order], "row": order}), f"{key}-soils", sources=sources)
+
+
+def _soil_rows(key: str, soils) -> Optional[np.ndarray]:
     """
-    Prepara el DataFrame para el Gráfico 1:
-      - Une env (land_cover) con micro (respiration_rate) por soil_number.
+    Posiciones (en orden) de las filas de la unión persistida con soil_number en
+    ``soils``: dos búsquedas binarias por suelo en su índice, sin recorrer la
+    tabla unida. None si el índice no está en la caché.
+    """
+    idx = load_frame(f"{key}-soils", mmap=True)
+    if idx is None:
+        return None
+    sorted_soils, order = idx["soil_number"].to_numpy(), idx["row"].to_numpy()
+    try:
+        wanted = np.sort(np.asarray(list(soils), dtype=sorted_soils.dtype))
+    except (TypeError, ValueError):
+        return None
+    lo = np.searchsorted(sorted_soils, wanted, side="left")
+    hi = np.searchsorted(sorted_soils, wanted, side="right")
+    parts = [order[a:b] for a, b in zip(lo, hi) if b > a]
+    return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+
+
+@traced()
+def load_joined(columns: Optional[list] = None, filters: Optional[list] = None,
+                use_cache: bool = True, mmap: bool = False, compact: bool = False,
+                source=None) -> pd.DataFrame:
+    """
+    Devuelve micro unido con env por soil_number (misma forma que el antiguo
+    ``pd.merge(df_micro, df_env, on="soil_number")``), con ``columns`` y
+    ``filters`` como en load_env_micro.
+
+    Con ``use_cache`` la unión completa (todas las columnas, sin filtros) se
+    calcula una sola vez y se guarda junto a la caché de CSV (su clave depende
+    de las versiones de ambos archivos); cada petición lee de ella solo sus
+    columnas y aplica los filtros, sin crear entradas nuevas en disco. Un
+    filtro ``("soil_number", "in", suelos)`` (p.ej. una región) se resuelve
+    con el índice por suelo de la unión: solo se copian las filas de esos
+    suelos, sin recorrer la tabla. Los resultados se memorizan en el proceso
+    (LRU de pocas entradas). El resultado es compartido: no modificarlo en el
+    lugar (asignar columnas nuevas sí es seguro). Con ``compact`` la tabla usa
+    tipos compactos (ver compact_frame). Con ``source`` se unen los fragmentos
+    de esa carpeta o glob (ver load_env_micro).
+    """
+    if source is not None:
+        from utils.shards import find_shards
+        paths = [p for _, env, micro in find_shards(source) for p in (env, micro)]
+    else:
+        paths = [PROJECT_ROOT / "data/environmental-data.csv", PROJECT_ROOT / "data/microbial-responses.csv"]
+    for p in paths:
+        if not p.exists():
+            raise FileNotFoundError(f"No se encontró el archivo: {p}")
+
+    filters = list(filters or [])
+    request = repr((sorted(columns) if columns is not None else None,
+                    sorted((str(c), op, repr(sorted(v, key=str) if isinstance(v, (set, frozenset)) else v))
+                           for c, op, v in filters),
+                    compact, use_cache))
+    sources = "|".join([*(cache_key(p) for p in paths), _SCHEMA_TAG])
+    key = "joined-" + hashlib.blake2b(sources.encode(), digest_size=8).hexdigest()
+
+    memo_key = (key, request)
+    if memo_key in _JOINED_MEMO:
+        return _JOINED_MEMO[memo_key].copy(deep=False)
+
+    if not use_cache:
+        # Sin caché: lectura con columnas y filtros empujados al CSV
+        df_env, df_micro = load_env_micro(use_cache=False, columns=columns, filters=filters, source=source)
+        df = join_env_micro(df_env, df_micro)
+    else:
+        wanted = None
+        if columns is not None:
+            wanted = {"soil_number", "shard", "soil_number_local", *columns, *(f[0] for f in filters)}
+        by_soil = next((f for f in filters if f[0] == "soil_number" and f[1] == "in"), None)
+
+        def read():
+            rows = _soil_rows(key, by_soil[2]) if by_soil is not None else None
+            return rows, load_frame(key, columns=wanted, mmap=mmap, categorical=compact, rows=rows)
+
+        rows, df = read()
+        if df is None:
+            df_env, df_micro = load_env_micro(use_cache=True, source=source)
+            full = join_env_micro(df_env, df_micro)
+            try:
+                save_frame(full, key, sources=paths)
+                _save_soil_index(full, key, paths)
+                rows, df = read()
+            except OSError:
+                rows, df = None, None
+            if df is None:
+                rows, df = None, full
+        # Con las filas ya elegidas por suelo, solo quedan los demás filtros
+        rest = [f for f in filters if f is not by_soil] if rows is not None else filters
+        df = _select_joined(df, columns, rest)
+    if compact:
+        df = compact_frame(df)
+    _JOINED_MEMO[memo_key] = df
+    return df.copy(deep=False)
+
+
+def iter_joined(columns: Optional[list] = None, filters: Optional[list] = None,
+                chunksize: int = 1_000_000, compact: bool = False):
+    """
+    Versión por bloques de load_joined: la tabla ambiental (pequeña) se carga
+    entera y la microbiana se lee del CSV en bloques de ``chunksize`` filas,
+    con las mismas ``columns``/``filters``; cada bloque se une con env y se
+    entrega como DataFrame. La memoria queda acotada por el tamaño del bloque.
+    """
+    env_path = PROJECT_ROOT / "data/environmental-data.csv"
+    micro_path = PROJECT_ROOT / "data/microbial-responses.csv"
+    for p in (env_path, micro_path):
+        if not p.exists():
+            raise FileNotFoundError(f"No se encontró el archivo: {p}")
+
+    filters = list(filters or [])
+    env_header = _sniff_csv(env_path)["header"]
+    micro_header = _sniff_csv(micro_path)["header"]
+    env_cols, env_filters = _split_request(env_header, columns, filters)
+    micro_cols, micro_filters = _split_request(micro_header, columns, filters)
+
+    df_env = _read_table(env_path, env_cols, env_filters, True, False, categorical=compact)
+    if compact:
+        df_env = compact_frame(df_env)
+    if env_filters:
+        micro_filters = micro_filters + [("soil_number", "in", set(df_env["soil_number"]))]
+    for chunk in _read_csv_smart(micro_path, chunksize=chunksize, usecols=micro_cols):
+        if micro_filters:
+            chunk = chunk[_filter_mask(chunk, micro_filters)]
+        if compact:
+            chunk = compact_frame(chunk)
+        yield join_env_micro(df_env, chunk)
+
+
+@traced()
+def prep_graph1(df: pd.DataFrame, df_micro: Optional[pd.DataFrame] = None, *, min_n: int = 5):
+    """
+    Prepara el DataFrame para el Gráfico 1 a partir de la tabla unida (load_joined):
+      - Toma land_cover y respiration_rate.
       - Limpia tipos/nulos.
       - Filtra categorías con menos de min_n observaciones.
       - Devuelve (df_limpio, orden_categorias_por_mediana).
+    Sigue aceptando la forma anterior ``prep_graph1(df_env, df_micro)``: si se
+    pasa ``df_micro``, primero se unen env y micro por soil_number. ``min_n``
+    solo se acepta por nombre.
     """
-    env_cols = ["soil_number", "land_cover"]
-    micro_cols = ["soil_number", "respiration_rate"]
-
-    df = pd.merge(
-        df_micro[micro_cols],
-        df_env[env_cols],
-        on="soil_number",
-        how="inner"
-    )
-
+    if df_micro is not None:
+        df = pd.merge(df_micro[["soil_number", "respiration_rate"]], df[["soil_number", "land_cover"]],
+                      on="soil_number", how="inner")
+    df = df[["soil_number", "respiration_rate", "land_cover"]].copy()
     df["land_cover"] = df["land_cover"].astype("category", errors="ignore")
     df["respiration_rate"] = pd.to_numeric(df["respiration_rate"], errors="coerce")
     df = df.dropna(subset=["land_cover", "respiration_rate"]).copy()
@@ -66,3 +585,24 @@ def prep_graph1(df_env: pd.DataFrame, df_micro: pd.DataFrame, min_n: int = 5):
           .tolist()
     )
     return df, order_by_median
+
+
+def subset_graph1(base: pd.DataFrame, min_n: int, medians: Optional[pd.Series] = None):
+    """
+    Igual que ``prep_graph1(df, min_n=min_n)`` pero partiendo de ``base``, la tabla ya
+    limpia de ``prep_graph1(df, min_n=0)``: solo filtra por conteos y reordena.
+    Con ``medians`` (mediana por cobertura de ``base``) no se recalculan las
+    medianas; sirve para derivar varias variantes de min_n de una sola limpieza.
+    """
+    df = base
+    if min_n and min_n > 0:
+        counts = df["land_cover"].value_counts()
+        valid_levels = counts[counts >= min_n].index
+        df = df[df["land_cover"].isin(valid_levels)].copy()
+        if hasattr(df["land_cover"], "cat"):
+            df["land_cover"] = df["land_cover"].cat.remove_unused_categories()
+    if medians is None:
+        medians = df.groupby("land_cover", observed=True)["respiration_rate"].median()
+    levels = set(df["land_cover"].unique())
+    order_by_median = medians[medians.index.isin(levels)].sort_values(ascending=False).index.tolist()
+    return df, order_by_median
@@ -0,0 +1,152 @@
+# utils/pca.py
+"""
+PCA de datos estandarizados por bloques, sin materializar la matriz completa.
+
+``StreamingPCA`` acumula por bloque el conteo, la media y la matriz de
+co-momentos (fusión de Chan et al., exacta y estable), así que la memoria es
+O(p²) sin importar cuántas filas lleguen. Al final la matriz de correlación
+se descompone (utils.correlation.pca_from_corr): el resultado es el mismo que
+StandardScaler + PCA sobre todas las filas, no una aproximación.
+
+El modelo ajustado (acumulados, desviaciones, componentes, varianzas) se
+guarda en JSON y proyecta muestras nuevas sin volver a ajustar; como guarda
+los co-momentos, también se puede seguir alimentando o fusionar con otro.
+"""
+from pathlib import Path
+from typing import Optional, Sequence
+import json
+
+import numpy as np
+import pandas as pd
+
+from utils.correlation import pca_from_corr
+
+
+class StreamingPCA:
+    """
+    PCA estandarizado alimentado por bloques.
+      - variables: columnas a usar (en ese orden); las filas con algún NaN en
+        ellas se descartan, como ``dropna(how="any")``.
+    Uso: ``partial_fit`` por bloque, ``finalize`` y luego ``transform``.
+    """
+
+    def __init__(self, variables: Sequence[str], n_components: int = 2):
+        self.variables = list(variables)
+        self.n_components = n_components
+        p = len(self.variables)
+        self.n = 0
+        self.mean_ = np.zeros(p)
+        self._m2 = np.zeros((p, p))
+        self.scale_ = None
+        self.components_ = None
+        self.explained_variance_ = None
+        self.explained_variance_ratio_ = None
+
+    def _matrix(self, df: pd.DataFrame) -> np.ndarray:
+        A = df[self.variables].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        return A[~np.isnan(A).any(axis=1)]
+
+    def partial_fit(self, df: pd.DataFrame) -> "StreamingPCA":
+        """Añade un bloque a la media y los co-momentos acumulados."""
+        A = self._matrix(df)
+        nb = len(A)
+        if nb == 0:
+            return self
+        mean_b = A.mean(axis=0)
+        C = A - mean_b
+        m2_b = C.T @ C
+        n = self.n + nb
+        delta = mean_b - self.mean_
+        self._m2 += m2_b + np.outer(delta, delta) * (self.n * nb / n)
+        self.mean_ += delta * (nb / n)
+        self.n = n
+        return self
+
+    def merge(self, other: "StreamingPCA") -> "StreamingPCA":
+        """Fusiona los acumulados de otro ajuste parcial con las mismas variables."""
+        if self.variables != other.variables:
+            raise ValueError("No se pueden fusionar PCA con variables distintas")
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean_ - self.mean_
+        self._m2 += other._m2 + np.outer(delta, delta) * (self.n * other.n / n)
+        self.mean_ += delta * (other.n / n)
+        self.n = n
+        return self
+
+    def finalize(self) -> "StreamingPCA":
+        """
+        Calcula escala (desviación poblacional, como StandardScaler) y
+        componentes. Las variables constantes se descartan (no se pueden estandarizar).
+        """
+        if self.n < 2:
+            raise ValueError("Se necesitan al menos dos filas completas para el PCA")
+        keep = np.diag(self._m2) > 0
+        if not keep.all():
+            self.variables = [v for v, k in zip(self.variables, keep) if k]
+            self.mean_, self._m2 = self.mean_[keep], self._m2[np.ix_(keep, keep)]
+        var = np.diag(self._m2) / self.n
+        self.scale_ = np.sqrt(var)
+        corr = self._m2 / np.sqrt(np.outer(np.diag(self._m2), np.diag(self._m2)))
+        components, eigvals, ratio = pca_from_corr(corr, self.n_components)
+        self.components_ = components.T                     # k x p, como sklearn
+        self.explained_variance_ = eigvals * self.n / (self.n - 1)
+        self.explained_variance_ratio_ = ratio
+        return self
+
+    @property
+    def loadings_(self) -> np.ndarray:
+        """Cargas p x k (componentes por la raíz de su varianza)."""
+        return self.components_.T * np.sqrt(self.explained_variance_)
+
+    def transform(self, df: pd.DataFrame):
+        """
+        Scores de las filas completas de ``df`` y su índice: (array n x k, Index).
+        """
+        A = df[self.variables].apply(pd.to_numeric, errors="coerce")
+        A = A[A.notna().all(axis=1)]
+        Z = (A.to_numpy(dtype=np.float64) - self.mean_) / self.scale_
+        return Z @ self.components_.T, A.index
+
+    def fit(self, chunks) -> "StreamingPCA":
+        """Ajusta con un iterable de bloques (DataFrames) y finaliza."""
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self.finalize()
+
+    def to_dict(self) -> dict:
+        return {
+            "variables": self.variables,
+            "n_components": self.n_components,
+            "n": self.n,
+            "mean": self.mean_.tolist(),
+            "m2": self._m2.tolist(),
+            # Derivados (informativos: se recalculan al cargar desde n/mean/m2)
+            "scale": None if self.scale_ is None else self.scale_.tolist(),
+            "components": None if self.components_ is None else self.components_.tolist(),
+            "explained_variance_ratio": None if self.explained_variance_ratio_ is None
+            else self.explained_variance_ratio_.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "StreamingPCA":
+        out = cls(d["variables"], d["n_components"])
+        out.n = int(d["n"])
+        out.mean_ = np.asarray(d["mean"], dtype=np.float64)
+        out._m2 = np.asarray(d["m2"], dtype=np.float64)
+        # Solo se finaliza si se guardó ajustado (los acumulados parciales pueden ser singulares)
+        return out.finalize() if d.get("components") is not None else out
+
+    def save(self, path: Path) -> None:
+        Path(path).write_text(json.dumps(self.to_dict()), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "StreamingPCA":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def chunks_of(df: pd.DataFrame, chunksize: int):
+    """Bloques consecutivos de ``chunksize`` filas de un DataFrame en memoria."""
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
@@ -0,0 +1,422 @@
+# utils/quantiles.py
+"""
+Cuantiles por intervalos de tiempo, para todos los grupos en una sola pasada.
+
+Sustituye el patrón ``for c in covers: groupby(["type", pd.cut(time)]).quantile()``
+(un filtrado booleano por cobertura y un groupby por intervalo) por:
+  1. bordes de intervalo calculados como pd.cut (compartidos o por grupo);
+  2. asignación de intervalo aritmética, O(N);
+  3. una única agrupación por clave (grupo, intervalo) sobre arrays NumPy y,
+     dentro de cada grupo, selección lineal de los estadísticos de orden
+     necesarios para interpolar los cuantiles (como pandas).
+"""
+from typing import Optional, Sequence
+import numpy as np
+import pandas as pd
+
+from utils.trace import traced
+
+
+def _round_frac(x: np.ndarray, precision: int) -> np.ndarray:
+    """Redondeo que usa pd.cut para las etiquetas de sus intervalos (vectorizado)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = x.copy()
+    ok = np.isfinite(x) & (x != 0)
+    frac, whole = np.modf(x[ok])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        digits = np.where(whole == 0, -np.floor(np.log10(np.abs(frac))).astype(int) - 1 + precision, precision)
+    out[ok] = [np.around(v, d) for v, d in zip(x[ok], digits)]
+    return out
+
+
+def label_edges(edges: np.ndarray, precision: int = 3) -> np.ndarray:
+    """
+    Bordes tal como quedan en los intervalos de pd.cut(precision=...): cada
+    fila (un juego de bordes) se redondea con la menor precisión, desde
+    ``precision``, que deja todos sus bordes distintos. Las filas NaN se conservan.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    rows = np.atleast_2d(edges)
+    out = rows.copy()
+    for i, row in enumerate(rows):
+        if not np.isfinite(row).all():
+            continue
+        for p in range(precision, 20):
+            shown = _round_frac(row, p)
+            if len(np.unique(shown)) == len(row):
+                out[i] = shown
+                break
+        else:
+            out[i] = _round_frac(row, precision)
+    return out.reshape(edges.shape)
+
+
+def edges_from_range(lo: float, hi: float, n_bins: int) -> np.ndarray:
+    """Bordes de pd.cut(bins=n_bins) para datos con mínimo ``lo`` y máximo ``hi``."""
+    if lo == hi:
+        lo -= 0.001 * abs(lo) if lo != 0 else 0.001
+        hi += 0.001 * abs(hi) if hi != 0 else 0.001
+        return np.linspace(lo, hi, n_bins + 1)
+    edges = np.linspace(lo, hi, n_bins + 1)
+    edges[0] -= (hi - lo) * 0.001
+    return edges
+
+
+def cut_edges(t: np.ndarray, n_bins: int, groups: Optional[np.ndarray] = None, n_groups: int = 1) -> np.ndarray:
+    """
+    Bordes de ``n_bins`` intervalos iguales como ``pd.cut(t, bins=n_bins)``
+    (intervalos (a, b], el primero ampliado un 0,1 % para incluir el mínimo).
+    Con ``groups`` (códigos 0..n_groups-1) se calculan bordes propios por grupo.
+    Devuelve una matriz (n_groups, n_bins + 1); grupos vacíos quedan en NaN.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if groups is None:
+        groups, n_groups = np.zeros(len(t), dtype=np.intp), 1
+    mn = np.full(n_groups, np.inf)
+    mx = np.full(n_groups, -np.inf)
+    np.minimum.at(mn, groups, t)
+    np.maximum.at(mx, groups, t)
+
+    edges = np.full((n_groups, n_bins + 1), np.nan)
+    for g in range(n_groups):
+        if np.isfinite(mn[g]):
+            edges[g] = edges_from_range(mn[g], mx[g], n_bins)
+    return edges
+
+
+def assign_bins(t: np.ndarray, edges: np.ndarray, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Índice de intervalo (a, b] de cada valor, con los bordes de su grupo.
+    Estimación aritmética + corrección contra los bordes reales: mismo resultado
+    que searchsorted, sin recorrer los grupos. Fuera de rango -> -1.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if groups is None:
+        groups = np.zeros(len(t), dtype=np.intp)
+    n_edges = edges.shape[1]
+    n_bins = n_edges - 1
+
+    # Paso y origen sin la ampliación del primer borde (por grupo, luego por fila)
+    step_g = (edges[:, -1] - edges[:, 0]) / n_bins if n_bins == 1 else (edges[:, -1] - edges[:, 1]) / (n_bins - 1)
+    lo_g = edges[:, -1] - step_g * n_bins
+    with np.errstate(invalid="ignore", divide="ignore"):
+        guess = np.ceil((t - lo_g[groups]) / step_g[groups]) - 1
+    idx = np.clip(np.nan_to_num(guess, nan=0), 0, n_bins - 1).astype(np.intp)
+
+    # Corrección contra los bordes reales (en una matriz aplanada): casi nunca hace falta
+    flat = edges.ravel()
+    base = groups * n_edges
+    for _ in range(n_bins):
+        left = flat[base + idx]
+        right = flat[base + idx + 1]
+        down = (t <= left) & (idx > 0)
+        up = (t > right) & (idx < n_bins - 1)
+        if not (down.any() or up.any()):
+            break
+        idx += up.astype(np.intp) - down.astype(np.intp)
+    idx[~((t > left) & (t <= right))] = -1
+    return idx
+
+
+def grouped_quantiles(keys: np.ndarray, values: np.ndarray, qs: Sequence[float] = (0.25, 0.5, 0.75)):
+    """
+    Cuantiles (interpolación lineal, como pandas) de ``values`` por cada clave
+    entera. Las filas se agrupan con una ordenación estable de las claves (radix
+    para claves pequeñas) y dentro de cada grupo solo se seleccionan los
+    estadísticos de orden necesarios (np.partition, lineal), sin ordenar valores.
+    Devuelve (claves, conteos, matriz len(claves) x len(qs)).
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=np.float64)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.empty((0, len(qs)))
+    small = np.min_scalar_type(int(keys.max()))
+    order = np.argsort(keys.astype(small, copy=False), kind="stable")
+    k = keys[order]
+    v = values[order]
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+    counts = np.diff(np.r_[starts, len(k)])
+    uniq = k[starts]
+
+    qs = np.asarray(qs, dtype=np.float64)
+    out = np.empty((len(uniq), len(qs)))
+    for g, (s0, n) in enumerate(zip(starts, counts)):
+        pos = qs * (n - 1)
+        i0 = np.floor(pos).astype(np.intp)
+        i1 = np.minimum(i0 + 1, n - 1)
+        seg = np.partition(v[s0:s0 + n], np.unique(np.r_[i0, i1]))
+        lo, hi = seg[i0], seg[i1]
+        out[g] = lo + (hi - lo) * (pos - i0)
+    return uniq, counts, out
+
+
+def _codes(s: pd.Series):
+    """Códigos enteros y categorías (respetando el orden si ya es categórica)."""
+    cat = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+    return cat.cat.codes.to_numpy().astype(np.intp), cat.cat.categories
+
+
+@traced()
+def binned_quantiles(df: pd.DataFrame, value: str = "growth_rate", time: str = "time",
+                     by: Sequence[str] = ("land_cover", "type"), n_bins: int = 20,
+                     qs: Sequence[float] = (0.25, 0.5, 0.75),
+                     edges_by: Optional[Sequence[str]] = ("land_cover",),
+                     precision: Optional[int] = 3) -> pd.DataFrame:
+    """
+    Cuantiles de ``value`` por grupo (columnas ``by``) e intervalo de ``time``.
+      - edges_by: columnas que definen bordes propios (subconjunto de ``by``);
+        None = mismos bordes para todos los grupos.
+      - precision: redondeo de los bordes para el punto medio "t", igual que los
+        intervalos de pd.cut (ver label_edges; None = bordes exactos).
+    Devuelve una fila por (grupo, intervalo) no vacío, con las columnas ``by``,
+    "bin", "t" (punto medio), "n" y q25/q50/q75 (según ``qs``).
+    """
+    by = list(by)
+    d = df[[*by, time, value]]
+    ok = d[time].notna().to_numpy() & d[value].notna().to_numpy()
+    for c in by:
+        ok &= d[c].notna().to_numpy()
+    if not ok.all():
+        d = d[ok]
+
+    t = d[time].to_numpy(dtype=np.float64)
+    v = d[value].to_numpy(dtype=np.float64)
+    codes, cats = zip(*(_codes(d[c]) for c in by)) if by else ((), ())
+    sizes = [len(c) for c in cats]
+
+    # Grupo de bordes de cada fila
+    if edges_by:
+        pos = [by.index(c) for c in edges_by]
+        e_codes = np.ravel_multi_index([codes[i] for i in pos], [sizes[i] for i in pos]) if len(t) else np.zeros(0, np.intp)
+        n_edge_groups = int(np.prod([sizes[i] for i in pos]))
+    else:
+        pos, e_codes, n_edge_groups = [], np.zeros(len(t), dtype=np.intp), 1
+    edges = cut_edges(t, n_bins, e_codes, n_edge_groups)
+    bins = assign_bins(t, edges, e_codes)
+
+    # Clave única (grupo, intervalo) y cuantiles en una sola ordenación
+    g = np.ravel_multi_index(codes, sizes) if by and len(t) else np.zeros(len(t), dtype=np.intp)
+    inside = bins >= 0
+    keys = g[inside] * n_bins + bins[inside]
+    cols = [f"q{round(q * 100)}" for q in qs]
+    if not inside.any():
+        return pd.DataFrame(columns=[*by, "bin", "t", "n", *cols])
+    uniq, counts, qmat = grouped_quantiles(keys, v[inside], qs)
+
+    group_idx, bin_idx = np.divmod(uniq, n_bins)
+    out = {}
+    for c, cat, idx in zip(by, cats, np.unravel_index(group_idx, sizes) if by else []):
+        out[c] = pd.Categorical.from_codes(idx, cat)
+    if edges_by:
+        e_of_group = np.ravel_multi_index([np.unravel_index(group_idx, sizes)[i] for i in pos],
+                                          [sizes[i] for i in pos])
+    else:
+        e_of_group = np.zeros(len(uniq), dtype=np.intp)
+    shown = label_edges(edges, precision) if precision is not None else edges
+    out["bin"] = bin_idx
+    out["t"] = (shown[e_of_group, bin_idx] + shown[e_of_group, bin_idx + 1]) / 2
+    out["n"] = counts
+    for j, c in enumerate(cols):
+        out[c] = qmat[:, j]
+    return pd.DataFrame(out)
+
+
+def presort_bins(df: pd.DataFrame, value: str = "growth_rate", time: str = "time",
+                 by: Sequence[str] = ("land_cover", "type"),
+                 edges_by: Optional[Sequence[str]] = ("land_cover",)) -> dict:
+    """
+    Parte de binned_quantiles que no depende de ``n_bins``: filas válidas
+    ordenadas por (grupo, tiempo), inicio de cada grupo y mínimo/máximo de
+    tiempo por grupo de bordes. Con esto, cada número de intervalos se resuelve
+    con búsquedas binarias sobre tiempos ya ordenados (ver rebin_quantiles).
+    """
+    by = list(by)
+    edges_by = list(edges_by) if edges_by else []
+    d = df[[*by, time, value]]
+    ok = d[time].notna().to_numpy() & d[value].notna().to_numpy()
+    for c in by:
+        ok &= d[c].notna().to_numpy()
+    if not ok.all():
+        d = d[ok]
+
+    t = d[time].to_numpy(dtype=np.float64)
+    v = d[value].to_numpy(dtype=np.float64)
+    codes, cats = zip(*(_codes(d[c]) for c in by)) if by else ((), ())
+    sizes = [len(c) for c in cats]
+    g = np.ravel_multi_index(codes, sizes) if by and len(t) else np.zeros(len(t), dtype=np.intp)
+    n_groups = int(np.prod(sizes)) if by else 1
+
+    # Grupo de bordes de cada grupo (los bordes dependen solo de las columnas edges_by)
+    pos = [by.index(c) for c in edges_by]
+    unr = np.unravel_index(np.arange(n_groups), sizes) if by else ()
+    if pos:
+        edge_of_group = np.ravel_multi_index([unr[i] for i in pos], [sizes[i] for i in pos])
+        n_edge_groups = int(np.prod([sizes[i] for i in pos]))
+    else:
+        edge_of_group, n_edge_groups = np.zeros(n_groups, dtype=np.intp), 1
+    mn = np.full(n_edge_groups, np.inf)
+    mx = np.full(n_edge_groups, -np.inf)
+    np.minimum.at(mn, edge_of_group[g], t)
+    np.maximum.at(mx, edge_of_group[g], t)
+
+    order = np.lexsort((t, g))
+    g, t, v = g[order], t[order], v[order]
+    starts = np.searchsorted(g, np.arange(n_groups + 1))
+    return {"by": by, "cats": cats, "sizes": sizes, "t": t, "v": v, "starts": starts,
+            "edge_of_group": edge_of_group, "min": mn, "max": mx}
+
+
+def _rebin_segments(pre: dict, n_bins: int) -> tuple:
+    """
+    Bordes por grupo de bordes y tramos [a0, a1) de los tiempos ya ordenados
+    de presort_bins que caen en cada intervalo no vacío. Devuelve (edges,
+    claves grupo·n_bins + intervalo, a0, a1).
+    """
+    edges = np.full((len(pre["min"]), n_bins + 1), np.nan)
+    for e, (lo, hi) in enumerate(zip(pre["min"], pre["max"])):
+        if np.isfinite(lo):
+            edges[e] = edges_from_range(lo, hi, n_bins)
+
+    keys, a0, a1 = [], [], []
+    t, starts = pre["t"], pre["starts"]
+    for grp in range(len(starts) - 1):
+        s0, s1 = starts[grp], starts[grp + 1]
+        if s0 == s1:
+            continue
+        e = edges[pre["edge_of_group"][grp]]
+        # Fin de cada intervalo (a, b]: primera posición con t > b
+        cuts = s0 + np.searchsorted(t[s0:s1], e, side="right")
+        full = np.flatnonzero(cuts[1:] > cuts[:-1])
+        keys.append(grp * n_bins + full)
+        a0.append(cuts[full])
+        a1.append(cuts[full + 1])
+    if not keys:
+        return edges, *(np.zeros(0, dtype=np.intp) for _ in range(3))
+    return edges, np.concatenate(keys), np.concatenate(a0), np.concatenate(a1)
+
+
+def _rebin_frame(pre: dict, edges: np.ndarray, keys: np.ndarray, n_bins: int,
+                 precision: Optional[int]) -> dict:
+    """Columnas ``by``, "bin" y "t" de las filas (grupo, intervalo) de ``keys``."""
+    by, cats, sizes = pre["by"], pre["cats"], pre["sizes"]
+    group_idx, bin_idx = np.divmod(keys, n_bins)
+    out = {}
+    for c, cat, idx in zip(by, cats, np.unravel_index(group_idx, sizes) if by else []):
+        out[c] = pd.Categorical.from_codes(idx, cat)
+    e_of_group = pre["edge_of_group"][group_idx]
+    shown = label_edges(edges, precision) if precision is not None else edges
+    out["bin"] = bin_idx
+    out["t"] = (shown[e_of_group, bin_idx] + shown[e_of_group, bin_idx + 1]) / 2
+    return out
+
+
+def rebin_quantiles(pre: dict, n_bins: int = 20, qs: Sequence[float] = (0.25, 0.5, 0.75),
+                    precision: Optional[int] = 3) -> pd.DataFrame:
+    """
+    Mismo resultado que binned_quantiles (con los mismos by/edges_by) a partir
+    de presort_bins: como los tiempos de cada grupo ya están ordenados, cada
+    intervalo (a, b] es un tramo contiguo que se localiza con searchsorted.
+    """
+    edges, keys, a0, a1 = _rebin_segments(pre, n_bins)
+    cols = [f"q{round(q * 100)}" for q in qs]
+    if not len(keys):
+        return pd.DataFrame(columns=[*pre["by"], "bin", "t", "n", *cols])
+
+    qs = np.asarray(qs, dtype=np.float64)
+    v = pre["v"]
+    qmat = np.empty((len(keys), len(qs)))
+    for r, (s0, s1) in enumerate(zip(a0, a1)):
+        n = s1 - s0
+        pos = qs * (n - 1)
+        i0 = np.floor(pos).astype(np.intp)
+        i1 = np.minimum(i0 + 1, n - 1)
+        seg = np.partition(v[s0:s1], np.unique(np.r_[i0, i1]))
+        lo, hi = seg[i0], seg[i1]
+        qmat[r] = lo + (hi - lo) * (pos - i0)
+
+    out = _rebin_frame(pre, edges, keys, n_bins, precision)
+    out["n"] = a1 - a0
+    for j, c in enumerate(cols):
+        out[c] = qmat[:, j]
+    return pd.DataFrame(out)
+
+
+# Bootstrap de un cuantil por intervalo
+
+# Elementos (réplicas x valores) por lote: acota la memoria de las matrices de índices
+_BOOT_BUDGET = 4_000_000
+
+
+def _boot_quantile_batch(vs: np.ndarray, size: int, seed, slot_bin: np.ndarray, offsets: np.ndarray,
+                         counts: np.ndarray, q: float) -> np.ndarray:
+    """
+    Cuantil ``q`` de ``size`` remuestras de todos los intervalos a la vez.
+    ``vs`` tiene los valores de cada intervalo ordenados y contiguos (desde
+    ``offsets``); cada réplica es una fila de índices, cada uno sorteado dentro
+    del tramo de su intervalo. Al ordenar la fila, los índices de cada intervalo
+    siguen ocupando su tramo y quedan ordenados, y como los valores del tramo
+    están ordenados, el estadístico de orden k de la remuestra es vs[fila[offset + k]].
+    Devuelve una matriz (size, intervalos).
+    """
+    rng = np.random.default_rng(seed)
+    idx = offsets[slot_bin] + rng.integers(0, counts[slot_bin], size=(size, len(vs)))
+    idx.sort(axis=1)
+    pos = q * (counts - 1)
+    i0 = np.floor(pos).astype(np.intp)
+    i1 = np.minimum(i0 + 1, counts - 1)
+    lo, hi = vs[idx[:, offsets + i0]], vs[idx[:, offsets + i1]]
+    return lo + (hi - lo) * (pos - i0)
+
+
+@traced()
+def bootstrap_quantile_ci(pre: dict, n_bins: int = 20, q: float = 0.5, n_boot: int = 2000,
+                          alpha: float = 0.05, seed: Optional[int] = 0, jobs: Optional[int] = None,
+                          batch: Optional[int] = None, cache: bool = False) -> pd.DataFrame:
+    """
+    Intervalos de confianza bootstrap (percentil, 1 - alpha) del cuantil ``q``
+    (por defecto la mediana) de cada intervalo de rebin_quantiles, a partir de
+    presort_bins. Todas las réplicas de todos los grupos e intervalos salen de
+    matrices de índices por lotes de ``batch`` réplicas (por defecto, según el
+    tamaño de los datos), repartidos en ``jobs`` procesos como
+    utils.correlation.corr_significance; con la misma ``seed`` el resultado no
+    depende de ``jobs``. Con ``cache`` se guarda en la caché en disco, con clave
+    derivada de los valores de cada intervalo y de los parámetros.
+    Devuelve las columnas ``by``, "bin", "ci_lo" y "ci_hi" (mismas filas que rebin_quantiles).
+    """
+    from utils.correlation import _run_batches
+
+    edges, keys, a0, a1 = _rebin_segments(pre, n_bins)
+    out = pd.DataFrame(_rebin_frame(pre, edges, keys, n_bins, None)).drop(columns="t")
+    if not len(keys) or not n_boot:
+        return out.assign(ci_lo=np.nan, ci_hi=np.nan)
+
+    # Valores de cada intervalo, ordenados y contiguos
+    v = pre["v"]
+    counts = a1 - a0
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    slot_bin = np.repeat(np.arange(len(keys)), counts)
+    vs = np.concatenate([np.sort(v[s0:s1]) for s0, s1 in zip(a0, a1)])
+    batch = batch or max(1, min(n_boot, _BOOT_BUDGET // len(vs)))
+
+    key = None
+    if cache:
+        import hashlib
+        from utils.cache import load_frame, save_frame
+        h = hashlib.blake2b(vs.tobytes(), digest_size=16)
+        h.update(counts.astype(np.int64).tobytes())
+        h.update(repr((q, n_boot, alpha, seed, batch)).encode())
+        key = f"bootstrap-{h.hexdigest()}"
+        cached = load_frame(key)
+        if cached is not None and len(cached) == len(out):
+            return out.assign(ci_lo=cached["ci_lo"].to_numpy(), ci_hi=cached["ci_hi"].to_numpy())
+
+    stack = np.concatenate(_run_batches(_boot_quantile_batch, (vs, slot_bin, offsets, counts, q),
+                                        n_boot, batch, seed, jobs))
+    lo, hi = np.percentile(stack, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    out = out.assign(ci_lo=lo, ci_hi=hi)
+    if key is not None:
+        try:
+            save_frame(out[["ci_lo", "ci_hi"]], key)
+        except OSError:
+            pass
+    return out
@@ -0,0 +1,46 @@
+# utils/sampling.py
+"""
+Submuestreo para capas de puntos: con millones de filas, dibujar cada
+observación domina el tiempo de render y la memoria, mientras que las
+estadísticas del gráfico se siguen calculando sobre la tabla completa.
+"""
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+
+def stratified_sample(df: pd.DataFrame, by: str, max_points: int, seed: Optional[int] = 0,
+                      min_per_group: int = 50) -> pd.DataFrame:
+    """
+    Como mucho ``max_points`` filas repartidas entre los grupos de ``by``: se
+    reservan ``min_per_group`` filas (o todas, si hay menos) a cada grupo para
+    que los pequeños sigan visibles y el resto del presupuesto se reparte en
+    proporción a las filas que les quedan. Si las reservas no caben, se
+    reducen en proporción. Si la tabla ya cabe, se devuelve tal cual.
+    Conserva el orden original.
+    """
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    sizes = df.groupby(by, observed=True, sort=False).size()
+    reserve = np.minimum(sizes, min_per_group)
+    budget = max_points - reserve.sum()
+    if budget < 0:
+        quota = np.floor(reserve * max_points / reserve.sum())
+    else:
+        left = sizes - reserve
+        quota = reserve + np.floor(left * budget / left.sum())
+    quota = quota.astype(int)
+
+    # Filas agrupadas por categoría en una sola pasada: orden estable (cada
+    # grupo conserva el orden original) y límites de cada grupo por búsqueda binaria
+    codes, cats = pd.factorize(df[by])
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(cats) + 1))
+    keep = []
+    for code, cat in enumerate(cats):
+        if cat not in quota.index:
+            continue
+        rows = order[bounds[code]:bounds[code + 1]]
+        keep.append(rng.choice(rows, size=quota[cat], replace=False))
+    return df.iloc[np.sort(np.concatenate(keep))]
@@ -0,0 +1,220 @@
+# utils/shards.py
+"""
+Ingesta de datos repartidos en fragmentos (uno por estudio / author_year).
+
+Un fragmento es un par de CSV con los mismos nombres que los de data/:
+``environmental-data.csv`` y ``microbial-responses.csv`` en su propia carpeta
+(p.ej. shards/cordero2023/), o con un prefijo común en la misma carpeta
+(p.ej. cordero2023_environmental-data.csv y cordero2023_microbial-responses.csv).
+
+``load_shards`` acepta una carpeta (se busca en subcarpetas) o un patrón glob y:
+  1. lee los fragmentos en paralelo en un pool de procesos (con la misma
+     caché binaria que los archivos de data/);
+  2. comprueba que todos tengan las mismas columnas y tipos que el primero;
+  3. concatena con categorías comunes para land_cover y author_year;
+  4. resuelve los soil_number repetidos entre estudios con la clave compuesta
+     (shard, soil_number_local): si algún número se repite, soil_number pasa a
+     ser un identificador global nuevo; si no, se conserva.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from pathlib import Path
+from typing import Optional
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.load_data import _filter_mask, _read_table, _sniff_csv, _split_request, compact_frame  # noqa: E402
+from utils.trace import traced  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+ENV_NAME = "environmental-data"
+MICRO_NAME = "microbial-responses"
+# Columnas de texto que se unifican como categóricas entre fragmentos
+CATEGORICAS = ["land_cover", "author_year"]
+
+
+def find_shards(source) -> list:
+    """
+    Pares (nombre, env, micro) de ``source`` (carpeta o patrón glob), ordenados
+    por nombre. El nombre es el prefijo del archivo o, sin prefijo, su carpeta.
+    """
+    source = str(source)
+    roots = [Path(p) for p in sorted(glob(source))] if any(ch in source for ch in "*?[") else [Path(source)]
+    env_files = []
+    for root in roots:
+        if root.is_dir():
+            env_files += sorted(root.rglob(f"*{ENV_NAME}*.csv"))
+        elif ENV_NAME in root.name:
+            env_files.append(root)
+    if not env_files:
+        raise FileNotFoundError(f"No se encontraron fragmentos ({ENV_NAME}*.csv) en {source}")
+
+    shards, seen = [], {}
+    for env in env_files:
+        micro = env.with_name(env.name.replace(ENV_NAME, MICRO_NAME))
+        if not micro.exists():
+            raise FileNotFoundError(f"Fragmento sin tabla microbiana: falta {micro}")
+        name = env.name.replace(ENV_NAME, "").replace(".csv", "").strip("_-. ") or env.parent.name
+        if name in seen:
+            raise ValueError(f"Nombre de fragmento repetido: {name!r} ({seen[name]} y {env})")
+        seen[name] = env
+        shards.append((name, env, micro))
+    return sorted(shards, key=lambda s: s[0])
+
+
+def _read_shard(env_path: Path, micro_path: Path, columns: Optional[list], filters: list,
+                use_cache: bool, keys: bool = False) -> tuple:
+    """
+    Lee un fragmento (en un proceso del pool): columnas/filtros como load_env_micro.
+    Con ``keys`` añade los soil_number de env y micro sin filtrar, para numerar
+    los suelos igual que sin filtros.
+    """
+    env_header = _sniff_csv(env_path)["header"]
+    micro_header = _sniff_csv(micro_path)["header"]
+    env_cols, env_filters = _split_request(env_header, columns, filters)
+    micro_cols, micro_filters = _split_request(micro_header, columns, filters)
+    df_env = _read_table(env_path, env_cols, env_filters, use_cache, False)
+    if env_filters:
+        micro_filters = micro_filters + [("soil_number", "in", set(df_env["soil_number"]))]
+    df_micro = _read_table(micro_path, micro_cols, micro_filters, use_cache, False)
+    # El texto viaja como categórica (menos bytes entre procesos); las categorías se unifican después
+    for df in (df_env, df_micro):
+        for col in CATEGORICAS:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+    if not keys:
+        return df_env, df_micro, None
+    soils = pd.concat([_read_table(p, ["soil_number"], [], use_cache, False)["soil_number"]
+                       for p in (env_path, micro_path)]).drop_duplicates()
+    return df_env, df_micro, soils.to_numpy()
+
+
+def check_schemas(names: list, frames: list, what: str) -> None:
+    """Todas las tablas deben tener las columnas y tipos de la primera; si no, ValueError con el detalle."""
+    ref = frames[0]
+    problems = []
+    for name, df in zip(names[1:], frames[1:]):
+        missing = [c for c in ref.columns if c not in df.columns]
+        extra = [c for c in df.columns if c not in ref.columns]
+        types = [f"{c}: {df[c].dtype} != {ref[c].dtype}" for c in ref.columns
+                 if c in df.columns and c not in CATEGORICAS and df[c].dtype != ref[c].dtype]
+        if missing or extra or types:
+            detail = "; ".join(filter(None, [
+                f"faltan {missing}" if missing else "", f"sobran {extra}" if extra else "",
+                f"tipos {types}" if types else ""]))
+            problems.append(f"  - {name}: {detail}")
+    if problems:
+        raise ValueError(f"Esquemas de {what} incompatibles con el de {names[0]}:\n" + "\n".join(problems))
+
+
+def _concat(frames: list, shard_codes: pd.Categorical, sizes: list) -> pd.DataFrame:
+    """Concatena con categorías comunes (unión ordenada) y añade la columna "shard"."""
+    cols = list(frames[0].columns)
+    frames = [df[cols] for df in frames]
+    for col in CATEGORICAS:
+        if col in cols:
+            union = sorted(set().union(*(df[col].cat.categories for df in frames)), key=str)
+            frames = [df.assign(**{col: df[col].cat.set_categories(union)}) for df in frames]
+    out = pd.concat(frames, ignore_index=True)
+    out.insert(0, "shard", pd.Categorical.from_codes(np.repeat(np.arange(len(sizes)), sizes),
+                                                     shard_codes.categories))
+    return out
+
+
+def _remap_soils(env: pd.DataFrame, micro: pd.DataFrame, per_shard: Optional[pd.DataFrame] = None) -> bool:
+    """
+    Añade soil_number_local y, si algún soil_number se repite entre fragmentos,
+    reemplaza soil_number por un identificador global de (shard, soil_number_local).
+    ``per_shard`` son todos los pares (shard, soil_number) de los fragmentos
+    (por defecto, los de env y micro). Devuelve si hubo que renumerar.
+    """
+    for df in (env, micro):
+        df["soil_number_local"] = df["soil_number"]
+    if per_shard is None:
+        per_shard = pd.concat([env[["shard", "soil_number"]], micro[["shard", "soil_number"]]]).drop_duplicates()
+    if per_shard["soil_number"].is_unique:
+        return False
+    # Identificadores 1..N en orden (shard, soil_number_local)
+    keys = pd.MultiIndex.from_frame(per_shard.sort_values(["shard", "soil_number"]))
+    for df in (env, micro):
+        pos = keys.get_indexer(pd.MultiIndex.from_frame(df[["shard", "soil_number"]]))
+        df["soil_number"] = (pos + 1).astype(np.int64)
+    return True
+
+
+@traced()
+def load_shards(source, columns: Optional[list] = None, filters: Optional[list] = None,
+                use_cache: bool = True, jobs: Optional[int] = None, compact: bool = False):
+    """
+    Carga y concatena todos los fragmentos de ``source`` (carpeta o glob).
+    Devuelve (df_env, df_micro) como load_env_micro, más las columnas "shard"
+    (categórica) y "soil_number_local"; soil_number es único entre fragmentos.
+      - columns / filters / use_cache / compact: como en load_env_micro. Los
+        filtros sobre soil_number usan la numeración global y se aplican
+        después de renumerar; el resto se aplica al leer cada fragmento.
+      - jobs: procesos de lectura (por defecto, nº de CPUs; 1 = sin pool).
+    """
+    shards = find_shards(source)
+    names = [s[0] for s in shards]
+    filters = list(filters or [])
+    soil_filters = [f for f in filters if f[0] == "soil_number"]
+    pushed = [f for f in filters if f[0] != "soil_number"]
+    # Con filtros, la numeración global sale de todos los suelos, no de los leídos
+    args = [(env, micro, columns, pushed, use_cache, bool(filters)) for _, env, micro in shards]
+
+    t0 = time.perf_counter()
+    jobs = min(jobs or os.cpu_count() or 1, len(shards))
+    if jobs <= 1:
+        parts = [_read_shard(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parts = list(pool.map(_read_shard, *zip(*args)))
+    t_read = time.perf_counter() - t0
+
+    envs, micros = [p[0] for p in parts], [p[1] for p in parts]
+    check_schemas(names, envs, "env")
+    check_schemas(names, micros, "micro")
+
+    codes = pd.Categorical(names, categories=names)
+    df_env = _concat(envs, codes, [len(d) for d in envs])
+    df_micro = _concat(micros, codes, [len(d) for d in micros])
+    per_shard = None
+    if filters:
+        per_shard = pd.DataFrame({
+            "shard": pd.Categorical.from_codes(np.repeat(np.arange(len(parts)), [len(p[2]) for p in parts]),
+                                               codes.categories),
+            "soil_number": np.concatenate([p[2] for p in parts])})
+    remapped = _remap_soils(df_env, df_micro, per_shard)
+    if soil_filters:
+        df_env = df_env[_filter_mask(df_env, soil_filters)].reset_index(drop=True)
+        df_micro = df_micro[_filter_mask(df_micro, soil_filters)].reset_index(drop=True)
+    logger.info("%d fragmentos leídos con %d procesos en %.2f s (%d suelos, %d mediciones%s)",
+                len(shards), jobs, t_read, len(df_env), len(df_micro),
+                "; soil_number renumerado por colisiones" if remapped else "")
+    if compact:
+        df_env, df_micro = compact_frame(df_env), compact_frame(df_micro)
+    return df_env, df_micro
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lee un conjunto de fragmentos y resume el resultado")
+    parser.add_argument("source", help="carpeta de fragmentos o patrón glob")
+    parser.add_argument("--jobs", type=int, default=None, help="procesos de lectura (por defecto: nº de CPUs)")
+    parser.add_argument("--no-cache", action="store_true", help="leer siempre los CSV")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    env, micro = load_shards(args.source, jobs=args.jobs, use_cache=not args.no_cache)
+    print(env.groupby("shard", observed=True).size().rename("suelos").to_frame()
+          .join(micro.groupby("shard", observed=True).size().rename("mediciones")).to_string())
@@ -0,0 +1,350 @@
+# utils/spatial.py
+"""
+Índice espacial de los sitios (longitude/latitude de environmental-data.csv).
+
+Rejilla regular de ``cell_deg`` grados: cada suelo cae en una celda
+(fila por latitud, columna por longitud) y los suelos se guardan ordenados por
+celda, así que las celdas de una fila de la rejilla son un tramo contiguo y
+cualquier rectángulo se resuelve con dos búsquedas binarias por fila. Las
+distancias son de gran círculo (haversine, en km).
+
+Consultas (todas devuelven soil_number):
+  - ``bbox``: rectángulo lon/lat (admite cruzar el antimeridiano);
+  - ``radius``: suelos a menos de ``km`` de un punto;
+  - ``nearest``: los ``k`` suelos más cercanos a un punto.
+
+El índice se guarda en la caché binaria (utils.cache) con clave derivada de la
+versión del CSV ambiental, como las demás tablas del cargador. Por defecto
+indexa data/environmental-data.csv; para fragmentos por estudio
+(utils.shards) hay que construirlo con ``load_index(source=...)`` y pasarlo
+como ``index`` a las funciones de regiones. Las regiones se escriben como
+texto para poder pasarlas por CLI, URL o barridos:
+
+  bbox:LON_MIN:LAT_MIN:LON_MAX:LAT_MAX   radius:LON:LAT:KM   knn:LON:LAT:K
+
+``region_filters`` las convierte en un filtro ("soil_number", "in", suelos)
+de load_joined/iter_joined. load_joined lo resuelve con el índice por suelo
+de la unión en caché (búsquedas binarias: solo copia las filas de esos
+suelos); iter_joined filtra env y hace un semi-join de cada bloque de micro.
+``restrict`` recorta una tabla unida ya cargada.
+
+  python utils/spatial.py query radius:12.5:55.7:300
+  python utils/spatial.py cells --cell 5 --columns respiration_rate [--region ...]
+"""
+from pathlib import Path
+from typing import Optional
+import hashlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.cache import LRUMemo, cache_key, load_frame, save_frame  # noqa: E402
+from utils.trace import traced  # noqa: E402
+
+# Radio medio de la Tierra (km)
+EARTH_KM = 6371.0088
+ENV_PATH = PROJECT_ROOT / "data/environmental-data.csv"
+
+
+def haversine_km(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """Distancia de gran círculo (km) entre puntos en grados; admite arrays."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _wrap_lon(lon: float) -> float:
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+class SpatialIndex:
+    """Rejilla lon/lat de ``cell_deg`` grados sobre los suelos (ver el docstring del módulo)."""
+
+    def __init__(self, soils, lon, lat, cell_deg: float = 1.0):
+        if cell_deg <= 0:
+            raise ValueError(f"cell_deg debe ser positivo: {cell_deg}")
+        self.cell_deg = float(cell_deg)
+        self.n_rows = int(np.ceil(180.0 / self.cell_deg))
+        self.n_cols = int(np.ceil(360.0 / self.cell_deg))
+        lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        cells = self.cell_of(lon, lat)
+        order = np.argsort(cells, kind="stable")
+        self.soils = np.asarray(soils)[order]
+        self.lon, self.lat, self.cells = lon[order], lat[order], cells[order]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, cell_deg: float = 1.0) -> "SpatialIndex":
+        """Desde una tabla con soil_number, longitude y latitude (se ignoran coordenadas nulas)."""
+        df = df.dropna(subset=["longitude", "latitude"])
+        return cls(df["soil_number"].to_numpy(), df["longitude"].to_numpy(), df["latitude"].to_numpy(), cell_deg)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"soil_number": self.soils, "longitude": self.lon,
+                             "latitude": self.lat, "cell": self.cells})
+
+    def __len__(self) -> int:
+        return len(self.soils)
+
+    # Celdas
+
+    def _row(self, lat) -> np.ndarray:
+        return np.clip(np.floor((np.asarray(lat) + 90.0) / self.cell_deg), 0, self.n_rows - 1).astype(np.int64)
+
+    def _col(self, lon) -> np.ndarray:
+        return np.clip(np.floor((np.asarray(lon) + 180.0) / self.cell_deg), 0, self.n_cols - 1).astype(np.int64)
+
+    def cell_of(self, lon, lat) -> np.ndarray:
+        """Identificador de celda (fila · n_cols + columna) de cada punto."""
+        lon = np.where(np.asarray(lon) == 180.0, -180.0, _wrap_lon(np.asarray(lon, dtype=np.float64)))
+        return self._row(lat) * self.n_cols + self._col(lon)
+
+    def cell_center(self, cells) -> tuple:
+        """(lon, lat) del centro de cada celda."""
+        rows, cols = np.divmod(np.asarray(cells, dtype=np.int64), self.n_cols)
+        lat = np.minimum(-90.0 + (rows + 0.5) * self.cell_deg, 90.0)
+        lon = np.minimum(-180.0 + (cols + 0.5) * self.cell_deg, 180.0)
+        return lon, lat
+
+    def cells_of_soils(self, soils) -> np.ndarray:
+        """Celda de cada soil_number (-1 si no está en el índice)."""
+        pos = pd.Index(self.soils).get_indexer(np.asarray(soils))
+        return np.where(pos >= 0, self.cells[np.maximum(pos, 0)], -1)
+
+    # Candidatos: posiciones de los suelos en las celdas que tocan un rectángulo
+
+    def _candidates(self, lon_min: float, lat_min: float, lon_max: float, lat_max: float) -> np.ndarray:
+        rows = np.arange(self._row(lat_min), self._row(lat_max) + 1, dtype=np.int64)
+        if lon_max - lon_min >= 360.0:
+            spans = [(0, self.n_cols - 1)]
+        else:
+            lo, hi = _wrap_lon(lon_min), _wrap_lon(lon_max)
+            hi = 180.0 if hi == -180.0 and lon_max > lon_min else hi
+            c0, c1 = int(self._col(lo)), int(self._col(hi))
+            spans = [(c0, c1)] if lo <= hi else [(c0, self.n_cols - 1), (0, c1)]
+        parts = []
+        for c0, c1 in spans:
+            start = np.searchsorted(self.cells, rows * self.n_cols + c0, side="left")
+            stop = np.searchsorted(self.cells, rows * self.n_cols + c1, side="right")
+            parts += [np.arange(a, b) for a, b in zip(start, stop) if b > a]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # Consultas
+
+    def bbox(self, lon_min: float, lat_min: float, lon_max: float, lat_max: float) -> np.ndarray:
+        """
+        Suelos dentro del rectángulo (bordes incluidos). Si ``lon_min > lon_max``
+        el rectángulo cruza el antimeridiano (p.ej. 170 a -170).
+        """
+        if lat_min > lat_max:
+            raise ValueError(f"lat_min ({lat_min}) mayor que lat_max ({lat_max})")
+        wraps = lon_min > lon_max
+        pos = self._candidates(lon_min, lat_min, lon_max + 360.0 if wraps else lon_max, lat_max)
+        lon, lat = self.lon[pos], self.lat[pos]
+        in_lon = (lon >= lon_min) | (lon <= lon_max) if wraps else (lon >= lon_min) & (lon <= lon_max)
+        return self.soils[pos[in_lon & (lat >= lat_min) & (lat <= lat_max)]]
+
+    def _within(self, lon: float, lat: float, km: float) -> tuple:
+        """(posiciones, distancias) de los suelos a menos de ``km`` de (lon, lat)."""
+        ang = km / EARTH_KM
+        dlat = np.degrees(ang)
+        lat_min, lat_max = lat - dlat, lat + dlat
+        ratio = np.sin(ang) / np.cos(np.radians(lat)) if abs(lat) < 90.0 else np.inf
+        if lat_min <= -90.0 or lat_max >= 90.0 or ang >= np.pi / 2 or ratio >= 1.0:
+            # El círculo toca un polo: todas las longitudes de la franja
+            pos = self._candidates(-180.0, max(lat_min, -90.0), 180.0, min(lat_max, 90.0))
+        else:
+            dlon = np.degrees(np.arcsin(ratio))
+            pos = self._candidates(lon - dlon, lat_min, lon + dlon, lat_max)
+        d = haversine_km(lon, lat, self.lon[pos], self.lat[pos])
+        keep = d <= km
+        return pos[keep], d[keep]
+
+    def radius(self, lon: float, lat: float, km: float, return_distance: bool = False):
+        """Suelos a menos de ``km`` km de (lon, lat), del más cercano al más lejano."""
+        pos, d = self._within(lon, lat, km)
+        order = np.lexsort((self.soils[pos], d))
+        return (self.soils[pos[order]], d[order]) if return_distance else self.soils[pos[order]]
+
+    def nearest(self, lon: float, lat: float, k: int = 1, return_distance: bool = False):
+        """
+        Los ``k`` suelos más cercanos a (lon, lat): radios crecientes (desde el
+        tamaño de una celda) hasta reunir ``k`` candidatos; dentro de ese radio
+        están seguro los ``k`` más cercanos.
+        """
+        k = min(int(k), len(self))
+        km = max(self.cell_deg * np.pi / 180.0 * EARTH_KM, 1.0)
+        while True:
+            pos, d = self._within(lon, lat, km)
+            if len(pos) >= k or km >= np.pi * EARTH_KM:
+                break
+            km *= 2
+        order = np.lexsort((self.soils[pos], d))[:k]
+        return (self.soils[pos[order]], d[order]) if return_distance else self.soils[pos[order]]
+
+
+# Persistencia en la caché del cargador
+
+_INDEX_MEMO = LRUMemo(maxsize=4)
+
+
+@traced()
+def load_index(path: Optional[Path] = None, cell_deg: float = 1.0, use_cache: bool = True,
+               source=None) -> SpatialIndex:
+    """
+    Índice de los suelos de ``path`` (por defecto data/environmental-data.csv)
+    o, con ``source``, de los fragmentos de esa carpeta o glob (utils.shards),
+    con el soil_number único entre fragmentos que usa load_joined(source=...).
+    Se memoriza en el proceso y, con ``use_cache``, se guarda en la caché
+    binaria; la clave cambia si cambian los CSV o ``cell_deg``.
+    """
+    from utils.load_data import load_env, load_env_micro
+
+    if source is not None:
+        from utils.shards import find_shards
+        # La renumeración de suelos entre fragmentos depende también de micro
+        paths = [p for _, env, micro in find_shards(source) for p in (env, micro)]
+    else:
+        paths = [Path(path) if path is not None else ENV_PATH]
+    for p in paths:
+        if not p.exists():
+            raise FileNotFoundError(f"No se encontró el archivo: {p}")
+    tag = hashlib.blake2b(repr(float(cell_deg)).encode(), digest_size=4).hexdigest()
+    if source is None:
+        key = f"spatial-{cache_key(paths[0])}-{tag}"
+    else:
+        keys = "|".join(cache_key(p) for p in paths)
+        key = f"spatial-{hashlib.blake2b(keys.encode(), digest_size=8).hexdigest()}-{tag}"
+    if key in _INDEX_MEMO:
+        return _INDEX_MEMO[key]
+
+    df = load_frame(key) if use_cache else None
+    if df is not None:
+        index = SpatialIndex(df["soil_number"].to_numpy(), df["longitude"].to_numpy(),
+                             df["latitude"].to_numpy(), cell_deg)
+    else:
+        if source is not None:
+            env, _ = load_env_micro(use_cache=use_cache, columns=["longitude", "latitude"], source=source)
+        else:
+            env = load_env(paths[0], columns=["longitude", "latitude"], use_cache=use_cache)
+        index = SpatialIndex.from_frame(env, cell_deg)
+        if use_cache:
+            try:
+                save_frame(index.to_frame(), key, sources=paths)
+            except OSError:
+                pass
+    _INDEX_MEMO[key] = index
+    return index
+
+
+# Regiones como texto: "bbox:...", "radius:...", "knn:..."
+
+_REGIONS = {"bbox": 4, "radius": 3, "knn": 3}
+# Ayuda del argumento --region de los scripts de graphs/
+REGION_HELP = "solo los suelos de una región: bbox:LON0:LAT0:LON1:LAT1, radius:LON:LAT:KM o knn:LON:LAT:K"
+
+
+def parse_region(region: str) -> tuple:
+    """"radius:12.5:55.7:300" -> ("radius", [12.5, 55.7, 300.0]); ValueError si no es válida."""
+    kind, _, rest = str(region).strip().partition(":")
+    kind = kind.lower()
+    if kind not in _REGIONS:
+        raise ValueError(f"Región no válida: {region!r} (tipos: {', '.join(_REGIONS)})")
+    try:
+        values = [float(v) for v in rest.split(":")] if rest else []
+    except ValueError:
+        raise ValueError(f"Región no válida: {region!r} (valores no numéricos)") from None
+    if len(values) != _REGIONS[kind]:
+        raise ValueError(f"Región no válida: {region!r} ({kind} lleva {_REGIONS[kind]} valores separados por ':')")
+    return kind, values
+
+
+def region_soils(region: str, index: Optional[SpatialIndex] = None) -> np.ndarray:
+    """soil_number de los suelos de la región; ValueError si no queda ninguno."""
+    kind, v = parse_region(region)
+    index = index if index is not None else load_index()
+    if kind == "bbox":
+        soils = index.bbox(*v)
+    elif kind == "radius":
+        soils = index.radius(*v)
+    else:
+        soils = index.nearest(v[0], v[1], k=int(v[2]))
+    if len(soils) == 0:
+        raise ValueError(f"La región {region!r} no contiene ningún suelo")
+    return soils
+
+
+def region_filters(region: Optional[str], index: Optional[SpatialIndex] = None) -> list:
+    """
+    Filtro de load_joined/iter_joined para la región (lista vacía sin región).
+    Sin ``index`` se usa el de data/environmental-data.csv; con fragmentos,
+    pasar ``load_index(source=...)``.
+    """
+    if not region:
+        return []
+    return [("soil_number", "in", set(region_soils(region, index).tolist()))]
+
+
+def restrict(df: pd.DataFrame, region: Optional[str], index: Optional[SpatialIndex] = None) -> pd.DataFrame:
+    """Filas de una tabla con soil_number (p.ej. la unida) que caen en la región; sin región, la misma tabla."""
+    if not region:
+        return df
+    return df[df["soil_number"].isin(region_soils(region, index))].reset_index(drop=True)
+
+
+@traced()
+def aggregate_cells(df: pd.DataFrame, columns: list, cell_deg: float = 1.0, stats=("median",),
+                    index: Optional[SpatialIndex] = None) -> pd.DataFrame:
+    """
+    Agrega las columnas de una tabla con soil_number (p.ej. la unida) por celda
+    de la rejilla: una fila por celda con su centro, el número de suelos y de
+    filas y ``<columna>_<estadístico>`` para cada estadístico de ``stats``.
+    """
+    index = index if index is not None else load_index(cell_deg=cell_deg)
+    cells = index.cells_of_soils(df["soil_number"].to_numpy())
+    keep = cells >= 0
+    d = df.loc[keep, ["soil_number", *columns]].assign(cell=cells[keep])
+    g = d.groupby("cell", sort=True)
+    out = g[columns].agg(list(stats))
+    out.columns = [f"{col}_{stat}" for col, stat in out.columns]
+    out.insert(0, "n", g.size())
+    out.insert(0, "n_soils", g["soil_number"].nunique())
+    lon, lat = index.cell_center(out.index.to_numpy())
+    out.insert(0, "lat_center", lat)
+    out.insert(0, "lon_center", lon)
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Consultas al índice espacial de los sitios")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    q = sub.add_parser("query", help="suelos de una región (bbox:..., radius:..., knn:...)")
+    q.add_argument("region")
+    c = sub.add_parser("cells", help="respuestas microbianas agregadas por celda")
+    c.add_argument("--columns", nargs="+", default=["respiration_rate"], help="columnas a agregar")
+    c.add_argument("--stats", nargs="+", default=["median"], help="estadísticos de pandas (median, mean, ...)")
+    c.add_argument("--region", default=None, help=REGION_HELP)
+    for p in (q, c):
+        p.add_argument("--cell", type=float, default=1.0, help="tamaño de celda en grados")
+    args = parser.parse_args()
+
+    index = load_index(cell_deg=args.cell)
+    if args.cmd == "query":
+        soils = region_soils(args.region, index)
+        pos = pd.Index(index.soils).get_indexer(soils)
+        kind, v = parse_region(args.region)
+        out = pd.DataFrame({"soil_number": soils, "longitude": index.lon[pos], "latitude": index.lat[pos]})
+        if kind != "bbox":
+            out["km"] = haversine_km(v[0], v[1], out["longitude"], out["latitude"])
+        print(out.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    else:
+        from utils.load_data import load_joined
+        df = load_joined(columns=args.columns, filters=region_filters(args.region, index))
+        print(aggregate_cells(df, args.columns, stats=args.stats, index=index)
+              .to_string(float_format=lambda x: f"{x:.4g}"))
@@ -0,0 +1,154 @@
+# utils/synthetic.py
+"""
+Pares sintéticos env/micro a escala de producción (de 1e4 a 1e8 filas).
+
+  python utils/synthetic.py --rows 1e6 [--out DIR] [--seed 0] [--chunk-rows 1e6]
+
+Cada suelo sintético copia un suelo real elegido al azar (data/*.csv) y lo
+perturba: la tabla ambiental conserva el esquema, la mezcla de land_cover y
+author_year y el rango de cada variable; la microbiana conserva la forma de
+cada serie temporal (número de mediciones por suelo, tiempos, curvas de
+crecimiento y respiración y sus faltantes). Los archivos se escriben por
+bloques, con el mismo formato que los originales (notación E, "NA" en los
+faltantes), así que la memoria no depende del tamaño pedido.
+"""
+import argparse
+from pathlib import Path
+from typing import Optional
+import sys
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.load_data import _read_csv_smart, _sniff_csv  # noqa: E402
+
+ENV_PATH = PROJECT_ROOT / "data/environmental-data.csv"
+MICRO_PATH = PROJECT_ROOT / "data/microbial-responses.csv"
+SYNTH_DIR = PROJECT_ROOT / "data/synthetic"
+
+# Ruido relativo (log-normal) de cada capa; las coordenadas se desplazan en grados
+ENV_SIGMA = 0.05
+COORD_SIGMA = 0.25
+TIME_SIGMA = 0.02
+RATE_SIGMA = 0.10
+# Columnas ambientales que se copian sin perturbar (diseño experimental)
+ENV_FIJAS = ["author_year", "land_cover", "incubation_temperature"]
+
+
+def rows_tag(n_rows: int) -> str:
+    """Nombre corto de un tamaño: 10000 -> "1e4", 2500000 -> "2.5e6"."""
+    mant, exp = f"{n_rows:.1e}".split("e")
+    return f"{mant.rstrip('0').rstrip('.')}e{int(exp)}"
+
+
+def _templates(env_path: Path, micro_path: Path):
+    """Suelos reales usables como plantilla: env, micro ordenada por suelo, inicio y largo de cada serie."""
+    env = _read_csv_smart(env_path)
+    micro = _read_csv_smart(micro_path)
+    env = env[env["soil_number"].isin(micro["soil_number"])].reset_index(drop=True)
+    micro = micro[micro["soil_number"].isin(env["soil_number"])]
+    micro = micro.sort_values("soil_number", kind="stable").reset_index(drop=True)
+    pos = pd.Index(env["soil_number"]).get_indexer(micro["soil_number"])
+    lengths = np.bincount(pos, minlength=len(env))
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return env, micro, starts, lengths
+
+
+def _env_block(env: pd.DataFrame, idx: np.ndarray, first_soil: int, rng) -> pd.DataFrame:
+    out = env.take(idx).reset_index(drop=True)
+    out["soil_number"] = np.arange(first_soil, first_soil + len(idx), dtype=np.int64)
+    for col in out.columns:
+        if col == "soil_number" or col in ENV_FIJAS or not pd.api.types.is_float_dtype(out[col]):
+            continue
+        if col in ("longitude", "latitude"):
+            lim = 180.0 if col == "longitude" else 90.0
+            out[col] = np.clip(out[col] + rng.normal(0, COORD_SIGMA, len(out)), -lim, lim)
+        else:
+            out[col] = out[col] * np.exp(rng.normal(0, ENV_SIGMA, len(out)))
+    return out
+
+
+def _micro_block(micro: pd.DataFrame, starts: np.ndarray, lengths: np.ndarray, idx: np.ndarray,
+                 first_soil: int, rng) -> pd.DataFrame:
+    n = lengths[idx]
+    total = int(n.sum())
+    # Índices de las filas de cada serie plantilla, concatenadas en orden
+    offs = np.repeat(starts[idx] - np.concatenate([[0], np.cumsum(n)[:-1]]), n)
+    rows = offs + np.arange(total)
+    out = micro.take(rows).reset_index(drop=True)
+    out["soil_number"] = np.repeat(np.arange(first_soil, first_soil + len(idx), dtype=np.int64), n)
+    # Un factor de tiempo por suelo (la serie sigue ordenada) y ruido por medición en las tasas
+    out["time"] = out["time"] * np.repeat(np.exp(rng.normal(0, TIME_SIGMA, len(idx))), n)
+    for col in ("bacterial_growth_rate", "fungal_growth_rate", "respiration_rate"):
+        out[col] = out[col] * np.exp(rng.normal(0, RATE_SIGMA, total))
+    return out
+
+
+def _write(df: pd.DataFrame, fh, encoding: str, header: bool, float_format: str) -> None:
+    fh.write(df.to_csv(index=False, header=header, na_rep="NA", float_format=float_format,
+                       lineterminator="\n").encode(encoding))
+
+
+def generate(n_rows: int, out_dir: Optional[Path] = None, seed: int = 0, chunk_rows: int = 1_000_000,
+             env_path: Path = ENV_PATH, micro_path: Path = MICRO_PATH) -> dict:
+    """
+    Escribe en ``out_dir`` (por defecto data/synthetic/<tamaño>/seed<semilla>/)
+    un par environmental-data.csv / microbial-responses.csv con ``n_rows``
+    filas microbianas, generadas por bloques de ~``chunk_rows`` filas. El
+    resultado depende solo de la semilla y de los archivos plantilla.
+    Devuelve {"env": ruta, "micro": ruta, "rows": filas, "soils": suelos}.
+    """
+    n_rows = int(n_rows)
+    out_dir = Path(out_dir) if out_dir is not None else SYNTH_DIR / rows_tag(n_rows) / f"seed{seed}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    env, micro, starts, lengths = _templates(Path(env_path), Path(micro_path))
+    env_enc = _sniff_csv(Path(env_path))["encoding"].replace("utf-8-sig", "utf-8")
+    rng = np.random.default_rng(seed)
+
+    soils_per_block = max(1, int(chunk_rows / lengths.mean()))
+    env_out, micro_out = out_dir / "environmental-data.csv", out_dir / "microbial-responses.csv"
+    written, next_soil = 0, 1
+    with open(env_out, "wb") as fe, open(micro_out, "wb") as fm:
+        while written < n_rows:
+            # Suelos plantilla al azar: conserva en promedio la mezcla de coberturas y autores
+            idx = rng.integers(0, len(env), soils_per_block)
+            # Recortamos el último bloque a los suelos necesarios para llegar a n_rows
+            need = np.searchsorted(np.cumsum(lengths[idx]), n_rows - written) + 1
+            idx = idx[:need]
+            m = _micro_block(micro, starts, lengths, idx, next_soil, rng)
+            m = m.iloc[: n_rows - written]
+            e = _env_block(env, idx, next_soil, rng)
+            _write(e, fe, env_enc, header=next_soil == 1, float_format="%.3G")
+            _write(m, fm, "utf-8", header=next_soil == 1, float_format="%.2E")
+            written += len(m)
+            next_soil += len(idx)
+    return {"env": env_out, "micro": micro_out, "rows": written, "soils": next_soil - 1}
+
+
+def ensure(n_rows: int, seed: int = 0, chunk_rows: int = 1_000_000) -> dict:
+    """Como generate, pero reutiliza el par de la carpeta por defecto si ya está completo."""
+    out_dir = SYNTH_DIR / rows_tag(int(n_rows)) / f"seed{seed}"
+    env_out, micro_out = out_dir / "environmental-data.csv", out_dir / "microbial-responses.csv"
+    done = out_dir / ".complete"
+    if done.exists() and env_out.exists() and micro_out.exists():
+        return {"env": env_out, "micro": micro_out, "rows": int(n_rows), "soils": None}
+    done.unlink(missing_ok=True)
+    info = generate(n_rows, out_dir, seed=seed, chunk_rows=chunk_rows)
+    done.write_text(f"{info['rows']} {info['soils']}\n")
+    return info
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un par env/micro sintético del tamaño pedido")
+    parser.add_argument("--rows", type=float, required=True, help="filas microbianas (p.ej. 1e6)")
+    parser.add_argument("--out", type=Path, default=None,
+                        help="carpeta de salida (por defecto data/synthetic/<tamaño>/seed<semilla>)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=float, default=1e6, help="filas por bloque de escritura")
+    args = parser.parse_args()
+    info = generate(int(args.rows), args.out, seed=args.seed, chunk_rows=int(args.chunk_rows))
+    print(f"{info['rows']} filas, {info['soils']} suelos -> {info['micro'].parent}")
@@ -0,0 +1,226 @@
+# utils/trace.py
+"""
+Trazas por etapa: tiempo de pared, tiempo de CPU y memoria residente.
+
+Se activa con variables de entorno (las heredan los procesos del pool de
+render_all) o llamando a ``enable``:
+
+  ENTREGA_TRACE=trace.jsonl python graphs/render_all.py --force
+  ENTREGA_TRACE=trace.jsonl ENTREGA_TRACE_PROFILE=perfiles/ python graphs/grafico_violin.py
+  python utils/trace.py summary trace.jsonl
+  python utils/trace.py chrome trace.jsonl trace.json    # abrir en chrome://tracing o Perfetto
+
+Cada etapa terminada se añade como una línea JSON (nombre, inicio, duración,
+CPU, memoria, proceso, hilo y profundidad de anidamiento), así que varios
+procesos pueden escribir en el mismo archivo. Memoria:
+  - rss_mb / rss_delta_mb: RSS actual al terminar la etapa y su cambio durante
+    ella (/proc/self/statm; solo Linux);
+  - rss_process_peak_mb: pico de RSS de todo el proceso hasta ese momento
+    (ru_maxrss), no de la etapa; rss_grow_mb es cuánto lo subió la etapa.
+
+``to_chrome`` convierte el archivo al formato de trazas de Chrome. Con
+ENTREGA_TRACE_PROFILE cada etapa externa (no anidada) se ejecuta además bajo
+cProfile y se guarda un .prof (pstats, snakeviz). Las etapas son funciones
+normales, así que py-spy las muestra con su nombre sin hacer nada más.
+
+Desactivado (lo normal), ``stage`` devuelve un contexto vacío compartido y
+``traced`` añade solo una comprobación por llamada.
+"""
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Optional
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: sin pico de RSS
+    resource = None
+
+# Configuración activa: None si las trazas están desactivadas
+_ACTIVE: Optional[dict] = None
+_NULL = nullcontext()
+_LOCAL = threading.local()
+_LOCK = threading.Lock()
+
+
+def _rss_peak_mb() -> Optional[float]:
+    """Pico de RSS del proceso desde que arrancó (MB)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _rss_now_mb() -> Optional[float]:
+    """RSS actual del proceso (MB), o None fuera de Linux."""
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def enable(path, profile_dir=None) -> None:
+    """Empieza a registrar etapas en ``path`` (JSON lines); con ``profile_dir``, también perfiles cProfile."""
+    global _ACTIVE
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if profile_dir is not None:
+        Path(profile_dir).mkdir(parents=True, exist_ok=True)
+    _ACTIVE = {"path": path, "profile_dir": Path(profile_dir) if profile_dir else None, "n": 0}
+
+
+def disable() -> None:
+    global _ACTIVE
+    _ACTIVE = None
+
+
+def enabled() -> bool:
+    return _ACTIVE is not None
+
+
+def _emit(rec: dict) -> None:
+    line = json.dumps(rec, default=str) + "\n"
+    with _LOCK, open(_ACTIVE["path"], "a", encoding="utf-8") as fh:
+        fh.write(line)
+
+
+@contextmanager
+def _traced_stage(name: str, attrs: dict):
+    cfg = _ACTIVE
+    stack = getattr(_LOCAL, "stack", None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    profiler = None
+    if cfg["profile_dir"] is not None and not stack:
+        import cProfile
+        profiler = cProfile.Profile()
+    stack.append(name)
+    peak0, rss0 = _rss_peak_mb(), _rss_now_mb()
+    ts, c0, t0 = time.time(), time.process_time(), time.perf_counter()
+    if profiler is not None:
+        try:
+            profiler.enable()
+        except ValueError:  # otro perfilador activo (p.ej. en otro hilo)
+            profiler = None
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+        stack.pop()
+        peak, rss = _rss_peak_mb(), _rss_now_mb()
+        rec = {
+            "name": name, "ts": ts, "wall_s": wall, "cpu_s": cpu,
+            "rss_mb": rss, "rss_delta_mb": None if rss is None or rss0 is None else rss - rss0,
+            "rss_process_peak_mb": peak, "rss_grow_mb": None if peak is None else peak - peak0,
+            "pid": os.getpid(), "tid": threading.get_ident(), "depth": len(stack),
+            "parent": stack[-1] if stack else None,
+        }
+        if attrs:
+            rec["args"] = attrs
+        if profiler is not None:
+            with _LOCK:
+                cfg["n"] += 1
+                n = cfg["n"]
+            prof = cfg["profile_dir"] / f"{name}.{os.getpid()}.{n}.prof"
+            profiler.dump_stats(prof)
+            rec["profile"] = str(prof)
+        _emit(rec)
+
+
+def stage(name: str, **attrs):
+    """
+    Contexto que mide una etapa: ``with stage("violin.savefig", dpi=300): ...``.
+    Los argumentos con nombre se guardan con la etapa.
+    """
+    if _ACTIVE is None:
+        return _NULL
+    return _traced_stage(name, attrs)
+
+
+def traced(name: Optional[str] = None):
+    """Decorador: cada llamada a la función es una etapa (por defecto ``módulo.función``)."""
+    def deco(fn):
+        # Los scripts ejecutados directamente se llaman "__main__": usamos el nombre del archivo
+        module = Path(fn.__code__.co_filename).stem if fn.__module__ == "__main__" else fn.__module__
+        label = name or f"{module.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return fn(*args, **kwargs)
+            with _traced_stage(label, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def read_trace(path) -> list:
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def to_chrome(path, out) -> int:
+    """
+    Convierte una traza JSON lines al formato de eventos de Chrome (eventos
+    completos "X", en microsegundos) y la escribe en ``out``. Devuelve el
+    número de eventos.
+    """
+    events = []
+    for rec in read_trace(path):
+        args = {k: rec[k] for k in ("cpu_s", "rss_mb", "rss_delta_mb", "rss_process_peak_mb", "rss_grow_mb",
+                                    "profile") if rec.get(k) is not None}
+        args.update(rec.get("args", {}))
+        events.append({
+            "name": rec["name"], "ph": "X", "ts": rec["ts"] * 1e6, "dur": rec["wall_s"] * 1e6,
+            "pid": rec["pid"], "tid": rec["tid"], "cat": rec["name"].split(".", 1)[0], "args": args,
+        })
+    Path(out).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+    return len(events)
+
+
+def summary(path):
+    """
+    Totales por etapa (llamadas, pared, CPU, mayor cambio de RSS en una
+    llamada y pico de RSS del proceso), de mayor a menor tiempo.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(read_trace(path))
+    if df.empty:
+        return df
+    for col in ("rss_delta_mb", "rss_process_peak_mb"):
+        if col not in df:
+            df[col] = None
+    out = df.groupby("name").agg(calls=("wall_s", "size"), wall_s=("wall_s", "sum"), cpu_s=("cpu_s", "sum"),
+                                 rss_delta_mb=("rss_delta_mb", "max"),
+                                 rss_process_peak_mb=("rss_process_peak_mb", "max"))
+    return out.sort_values("wall_s", ascending=False)
+
+
+# Activación por entorno (también en los procesos hijos, que heredan las variables)
+if os.environ.get("ENTREGA_TRACE"):
+    enable(os.environ["ENTREGA_TRACE"], os.environ.get("ENTREGA_TRACE_PROFILE") or None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resumen o conversión de una traza de etapas")
+    parser.add_argument("cmd", choices=["summary", "chrome"])
+    parser.add_argument("trace", type=Path, help="traza JSON lines (ENTREGA_TRACE)")
+    parser.add_argument("out", type=Path, nargs="?", default=None, help="salida de chrome (por defecto <traza>.json)")
+    args = parser.parse_args()
+    if args.cmd == "summary":
+        print(summary(args.trace).to_string(float_format=lambda v: f"{v:.3f}"))
+    else:
+        out = args.out or args.trace.with_suffix(".json")
+        print(f"{to_chrome(args.trace, out)} eventos -> {out}")